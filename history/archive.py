@@ -0,0 +1,189 @@
+# history/archive.py - Move cold History rows into HistoryArchive
+from datetime import datetime, timezone as dt_timezone
+
+from django.db import connections, router, transaction
+from django.db.models import Count, Sum
+from django.db.models.functions import Coalesce, TruncMonth
+
+from .models import History, HistoryArchive
+from .serializers import MATERIAL_DISPLAY
+from .summary import record_archived, record_compacted
+
+ARCHIVE_FIELDS = ('id', 'user_id', 'points', 'action', 'material_type', 'description', 'created_at')
+
+# (alias, partition table) already known to exist in this process
+_partitions = set()
+
+
+def month_start(moment):
+    moment = moment.astimezone(dt_timezone.utc)
+    return datetime(moment.year, moment.month, 1, tzinfo=dt_timezone.utc)
+
+
+def _next_month(month):
+    if month.month == 12:
+        return month.replace(year=month.year + 1, month=1)
+    return month.replace(month=month.month + 1)
+
+
+def ensure_partitions(using, oldest, newest):
+    """On Postgres, create the monthly archive partitions covering [oldest, newest]."""
+    connection = connections[using]
+    if connection.vendor != 'postgresql':
+        return
+    quote = connection.ops.quote_name
+    parent = HistoryArchive._meta.db_table
+    month = month_start(oldest)
+    with connection.cursor() as cursor:
+        while month <= newest:
+            following = _next_month(month)
+            name = f"{parent}_p{month:%Y_%m}"
+            if (using, name) not in _partitions:
+                cursor.execute(
+                    f"CREATE TABLE IF NOT EXISTS {quote(name)} PARTITION OF {quote(parent)} "
+                    f"FOR VALUES FROM (%s) TO (%s)",
+                    [month, following],
+                )
+                _partitions.add((using, name))
+            month = following
+
+
+def archive_batch(cutoff, batch_size):
+    """
+    Move up to ``batch_size`` of the oldest History rows created before
+    ``cutoff`` to the archive, in one transaction. Returns how many moved.
+    """
+    db = router.db_for_write(History)
+    with transaction.atomic(using=db):
+        rows = list(
+            History.objects.using(db)
+            .filter(created_at__lt=cutoff)
+            .order_by('created_at', 'id')
+            .select_for_update(skip_locked=True)
+            .values(*ARCHIVE_FIELDS)[:batch_size]
+        )
+        if not rows:
+            return 0
+        ensure_partitions(db, rows[0]['created_at'], rows[-1]['created_at'])
+        HistoryArchive.objects.using(db).bulk_create([HistoryArchive(**row) for row in rows])
+        History.objects.using(db).filter(id__in=[row['id'] for row in rows]).delete()
+        record_archived(rows, db)
+    return len(rows)
+
+
+def archive_history(cutoff, batch_size, on_batch=None):
+    """Archive every History row created before ``cutoff``, batch by batch."""
+    total = 0
+    while True:
+        moved = archive_batch(cutoff, batch_size)
+        if not moved:
+            return total
+        total += moved
+        if on_batch is not None:
+            on_batch(moved, total)
+
+
+class CompactionMismatch(Exception):
+    pass
+
+
+def _scan_groups(queryset):
+    """(user_id, month, material_type) groups of archived scans, with their totals."""
+    return (
+        queryset.filter(action='scan')
+        .annotate(month=TruncMonth('created_at', tzinfo=dt_timezone.utc))
+        .values('user_id', 'month', 'material_type')
+        .annotate(rows=Count('id'), points=Sum('points'), scans=Sum(Coalesce('scan_count', 1)))
+        .order_by('user_id', 'month', 'material_type')
+    )
+
+
+def scan_totals(before, using=None):
+    """{(user_id, month, material_type): (points, scans)} for archived scans before ``before``."""
+    queryset = HistoryArchive.objects.using(using).filter(created_at__lt=before)
+    return {
+        (row['user_id'], row['month'], row['material_type']): (row['points'], row['scans'])
+        for row in _scan_groups(queryset)
+    }
+
+
+def compactable_groups(before, after_user=None, limit=None, using=None):
+    """Archived user/month/material scan groups before ``before`` that still have several rows."""
+    queryset = HistoryArchive.objects.using(using).filter(created_at__lt=before)
+    if after_user is not None:
+        # Groups of earlier users are done; the current one may be half done
+        queryset = queryset.filter(user_id__gte=after_user)
+    groups = _scan_groups(queryset).filter(rows__gt=1)
+    return groups[:limit] if limit else groups
+
+
+def _rollup_description(scans, material_type, month):
+    material = MATERIAL_DISPLAY.get(material_type, material_type) if material_type else 'other'
+    return f"Monthly summary: {scans} {material} scans in {month:%B %Y}"
+
+
+def compact_chunk(before, chunk_size, after_user=None, verify=False):
+    """
+    Merge up to ``chunk_size`` groups of archived scans into one rollup row
+    each, in one short transaction. The rollup keeps the group's newest id
+    and created_at, so it sorts where its scans did and stays in the same
+    monthly partition. With ``verify`` every group is re-totalled before
+    commit and a mismatch rolls the chunk back.
+
+    Returns (groups merged, rows removed, last user id).
+    """
+    db = router.db_for_write(HistoryArchive)
+    with transaction.atomic(using=db):
+        groups = list(compactable_groups(before, after_user, chunk_size, db))
+        removed = {}
+        for group in groups:
+            rows = HistoryArchive.objects.using(db).filter(
+                user_id=group['user_id'],
+                action='scan',
+                material_type=group['material_type'],
+                created_at__gte=group['month'],
+                created_at__lt=_next_month(group['month']),
+            )
+            # Lock and re-read: the grouped scan above took no locks
+            locked = list(rows.select_for_update().values_list('id', 'created_at', 'points', 'scan_count'))
+            latest_at, latest_id = max((created_at, pk) for pk, created_at, _, _ in locked)
+            points = sum(row[2] for row in locked)
+            scans = sum(row[3] or 1 for row in locked)
+            rows.delete()
+            HistoryArchive.objects.using(db).create(
+                id=latest_id,
+                user_id=group['user_id'],
+                points=points,
+                action='scan',
+                material_type=group['material_type'],
+                description=_rollup_description(scans, group['material_type'], group['month']),
+                created_at=latest_at,
+                scan_count=scans,
+            )
+            if verify:
+                after = rows.aggregate(
+                    rows=Count('id'), points=Sum('points'), scans=Sum(Coalesce('scan_count', 1))
+                )
+                if after != {'rows': 1, 'points': points, 'scans': scans}:
+                    raise CompactionMismatch(
+                        f"user {group['user_id']} {group['month']:%Y-%m} {group['material_type']}: "
+                        f"{points} points / {scans} scans before, {after} after"
+                    )
+            removed[group['user_id']] = removed.get(group['user_id'], 0) + len(locked) - 1
+        record_compacted(removed, db)
+    last_user = groups[-1]['user_id'] if groups else None
+    return len(groups), sum(removed.values()), last_user
+
+
+def compact_history(before, chunk_size, verify=False, on_chunk=None):
+    """Compact every archived scan group before ``before``, chunk by chunk."""
+    merged = removed = 0
+    last_user = None
+    while True:
+        groups, rows, last_user = compact_chunk(before, chunk_size, last_user, verify)
+        if not groups:
+            return merged, removed
+        merged += groups
+        removed += rows
+        if on_chunk is not None:
+            on_chunk(merged, removed)
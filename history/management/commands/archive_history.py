@@ -0,0 +1,42 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from history.archive import archive_history
+from history.models import History
+
+
+class Command(BaseCommand):
+    help = (
+        "Move History rows older than the hot horizon into HistoryArchive "
+        "(monthly partitions on Postgres), keeping the History table small"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=settings.HISTORY_ARCHIVE['HOT_DAYS'],
+                            help="Archive rows created more than this many days ago")
+        parser.add_argument('--batch-size', type=int, default=settings.HISTORY_ARCHIVE['BATCH_SIZE'],
+                            help="Rows moved per transaction")
+        parser.add_argument('--dry-run', action='store_true',
+                            help="Only count the rows that would be archived")
+
+    def handle(self, *args, **options):
+        if options['days'] < 1:
+            raise CommandError("--days must be at least 1")
+        cutoff = timezone.now() - timedelta(days=options['days'])
+
+        if options['dry_run']:
+            count = History.objects.filter(created_at__lt=cutoff).count()
+            self.stdout.write(f"{count} History rows created before {cutoff:%Y-%m-%d %H:%M} would be archived")
+            return
+
+        def progress(moved, total):
+            if options['verbosity'] > 1:
+                self.stdout.write(f"  moved {moved} rows ({total} so far)")
+
+        total = archive_history(cutoff, options['batch_size'], on_batch=progress)
+        self.stdout.write(self.style.SUCCESS(
+            f"Archived {total} History rows created before {cutoff:%Y-%m-%d %H:%M}"
+        ))
@@ -0,0 +1,63 @@
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from history.models import History
+from history.serializers import HISTORY_VALUE_FIELDS, HistorySerializer, serialize_history_rows
+
+
+def _sample_rows(count):
+    actions = ['scan', 'transfer_in', 'transfer_out']
+    materials = ['plastic', 'metal', 'non-recycle']
+    now = timezone.now()
+    rows = []
+    for i in range(count):
+        action = actions[i % 3]
+        rows.append(History(
+            id=i + 1,
+            user_id=1,
+            points=5 + i % 50,
+            action=action,
+            material_type=materials[i % 3] if action == 'scan' else None,
+            description=f"Sample entry {i}",
+            created_at=now - timedelta(minutes=i),
+        ))
+    return rows
+
+
+class Command(BaseCommand):
+    help = "Compare rows/sec of HistorySerializer against the values() fast path"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=[20, 100, 1000])
+        parser.add_argument('--repeat', type=int, default=50,
+                            help="Pages serialized per measurement")
+
+    def measure(self, func, repeat):
+        start = time.perf_counter()
+        for _ in range(repeat):
+            func()
+        return time.perf_counter() - start
+
+    def handle(self, *args, **options):
+        repeat = options['repeat']
+        self.stdout.write(f"{'page size':>10} {'drf rows/s':>14} {'fast rows/s':>14} {'speedup':>8}")
+
+        for size in options['sizes']:
+            instances = _sample_rows(size)
+            values = [
+                {field: getattr(obj, field) for field in HISTORY_VALUE_FIELDS}
+                for obj in instances
+            ]
+            # Both paths must produce identical output before timing them
+            assert serialize_history_rows(values) == HistorySerializer(instances, many=True).data
+
+            drf = self.measure(lambda: HistorySerializer(instances, many=True).data, repeat)
+            fast = self.measure(lambda: serialize_history_rows(values), repeat)
+
+            rows = size * repeat
+            self.stdout.write(
+                f"{size:>10} {rows / drf:>14,.0f} {rows / fast:>14,.0f} {drf / fast:>7.1f}x"
+            )
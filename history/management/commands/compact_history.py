@@ -0,0 +1,96 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Count, Q
+from django.utils import timezone
+
+from history.archive import CompactionMismatch, compact_history, compactable_groups, month_start, scan_totals
+from history.models import HistoryArchive, HistorySummary
+
+
+class Command(BaseCommand):
+    help = (
+        "Collapse archived scans older than the horizon into one rollup row per "
+        "user, month and material, keeping exact point and scan totals"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=settings.HISTORY_ARCHIVE['HOT_DAYS'],
+                            help="Compact whole months that ended more than this many days ago")
+        parser.add_argument('--chunk-size', type=int, default=200,
+                            help="User/month/material groups merged per transaction")
+        parser.add_argument('--dry-run', action='store_true',
+                            help="Only count the groups and rows that would be merged")
+        parser.add_argument('--verify', action='store_true',
+                            help="Check every group as it is merged, then prove the per-user, per-month, "
+                                 "per-material totals and the summaries' archive counts are unchanged")
+
+    def check_summaries(self):
+        """Users whose summary's archive counts don't match the archive's rows."""
+        counts = (
+            HistoryArchive.objects.order_by().values('user_id')
+            .annotate(rows=Count('id'), scans=Count('id', filter=Q(action='scan')))
+        )
+        summaries = {
+            user_id: (rows, scans)
+            for user_id, rows, scans in HistorySummary.objects.values_list(
+                'user_id', 'archived_transactions', 'archived_scans'
+            )
+        }
+        return [
+            row['user_id'] for row in counts
+            if row['user_id'] in summaries and summaries[row['user_id']] != (row['rows'], row['scans'])
+        ]
+
+    def handle(self, *args, **options):
+        if options['days'] < 1:
+            raise CommandError("--days must be at least 1")
+        before = month_start(timezone.now() - timedelta(days=options['days']))
+
+        if options['dry_run']:
+            groups = list(compactable_groups(before))
+            rows = sum(group['rows'] for group in groups)
+            self.stdout.write(
+                f"{len(groups)} scan groups ({rows} rows) before {before:%Y-%m} would become "
+                f"{len(groups)} monthly rollups"
+            )
+            return
+
+        if options['verify']:
+            totals_before = scan_totals(before)
+
+        def progress(merged, removed):
+            if options['verbosity'] > 1:
+                self.stdout.write(f"  merged {merged} groups, removed {removed} rows so far")
+
+        try:
+            merged, removed = compact_history(
+                before, options['chunk_size'], verify=options['verify'], on_chunk=progress
+            )
+        except CompactionMismatch as e:
+            raise CommandError(f"Totals changed while compacting, chunk rolled back: {e}")
+        self.stdout.write(self.style.SUCCESS(
+            f"Merged {merged} scan groups before {before:%Y-%m} into monthly rollups, removing {removed} rows"
+        ))
+
+        if options['verify']:
+            totals_after = scan_totals(before)
+            changed = [key for key in totals_before.keys() | totals_after.keys()
+                       if totals_before.get(key) != totals_after.get(key)]
+            if changed:
+                raise CommandError(
+                    f"Totals differ for {len(changed)} user/month/material groups, e.g. "
+                    + ', '.join(f"{key}: {totals_before.get(key)} -> {totals_after.get(key)}"
+                                for key in sorted(changed, key=str)[:5])
+                )
+            stale = self.check_summaries()
+            if stale:
+                raise CommandError(
+                    f"Summary archive counts are off for {len(stale)} users, e.g. {stale[:5]}; "
+                    f"run rebuild_history_summary"
+                )
+            self.stdout.write(self.style.SUCCESS(
+                f"Verified: point and scan totals of {len(totals_after)} user/month/material groups "
+                f"are unchanged"
+            ))
@@ -0,0 +1,33 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from history.summary import rebuild_all_summaries, rebuild_summary
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = "Rebuild the per-user history summaries from the History table"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--user',
+            help="Only rebuild the summary of the user with this email",
+        )
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        email = options.get('user')
+        if email:
+            try:
+                user = User.objects.get(email=email)
+            except User.DoesNotExist:
+                raise CommandError(f"User {email} does not exist")
+            summary = rebuild_summary(user)
+            self.stdout.write(self.style.SUCCESS(
+                f"Rebuilt summary for {email}: {summary.total_transactions} transactions"
+            ))
+            return
+
+        count = rebuild_all_summaries(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {count} history summaries"))
@@ -0,0 +1,33 @@
+# Generated by Django 4.2.8 on 2026-10-17 17:50
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('user', '0003_alter_user_image'),
+        ('history', '0002_alter_history_options_history_material_type_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='HistorySummary',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='history_summary', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('total_transactions', models.PositiveIntegerField(default=0)),
+                ('total_received', models.IntegerField(default=0)),
+                ('total_sent', models.IntegerField(default=0)),
+                ('total_scanned', models.IntegerField(default=0)),
+                ('scanned_plastic', models.IntegerField(default=0)),
+                ('scanned_metal', models.IntegerField(default=0)),
+                ('scanned_non_recycle', models.IntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name_plural': 'History summaries',
+            },
+        ),
+    ]
@@ -0,0 +1,99 @@
+# Generated by Django 4.2.8 on 2026-10-17 18:58
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def create_archive_table(apps, schema_editor):
+    """
+    On Postgres the archive is partitioned by month of created_at; the
+    archive_history command adds partitions as it needs them. A partitioned
+    table's primary key has to include the partition column.
+    """
+    model = apps.get_model('history', 'HistoryArchive')
+    connection = schema_editor.connection
+    if connection.vendor != 'postgresql':
+        schema_editor.create_model(model)
+        return
+
+    quote = schema_editor.quote_name
+    columns = [
+        f"{quote(field.column)} {field.db_type(connection)} {'NULL' if field.null else 'NOT NULL'}"
+        for field in model._meta.local_fields
+    ]
+    user_field = model._meta.get_field('user')
+    user_model = user_field.related_model
+    schema_editor.execute(
+        f"CREATE TABLE {quote(model._meta.db_table)} ("
+        f"{', '.join(columns)}, "
+        f"PRIMARY KEY ({quote('id')}, {quote('created_at')}), "
+        f"FOREIGN KEY ({quote(user_field.column)}) "
+        f"REFERENCES {quote(user_model._meta.db_table)} ({quote(user_model._meta.pk.column)}) "
+        f"DEFERRABLE INITIALLY DEFERRED"
+        f") PARTITION BY RANGE ({quote('created_at')})"
+    )
+    for index in model._meta.indexes:
+        schema_editor.add_index(model, index)
+
+
+def drop_archive_table(apps, schema_editor):
+    schema_editor.delete_model(apps.get_model('history', 'HistoryArchive'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('history', '0004_history_feed_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='history',
+            index=models.Index(fields=['created_at', 'id'], name='history_created_idx'),
+        ),
+        migrations.AddField(
+            model_name='historysummary',
+            name='archived_scans',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='historysummary',
+            name='archived_transactions',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='historysummary',
+            name='archived_transfers_in',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='historysummary',
+            name='archived_transfers_out',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='historysummary',
+            name='archived_until',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.SeparateDatabaseAndState(state_operations=[migrations.CreateModel(
+            name='HistoryArchive',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('points', models.IntegerField()),
+                ('action', models.CharField(choices=[('scan', 'QR Scan'), ('transfer_in', 'Points Received'), ('transfer_out', 'Points Sent')], max_length=20)),
+                ('material_type', models.CharField(blank=True, choices=[('plastic', 'Plastic'), ('metal', 'Metal'), ('non-recycle', 'Non-Recyclable')], max_length=20, null=True)),
+                ('description', models.TextField()),
+                ('created_at', models.DateTimeField()),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_history', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name_plural': 'Archived history',
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['user', '-created_at', '-id'], name='history_arch_user_created_idx'), models.Index(fields=['user', 'action', '-created_at', '-id'], name='history_arch_user_act_idx')],
+            },
+        )]),
+        migrations.RunPython(create_archive_table, drop_archive_table),
+    ]
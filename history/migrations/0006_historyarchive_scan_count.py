@@ -0,0 +1,18 @@
+# Generated by Django 4.2.8 on 2026-10-17 19:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('history', '0005_history_archive'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='historyarchive',
+            name='scan_count',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+    ]
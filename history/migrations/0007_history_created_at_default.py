@@ -0,0 +1,19 @@
+# Generated by Django 4.2.8 on 2026-10-17 19:23
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('history', '0006_historyarchive_scan_count'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='history',
+            name='created_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+    ]
@@ -1,6 +1,7 @@
 # models.py - Only add History model
 from django.db import models
 from django.contrib.auth import get_user_model
+from django.utils import timezone
 
 User = get_user_model()
 
@@ -22,13 +23,97 @@ class History(models.Model):
     action = models.CharField(max_length=20, choices=ACTION_CHOICES)
     material_type = models.CharField(max_length=20, choices=MATERIAL_CHOICES, blank=True, null=True)
     description = models.TextField()
-    created_at = models.DateTimeField(auto_now_add=True)
+    # Scans keep the time the app reports (see QRScanSerializer.validate_date)
+    created_at = models.DateTimeField(default=timezone.now)
     
     class Meta:
         ordering = ['-created_at']
         verbose_name_plural = 'History'
+        indexes = [
+            # Serve the keyset-paginated feed, optionally filtered by action
+            models.Index(fields=['user', '-created_at', '-id'], name='history_user_created_idx'),
+            models.Index(
+                fields=['user', 'action', '-created_at', '-id'], name='history_user_act_created_idx'
+            ),
+            # Let archive_history find the oldest rows without a full scan
+            models.Index(fields=['created_at', 'id'], name='history_created_idx'),
+        ]
     
     def __str__(self):
+        # Reading self.user.email would cost a query per row in admin lists
+        # and log lines; use it only when the user was already fetched
+        if History.user.is_cached(self):
+            owner = self.user.email
+        else:
+            owner = f"user {self.user_id}"
         if self.material_type:
-            return f"{self.user.email} - {self.action} - {self.material_type} - {self.points} points"
-        return f"{self.user.email} - {self.action} - {self.points} points"
\ No newline at end of file
+            return f"{owner} - {self.action} - {self.material_type} - {self.points} points"
+        return f"{owner} - {self.action} - {self.points} points"
+
+
+class HistoryArchive(models.Model):
+    """
+    History rows older than HISTORY_ARCHIVE['HOT_DAYS'], moved here by the
+    archive_history command so the History table stays small. Rows keep
+    their History id, so feed cursors stay valid across the move. On
+    Postgres the table is partitioned by month of created_at.
+    """
+
+    id = models.BigIntegerField(primary_key=True)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='archived_history')
+    points = models.IntegerField()
+    action = models.CharField(max_length=20, choices=History.ACTION_CHOICES)
+    material_type = models.CharField(max_length=20, choices=History.MATERIAL_CHOICES, blank=True, null=True)
+    description = models.TextField()
+    created_at = models.DateTimeField()
+    # Set on monthly rollups made by compact_history: how many scans of
+    # this user, month and material the row stands for. None on plain rows.
+    scan_count = models.PositiveIntegerField(blank=True, null=True)
+
+    class Meta:
+        ordering = ['-created_at']
+        verbose_name_plural = 'Archived history'
+        indexes = [
+            models.Index(fields=['user', '-created_at', '-id'], name='history_arch_user_created_idx'),
+            models.Index(
+                fields=['user', 'action', '-created_at', '-id'], name='history_arch_user_act_idx'
+            ),
+        ]
+
+    def __str__(self):
+        if self.scan_count is not None:
+            return (
+                f"user {self.user_id} - {self.scan_count} {self.material_type or 'other'} scans "
+                f"in {self.created_at:%b %Y} - {self.points} points (archived)"
+            )
+        return f"user {self.user_id} - {self.action} - {self.points} points (archived)"
+
+
+class HistorySummary(models.Model):
+    """Running per-user totals so the history page doesn't re-aggregate History."""
+
+    user = models.OneToOneField(
+        User, on_delete=models.CASCADE, primary_key=True, related_name='history_summary'
+    )
+    total_transactions = models.PositiveIntegerField(default=0)
+    total_received = models.IntegerField(default=0)
+    total_sent = models.IntegerField(default=0)
+    total_scanned = models.IntegerField(default=0)
+    scanned_plastic = models.IntegerField(default=0)
+    scanned_metal = models.IntegerField(default=0)
+    scanned_non_recycle = models.IntegerField(default=0)
+    # Newest created_at among the user's archived rows (None: nothing archived)
+    # and how many rows of each kind were moved, so the feed can skip the
+    # archive unless a page or ?days= filter reaches back past archived_until
+    archived_until = models.DateTimeField(blank=True, null=True)
+    archived_transactions = models.PositiveIntegerField(default=0)
+    archived_transfers_in = models.PositiveIntegerField(default=0)
+    archived_transfers_out = models.PositiveIntegerField(default=0)
+    archived_scans = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name_plural = 'History summaries'
+
+    def __str__(self):
+        return f"Summary for user {self.user_id} - {self.total_transactions} transactions"
@@ -0,0 +1,175 @@
+# history/pagination.py
+import base64
+
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+def encode_cursor(row):
+    """Opaque cursor pointing just past a History instance or values() row."""
+    if isinstance(row, dict):
+        created_at, pk = row['created_at'], row['id']
+    else:
+        created_at, pk = row.created_at, row.pk
+    raw = f"{created_at.isoformat()}|{pk}"
+    return base64.urlsafe_b64encode(raw.encode('ascii')).decode('ascii')
+
+
+def decode_cursor(encoded):
+    """(created_at, id) from a cursor, or None when it is malformed."""
+    try:
+        decoded = base64.urlsafe_b64decode(encoded.encode('ascii')).decode('ascii')
+        created_at, pk = decoded.rsplit('|', 1)
+        created_at = parse_datetime(created_at)
+        pk = int(pk)
+    except (TypeError, ValueError, UnicodeError):
+        return None
+    if created_at is None:
+        return None
+    return created_at, pk
+
+
+def seek(queryset, position):
+    """Order newest first and skip everything up to and including ``position``."""
+    queryset = queryset.order_by('-created_at', '-id')
+    if position is None:
+        return queryset
+    created_at, pk = position
+    # The redundant created_at__lte bound lets the database range-scan the index
+    return queryset.filter(created_at__lte=created_at).filter(
+        Q(created_at__lt=created_at) | Q(id__lt=pk)
+    )
+
+
+def _newest_first(rows):
+    return sorted(rows, key=lambda row: (row['created_at'], row['id']), reverse=True)
+
+
+class TieredHistory:
+    """
+    One user's feed over History and HistoryArchive as a single sequence of
+    values() rows, newest first, for either paginator.
+    
+    Every archived row is at or before ``boundary`` (the summary's
+    archived_until), so a slice whose hot rows are all newer than that is
+    answered from History alone and the archive is only read once a page
+    reaches back past it. ``archive`` is None when the ?days= filter stops
+    short of the boundary or nothing was archived; ``archive_count`` is the
+    archive's share of count() when the summary already knows it.
+    """
+    ordered = True
+    
+    def __init__(self, hot, archive=None, boundary=None, archive_count=None):
+        self.hot = hot.order_by('-created_at', '-id')
+        self.archive = archive.order_by('-created_at', '-id') if archive is not None else None
+        self.boundary = boundary
+        self.archive_count = archive_count
+    
+    def seek(self, position):
+        """The rows after ``position`` in both tiers, see seek()."""
+        archive = seek(self.archive, position) if self.archive is not None else None
+        return TieredHistory(seek(self.hot, position), archive, self.boundary)
+    
+    def count(self):
+        count = self.hot.count()
+        if self.archive is not None:
+            count += self.archive.count() if self.archive_count is None else self.archive_count
+        return count
+    
+    def __getitem__(self, index):
+        start, stop = index.start or 0, index.stop
+        if stop <= start:
+            # Paginator asks for [0:0] when nothing matches
+            return []
+        hot = list(self.hot[start:stop])
+        if self.archive is None or (
+            len(hot) == stop - start and hot[-1]['created_at'] > self.boundary
+        ):
+            return hot
+        if start == 0:
+            return _newest_first(hot + list(self.archive[:stop]))[:stop]
+        
+        # Hot rows newer than the boundary come first; after them the older
+        # hot rows (late inserts, usually none) interleave with the archive
+        newer = self.hot.filter(created_at__gt=self.boundary).count()
+        head = hot[:max(newer - start, 0)]
+        rest_start, rest_stop = max(start - newer, 0), stop - newer
+        older_hot = self.hot.filter(created_at__lte=self.boundary)
+        if older_hot.exists():
+            rest = _newest_first(list(older_hot[:rest_stop]) + list(self.archive[:rest_stop]))
+            return head + rest[rest_start:rest_stop]
+        return head + list(self.archive[rest_start:rest_stop])
+
+
+class HistoryPagination(PageNumberPagination):
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+
+
+class HistoryCursorPagination(BasePagination):
+    """
+    Keyset pagination over (created_at, id), newest first.
+    
+    Each page seeks past the last row of the previous one instead of using
+    OFFSET, and no COUNT(*) is run, so deep pages cost the same as the first.
+    """
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Invalid cursor'
+    
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        
+        position = self.decode_cursor(request)
+        if isinstance(queryset, TieredHistory):
+            queryset = queryset.seek(position)
+        else:
+            queryset = seek(queryset, position)
+        return self._set_page(list(queryset[:self.page_size + 1]))
+    
+    def _set_page(self, rows):
+        # One extra row was fetched to learn whether another page follows
+        self.has_next = len(rows) > self.page_size
+        self.page = rows[:self.page_size]
+        return self.page
+    
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        if size <= 0:
+            return self.page_size
+        return min(size, self.max_page_size)
+    
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        position = decode_cursor(encoded)
+        if position is None:
+            raise NotFound(self.invalid_cursor_message)
+        return position
+    
+    def encode_cursor(self, obj):
+        return encode_cursor(obj)
+    
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(self.page[-1]))
+    
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'results': data,
+        })
@@ -1,10 +1,36 @@
+from datetime import timedelta
+
 from rest_framework import serializers
+from django.conf import settings
 from django.contrib.auth import get_user_model
-from django.core.exceptions import ObjectDoesNotExist
+from django.utils import timezone
+from trash2cash.instrumentation import TimedSerializerMixin, timed
+from user.identity import resolve_user
 from .models import History
 
 User = get_user_model()
 
+# Lookup tables shared by HistorySerializer and the values() fast path
+ACTION_ICONS = {
+    'transfer_out': 'send',
+    'transfer_in': 'receipt',
+    'scan': 'qr_code_scanner',
+}
+ACTION_COLORS = {
+    'transfer_out': 'red',
+    'transfer_in': 'green',
+    'scan': 'blue',
+}
+MATERIAL_DISPLAY = dict(History.MATERIAL_CHOICES)
+# Monthly scan rollups (HistoryArchive.scan_count set) render as their own entry type
+ROLLUP_ICON = 'calendar_month'
+
+HISTORY_VALUE_FIELDS = ('id', 'points', 'action', 'description', 'material_type', 'created_at')
+# HistoryArchive rows also carry the rollup count
+ARCHIVE_VALUE_FIELDS = HISTORY_VALUE_FIELDS + ('scan_count',)
+
+_created_at_field = serializers.DateTimeField()
+
 class TransactionSerializer(serializers.Serializer):
     receiver_email_or_phone = serializers.CharField()
     points = serializers.IntegerField(min_value=5)
@@ -13,34 +39,23 @@ class TransactionSerializer(serializers.Serializer):
         sender = self.context['request'].user
         receiver_query = value.strip()
         
-        try:
-            receiver = User.objects.get(email=receiver_query)
-        except ObjectDoesNotExist:
-            try:
-                receiver = User.objects.get(phone_number=receiver_query)
-            except ObjectDoesNotExist:
-                raise serializers.ValidationError("User not found. Please check the email or phone number.")
+        receiver = resolve_user(receiver_query)
+        if receiver is None:
+            raise serializers.ValidationError("User not found. Please check the email or phone number.")
         
         if sender == receiver:
             raise serializers.ValidationError("You cannot send points to yourself")
         
+        # Keep the resolved user so validate() doesn't look it up again
+        self._receiver = receiver
         return receiver_query
     
     def validate(self, data):
         sender = self.context['request'].user
-        receiver_query = data['receiver_email_or_phone']
-        points_to_send = data['points']
-        
-        try:
-            receiver = User.objects.get(email=receiver_query)
-        except ObjectDoesNotExist:
-            receiver = User.objects.get(phone_number=receiver_query)
-        
-        if sender.total_points < points_to_send:
-            raise serializers.ValidationError(
-                f"Insufficient points. You have {sender.total_points} points."
-            )
+        receiver = self._receiver
         
+        # The balance is checked by transfer_points' conditional debit, not
+        # here against a possibly stale copy of the user
         data['sender'] = sender
         data['receiver'] = receiver
         return data
@@ -58,51 +73,114 @@ class QRScanSerializer(serializers.Serializer):
                 f"Invalid material type. Must be one of: {', '.join(valid_materials)}"
             )
         return value.lower()
+    
+    def validate_date(self, value):
+        """
+        When the scan happened, as the app reports it. Dates further in the
+        future than QR_SCAN_DATES['MAX_SKEW_SECONDS'] or older than
+        QR_SCAN_DATES['MAX_AGE_DAYS'] can't be trusted and become now.
+        """
+        now = timezone.now()
+        window = settings.QR_SCAN_DATES
+        if value > now + timedelta(seconds=window['MAX_SKEW_SECONDS']):
+            return now
+        if value < now - timedelta(days=window['MAX_AGE_DAYS']):
+            return now
+        return min(value, now)
 
 
-class HistorySerializer(serializers.ModelSerializer):
+class HistorySerializer(TimedSerializerMixin, serializers.ModelSerializer):
     formatted_date = serializers.SerializerMethodField()
     formatted_time = serializers.SerializerMethodField()
     icon = serializers.SerializerMethodField()
     color = serializers.SerializerMethodField()
     material_display = serializers.SerializerMethodField()
+    entry_type = serializers.SerializerMethodField()
+    scan_count = serializers.SerializerMethodField()
     
     class Meta:
         model = History
         fields = [
             'id', 'points', 'action', 'description', 'material_type', 'material_display',
-            'created_at', 'formatted_date', 'formatted_time', 'icon', 'color'
+            'created_at', 'formatted_date', 'formatted_time', 'icon', 'color',
+            'entry_type', 'scan_count',
         ]
         read_only_fields = ['id', 'created_at']
     
     def get_formatted_date(self, obj):
+        if self.get_scan_count(obj) is not None:
+            return obj.created_at.strftime('%b %Y')
         return obj.created_at.strftime('%b %d, %Y')
     
     def get_formatted_time(self, obj):
+        if self.get_scan_count(obj) is not None:
+            return ''
         return obj.created_at.strftime('%I:%M %p')
     
     def get_icon(self, obj):
-        icons = {
-            'transfer_out': 'send',
-            'transfer_in': 'receipt',
-            'scan': 'qr_code_scanner',
-        }
-        return icons.get(obj.action, 'history')
+        if self.get_scan_count(obj) is not None:
+            return ROLLUP_ICON
+        return ACTION_ICONS.get(obj.action, 'history')
     
     def get_color(self, obj):
-        colors = {
-            'transfer_out': 'red',
-            'transfer_in': 'green',
-            'scan': 'blue',
-        }
-        return colors.get(obj.action, 'gray')
+        return ACTION_COLORS.get(obj.action, 'gray')
     
     def get_material_display(self, obj):
         if obj.material_type:
-            material_map = {
-                'plastic': 'Plastic',
-                'metal': 'Metal',
-                'non-recycle': 'Non-Recyclable',
-            }
-            return material_map.get(obj.material_type, obj.material_type)
-        return None
\ No newline at end of file
+            return MATERIAL_DISPLAY.get(obj.material_type, obj.material_type)
+        return None
+    
+    def get_entry_type(self, obj):
+        return 'transaction' if self.get_scan_count(obj) is None else 'monthly_summary'
+    
+    def get_scan_count(self, obj):
+        # Also serializes HistoryArchive rows; only those can be rollups
+        return getattr(obj, 'scan_count', None)
+
+
+@timed('serialize')
+def serialize_history_rows(rows):
+    """
+    Fast path for HistorySerializer(many=True).data.
+    
+    Takes dicts from ``History.objects.values(*HISTORY_VALUE_FIELDS)`` (or
+    HistoryArchive with ARCHIVE_VALUE_FIELDS) and builds the same JSON
+    shape in one pass per row, without DRF field dispatch.
+    """
+    output_timezone = _created_at_field.default_timezone()
+    to_iso = _created_at_field.to_representation
+    data = []
+    for row in rows:
+        action = row['action']
+        material_type = row['material_type']
+        created_at = row['created_at']
+        scan_count = row.get('scan_count')
+        if scan_count is None:
+            formatted = created_at.strftime('%b %d, %Y|%I:%M %p').split('|')
+        else:
+            formatted = (created_at.strftime('%b %Y'), '')
+        if output_timezone is not None and created_at.tzinfo is not None:
+            # Same result as DateTimeField.to_representation for aware values
+            iso = created_at.astimezone(output_timezone).isoformat()
+            if iso.endswith('+00:00'):
+                iso = iso[:-6] + 'Z'
+        else:
+            iso = to_iso(created_at)
+        data.append({
+            'id': row['id'],
+            'points': row['points'],
+            'action': action,
+            'description': row['description'],
+            'material_type': material_type,
+            'material_display': (
+                MATERIAL_DISPLAY.get(material_type, material_type) if material_type else None
+            ),
+            'created_at': iso,
+            'formatted_date': formatted[0],
+            'formatted_time': formatted[1],
+            'icon': ACTION_ICONS.get(action, 'history') if scan_count is None else ROLLUP_ICON,
+            'color': ACTION_COLORS.get(action, 'gray'),
+            'entry_type': 'transaction' if scan_count is None else 'monthly_summary',
+            'scan_count': scan_count,
+        })
+    return data
@@ -0,0 +1,21 @@
+from django.dispatch import Signal, receiver
+
+from trash2cash.routers import pin_primary
+
+# Sent with user_id, scans (list of (material_type, points)) and balance
+# once scanned points have been credited.
+points_scanned = Signal()
+
+# Sent with sender_id, receiver_id, points, sender_balance and
+# receiver_balance once a transfer has been applied.
+points_transferred = Signal()
+
+
+@receiver(points_scanned)
+def pin_scanner_to_primary(sender, user_id, **kwargs):
+    pin_primary(user_id)
+
+
+@receiver(points_transferred)
+def pin_transfer_parties_to_primary(sender, sender_id, receiver_id, **kwargs):
+    pin_primary(sender_id, receiver_id)
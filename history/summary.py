@@ -0,0 +1,217 @@
+# history/summary.py - Incrementally maintained per-user history totals
+from django.db import router, transaction
+from django.db.models import Case, Count, DateTimeField, Exists, F, Max, OuterRef, Q, Sum, Value, When
+from django.db.models.functions import Coalesce
+
+from .models import History, HistoryArchive, HistorySummary
+
+# action -> summary column holding its running total
+ACTION_FIELDS = {
+    'transfer_in': 'total_received',
+    'transfer_out': 'total_sent',
+    'scan': 'total_scanned',
+}
+
+# material_type -> summary column holding scanned points for that material
+MATERIAL_FIELDS = {
+    'plastic': 'scanned_plastic',
+    'metal': 'scanned_metal',
+    'non-recycle': 'scanned_non_recycle',
+}
+
+# action -> summary column counting that action's archived rows
+ARCHIVE_COUNT_FIELDS = {
+    'transfer_in': 'archived_transfers_in',
+    'transfer_out': 'archived_transfers_out',
+    'scan': 'archived_scans',
+}
+
+
+def _summary_aggregates(transactions=None):
+    """
+    Conditional aggregates that rebuild every summary column in one pass.
+    ``transactions`` overrides how rows are counted, e.g. for archive rows
+    that roll up several scans.
+    """
+    aggregates = {'total_transactions': transactions or Count('id')}
+    for action, field in ACTION_FIELDS.items():
+        aggregates[field] = Sum('points', filter=Q(action=action))
+    for material, field in MATERIAL_FIELDS.items():
+        aggregates[field] = Sum('points', filter=Q(action='scan', material_type=material))
+    return aggregates
+
+
+def _archived_summary_aggregates():
+    # A monthly rollup counts as the scans it replaced
+    return _summary_aggregates(transactions=Sum(Coalesce('scan_count', 1)))
+
+
+def _archive_aggregates():
+    """What the summary records about the rows in HistoryArchive."""
+    aggregates = {'archived_transactions': Count('id'), 'archived_until': Max('created_at')}
+    for action, field in ARCHIVE_COUNT_FIELDS.items():
+        aggregates[field] = Count('id', filter=Q(action=action))
+    return aggregates
+
+
+def _combine(hot, archived):
+    """Summary columns from the hot and archive aggregates of the same user."""
+    values = {field: (hot.get(field) or 0) + (archived.get(field) or 0) for field in _summary_aggregates()}
+    for field in _archive_aggregates():
+        values[field] = archived.get(field) or (None if field == 'archived_until' else 0)
+    return values
+
+
+def _apply(user, deltas):
+    """
+    Add deltas to the user's summary row.
+
+    Must run inside the same transaction that inserted the History rows, and
+    after them: when the row doesn't exist yet it is rebuilt from History,
+    which already includes the new entries.
+    """
+    updates = {field: F(field) + value for field, value in deltas.items() if value}
+    if HistorySummary.objects.filter(user_id=user.pk).update(**updates) == 0:
+        rebuild_summary(user)
+
+
+def record_scan(user, points, material_type):
+    record_scans(user, [(material_type, points)])
+
+
+def record_scans(user, scans):
+    """Fold a batch of (material_type, points) scans into one summary update."""
+    deltas = {'total_transactions': 0, 'total_scanned': 0}
+    for material_type, points in scans:
+        deltas['total_transactions'] += 1
+        deltas['total_scanned'] += points
+        material_field = MATERIAL_FIELDS.get(material_type)
+        if material_field:
+            deltas[material_field] = deltas.get(material_field, 0) + points
+    if deltas['total_transactions']:
+        _apply(user, deltas)
+
+
+def record_transfer(sender, receiver, points):
+    _apply(sender, {'total_transactions': 1, 'total_sent': points})
+    _apply(receiver, {'total_transactions': 1, 'total_received': points})
+
+
+def record_archived(rows, using):
+    """
+    Note History rows (values() dicts) that were just moved to the archive.
+
+    Must run in the transaction that moved them. The running totals already
+    count these rows; only the archive bookkeeping changes.
+    """
+    by_user = {}
+    for row in rows:
+        entry = by_user.setdefault(row['user_id'], {'until': row['created_at'], 'counts': {}})
+        entry['until'] = max(entry['until'], row['created_at'])
+        counts = entry['counts']
+        counts['archived_transactions'] = counts.get('archived_transactions', 0) + 1
+        field = ARCHIVE_COUNT_FIELDS[row['action']]
+        counts[field] = counts.get(field, 0) + 1
+
+    for user_id, entry in by_user.items():
+        until = Value(entry['until'], output_field=DateTimeField())
+        updated = HistorySummary.objects.using(using).filter(user_id=user_id).update(
+            archived_until=Case(
+                When(archived_until__gte=until, then=F('archived_until')), default=until
+            ),
+            **{field: F(field) + count for field, count in entry['counts'].items()},
+        )
+        if not updated:
+            _rebuild(user_id, using)
+
+
+def record_compacted(removed, using):
+    """
+    Note archived scan rows that compact_history merged into rollups:
+    {user_id: rows removed}. The totals already count those scans.
+    """
+    for user_id, count in removed.items():
+        HistorySummary.objects.using(using).filter(user_id=user_id).update(
+            archived_transactions=F('archived_transactions') - count,
+            archived_scans=F('archived_scans') - count,
+        )
+
+
+def _rebuild(user_id, db):
+    hot = History.objects.using(db).filter(user_id=user_id).aggregate(**_summary_aggregates())
+    archived = HistoryArchive.objects.using(db).filter(user_id=user_id).aggregate(
+        **_archived_summary_aggregates(), **_archive_aggregates()
+    )
+    summary, _ = HistorySummary.objects.using(db).update_or_create(
+        user_id=user_id, defaults=_combine(hot, archived)
+    )
+    return summary
+
+
+def rebuild_summary(user):
+    """Recompute one user's summary from History and HistoryArchive and store it."""
+    # Aggregate on the database the summary is written to, never a lagging replica
+    return _rebuild(user.pk, router.db_for_write(HistorySummary))
+
+
+@transaction.atomic
+def rebuild_all_summaries(batch_size=1000):
+    """Recompute every summary with one grouped query per table."""
+    hot = {
+        row.pop('user_id'): row
+        for row in History.objects.order_by().values('user_id').annotate(**_summary_aggregates())
+    }
+    archived = {
+        row.pop('user_id'): row
+        for row in HistoryArchive.objects.order_by().values('user_id').annotate(
+            **_archived_summary_aggregates(), **_archive_aggregates()
+        )
+    }
+    summaries = [
+        HistorySummary(user_id=user_id, **_combine(hot.get(user_id, {}), archived.get(user_id, {})))
+        for user_id in hot.keys() | archived.keys()
+    ]
+    HistorySummary.objects.exclude(
+        Exists(History.objects.filter(user_id=OuterRef('user_id')))
+    ).exclude(
+        Exists(HistoryArchive.objects.filter(user_id=OuterRef('user_id')))
+    ).delete()
+    fields = [
+        'total_transactions', *ACTION_FIELDS.values(), *MATERIAL_FIELDS.values(),
+        *_archive_aggregates(),
+    ]
+    HistorySummary.objects.bulk_create(
+        summaries,
+        batch_size=batch_size,
+        update_conflicts=True,
+        unique_fields=['user'],
+        update_fields=fields,
+    )
+    return len(summaries)
+
+
+def get_summary(user):
+    """Return the user's summary with a single primary-key read, creating it on first use."""
+    summary = HistorySummary.objects.filter(user_id=user.pk).first()
+    if summary is None:
+        summary = rebuild_summary(user)
+    return summary
+
+
+def archived_count(summary, action):
+    """Archived rows matching the feed's ?action= filter, from the summary."""
+    if not action or action == 'all':
+        return summary.archived_transactions
+    field = ARCHIVE_COUNT_FIELDS.get(action)
+    return getattr(summary, field) if field else 0
+
+
+def summary_data(summary, user):
+    """The 'summary' block returned alongside the history feed."""
+    return {
+        'total_transactions': summary.total_transactions,
+        'total_points_received': summary.total_received,
+        'total_points_sent': summary.total_sent,
+        'total_points_scanned': summary.total_scanned,
+        'net_points': user.total_points,
+    }
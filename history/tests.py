@@ -1,3 +1,958 @@
-from django.test import TestCase
+import os
+import random
+import shutil
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta, timezone as dt_timezone
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.core.cache import cache
+from django.db import OperationalError, connection, connections
+from django.core.management.base import CommandError
+from django.db.models import F, Sum
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from django.urls import reverse
+from django.core.management import call_command
+from rest_framework.test import APITestCase
+from rest_framework_simplejwt.tokens import AccessToken
+from django.contrib.auth import get_user_model
+
+from trash2cash import routers
+from trash2cash.testing import QueryBudgetMixin
+from user import identity, revocation
+from user.authentication import clear_principals
+from user.cache import bump_user_version
+from .models import History, HistoryArchive, HistorySummary
+from .serializers import ARCHIVE_VALUE_FIELDS, HISTORY_VALUE_FIELDS, HistorySerializer, serialize_history_rows
+from .transfers import InsufficientPoints, transfer_points
+
+User = get_user_model()
+
+
+def create_user(email, phone_number, password='testpass123'):
+    return User.objects.create_user(
+        email=email,
+        first_name='Test',
+        last_name='User',
+        phone_number=phone_number,
+        password=password
+    )
+
+
+class HistorySummaryTest(APITestCase):
+    """Test the incrementally maintained history summary"""
+
+    def setUp(self):
+        self.sender = create_user('summarysender@example.com', '+251911111201')
+        self.receiver = create_user('summaryreceiver@example.com', '+251911111202')
+        self.client.force_authenticate(user=self.sender)
+
+    def scan(self, material, points):
+        return self.client.post(reverse('qr-scan'), {
+            'materialType': material,
+            'pointsToAdd': points,
+            'date': '2025-01-01T10:00:00Z'
+        }, format='json')
+
+    def test_summary_tracks_scans_and_transfers(self):
+        """Test that scans and transfers update the summary"""
+        self.scan('plastic', 20)
+        self.scan('metal', 15)
+        response = self.client.post(reverse('points-transfer'), {
+            'receiver_email_or_phone': self.receiver.email,
+            'points': 10
+        }, format='json')
+        self.assertEqual(response.status_code, 200)
+
+        sender_summary = HistorySummary.objects.get(user=self.sender)
+        self.assertEqual(sender_summary.total_transactions, 3)
+        self.assertEqual(sender_summary.total_scanned, 35)
+        self.assertEqual(sender_summary.scanned_plastic, 20)
+        self.assertEqual(sender_summary.scanned_metal, 15)
+        self.assertEqual(sender_summary.total_sent, 10)
+
+        receiver_summary = HistorySummary.objects.get(user=self.receiver)
+        self.assertEqual(receiver_summary.total_transactions, 1)
+        self.assertEqual(receiver_summary.total_received, 10)
+
+        response = self.client.get(reverse('history-list'))
+        self.assertEqual(response.data['summary']['total_transactions'], 3)
+        self.assertEqual(response.data['summary']['total_points_scanned'], 35)
+        self.assertEqual(response.data['summary']['total_points_sent'], 10)
+        print("✓ History summary tracking test passed")
+
+    def test_summary_built_lazily_from_existing_history(self):
+        """Test that users with history but no summary row get one on first read"""
+        History.objects.create(user=self.sender, points=7, action='scan',
+                               material_type='plastic', description='QR Scan')
+
+        response = self.client.get(reverse('history-list'))
+
+        self.assertEqual(response.data['summary']['total_transactions'], 1)
+        self.assertEqual(response.data['summary']['total_points_scanned'], 7)
+        self.assertTrue(HistorySummary.objects.filter(user=self.sender).exists())
+        print("✓ Lazy summary build test passed")
+
+    def test_rebuild_command(self):
+        """Test that the management command rebuilds summaries from History"""
+        self.scan('non-recycle', 5)
+        HistorySummary.objects.filter(user=self.sender).update(total_scanned=999)
+        History.objects.create(user=self.receiver, points=3, action='transfer_in',
+                               description='Received')
+
+        call_command('rebuild_history_summary', verbosity=0)
+
+        sender_summary = HistorySummary.objects.get(user=self.sender)
+        self.assertEqual(sender_summary.total_scanned, 5)
+        self.assertEqual(sender_summary.scanned_non_recycle, 5)
+        self.assertEqual(HistorySummary.objects.get(user=self.receiver).total_received, 3)
+        print("✓ Summary rebuild command test passed")
+
+
+class HistoryCursorPaginationTest(APITestCase):
+    """Test keyset pagination of the history feed"""
+
+    def setUp(self):
+        self.user = create_user('cursoruser@example.com', '+251911111203')
+        self.client.force_authenticate(user=self.user)
+        rows = [
+            History(user=self.user, points=i, action='scan' if i % 2 else 'transfer_in',
+                    description=f'Entry {i}')
+            for i in range(25)
+        ]
+        History.objects.bulk_create(rows)
+        # Give several rows the same timestamp so the id tie-breaker matters
+        same_time = History.objects.filter(user=self.user).order_by('id')[5].created_at
+        History.objects.filter(user=self.user, points__lt=10).update(created_at=same_time)
+
+    def collect(self, params):
+        ids = []
+        response = self.client.get(reverse('history-list'), params)
+        while True:
+            self.assertEqual(response.status_code, 200)
+            self.assertNotIn('count', response.data)
+            ids.extend(row['id'] for row in response.data['results'])
+            if not response.data['next']:
+                return ids
+            response = self.client.get(response.data['next'])
+
+    def test_cursor_pages_cover_feed_once(self):
+        """Test that following next links returns every row exactly once, newest first"""
+        ids = self.collect({'pagination': 'cursor', 'page_size': 4})
+
+        expected = list(
+            History.objects.filter(user=self.user)
+            .order_by('-created_at', '-id').values_list('id', flat=True)
+        )
+        self.assertEqual(ids, expected)
+        print("✓ Cursor pagination coverage test passed")
+
+    def test_cursor_honors_action_filter(self):
+        """Test that the action filter is kept across cursor pages"""
+        ids = self.collect({'pagination': 'cursor', 'page_size': 5, 'action': 'scan'})
+
+        self.assertEqual(len(ids), 12)
+        self.assertEqual(
+            set(History.objects.filter(id__in=ids).values_list('action', flat=True)), {'scan'}
+        )
+        print("✓ Cursor pagination action filter test passed")
+
+    def test_invalid_cursor(self):
+        """Test that a garbled cursor is rejected"""
+        response = self.client.get(reverse('history-list'), {'cursor': 'not-a-cursor'})
+
+        self.assertEqual(response.status_code, 404)
+        print("✓ Invalid cursor test passed")
+
+
+class QRScanBulkTest(APITestCase):
+    """Test the batch QR scan endpoint"""
+
+    def setUp(self):
+        self.user = create_user('bulkscan@example.com', '+251911111204')
+        self.client.force_authenticate(user=self.user)
+
+    def test_bulk_scan_reports_each_item(self):
+        """Test that valid scans are stored together and invalid ones reported"""
+        scans = [
+            {'materialType': 'plastic', 'pointsToAdd': 5, 'date': '2025-01-01T10:00:00Z'},
+            {'materialType': 'glass', 'pointsToAdd': 5, 'date': '2025-01-01T10:01:00Z'},
+            {'materialType': 'Metal', 'pointsToAdd': 8, 'date': '2025-01-01T10:02:00Z'},
+        ]
+
+        response = self.client.post(reverse('qr-scan-bulk'), scans, format='json')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([r['success'] for r in response.data['results']], [True, False, True])
+        self.assertIn('materialType', response.data['results'][1]['errors'])
+        self.assertEqual(response.data['data']['points_added'], 13)
+        self.assertEqual(response.data['data']['total_points'], 23)
+
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.total_points, 23)
+        self.assertEqual(History.objects.filter(user=self.user, action='scan').count(), 2)
+        summary = HistorySummary.objects.get(user=self.user)
+        self.assertEqual(summary.total_scanned, 13)
+        self.assertEqual(summary.scanned_metal, 8)
+        print("✓ Bulk scan test passed")
+
+    def test_bulk_scan_keeps_client_dates_in_window(self):
+        """Test that offline scans keep their date and untrusted dates become now"""
+        now = timezone.now()
+        recent = (now - timedelta(days=2)).replace(microsecond=0)
+        scans = [
+            {'materialType': 'plastic', 'pointsToAdd': 1, 'date': recent.isoformat()},
+            {'materialType': 'plastic', 'pointsToAdd': 2, 'date': (now + timedelta(days=1)).isoformat()},
+            {'materialType': 'plastic', 'pointsToAdd': 3, 'date': (now - timedelta(days=30)).isoformat()},
+        ]
+
+        response = self.client.post(reverse('qr-scan-bulk'), scans, format='json')
+
+        self.assertEqual(response.status_code, 200)
+        stored = dict(History.objects.filter(user=self.user).values_list('points', 'created_at'))
+        self.assertEqual(stored[1], recent)
+        for points in [2, 3]:
+            self.assertLess(abs(stored[points] - now), timedelta(minutes=1))
+        # The response echoes what was stored
+        self.assertEqual([r['scan_date'] for r in response.data['results']], [stored[1], stored[2], stored[3]])
+        print("✓ Bulk scan date window test passed")
+
+    def test_bulk_scan_rejects_empty_batch(self):
+        """Test that an empty or all-invalid batch is rejected"""
+        response = self.client.post(reverse('qr-scan-bulk'), [], format='json')
+        self.assertEqual(response.status_code, 400)
+
+        response = self.client.post(reverse('qr-scan-bulk'), {'scans': [
+            {'materialType': 'plastic', 'pointsToAdd': 0, 'date': '2025-01-01T10:00:00Z'},
+        ]}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(response.data['results'][0]['success'])
+        self.assertEqual(History.objects.filter(user=self.user).count(), 0)
+        print("✓ Bulk scan rejection test passed")
+
+
+class ReceiverResolutionTest(APITestCase):
+    """Test receiver lookup on the transfer path"""
+
+    def setUp(self):
+        identity.clear_cache()
+        self.sender = create_user('resolvesender@example.com', '+251911111205')
+        self.receiver = create_user('resolvereceiver@example.com', '+251911111206')
+        self.client.force_authenticate(user=self.sender)
+
+    def test_resolve_by_email_or_phone_in_one_query(self):
+        """Test that email and phone lookups each take one query and are then cached"""
+        with self.assertNumQueries(1):
+            self.assertEqual(identity.resolve_user('+251911111206'), self.receiver)
+        with self.assertNumQueries(1):
+            self.assertEqual(identity.resolve_user(self.receiver.email), self.receiver)
+        with self.assertNumQueries(0):
+            self.assertEqual(identity.resolve_user(self.receiver.email), self.receiver)
+        self.assertIsNone(identity.resolve_user('nobody@example.com'))
+        print("✓ Receiver resolution test passed")
+
+    def test_cache_invalidated_when_email_changes(self):
+        """Test that a changed email no longer resolves to the user"""
+        identity.resolve_user('resolvereceiver@example.com')
+
+        self.receiver.email = 'renamed@example.com'
+        self.receiver.save()
+
+        self.assertIsNone(identity.resolve_user('resolvereceiver@example.com'))
+        self.assertEqual(identity.resolve_user('renamed@example.com'), self.receiver)
+        print("✓ Resolver invalidation test passed")
+
+    def test_save_in_another_worker_drops_cached_lookup(self):
+        """Test that a change made by another process is noticed through the shared stamp"""
+        identity.resolve_user('resolvereceiver@example.com')
+
+        # Another worker: the row changes and the stamp moves, this process's cache is untouched
+        User.objects.filter(pk=self.receiver.pk).update(email='moved@example.com')
+        bump_user_version(self.receiver.pk)
+
+        self.assertIsNone(identity.resolve_user('resolvereceiver@example.com'))
+        print("✓ Cross-worker resolver invalidation test passed")
+
+    def test_check_receiver_then_transfer(self):
+        """Test that the transfer reuses the lookup done by check-receiver"""
+        response = self.client.post(reverse('check-receiver'), {
+            'email_or_phone': '+251911111206'
+        }, format='json')
+        self.assertTrue(response.data['exists'])
+        self.assertEqual(response.data['user']['id'], self.receiver.id)
+
+        response = self.client.post(reverse('points-transfer'), {
+            'receiver_email_or_phone': '+251911111206',
+            'points': 5
+        }, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.receiver.refresh_from_db()
+        self.assertEqual(self.receiver.total_points, 15)
+
+        response = self.client.post(reverse('points-transfer'), {
+            'receiver_email_or_phone': self.sender.email,
+            'points': 5
+        }, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('receiver_email_or_phone', response.data['errors'])
+        print("✓ Check receiver and transfer test passed")
+
+
+class TransferEngineTest(TestCase):
+    """Test the conditional debit/credit transfer engine"""
+
+    def setUp(self):
+        self.alice = create_user('enginealice@example.com', '+251911111207')
+        self.bob = create_user('enginebob@example.com', '+251911111208')
+
+    def test_transfer_returns_new_balances(self):
+        """Test that balances come back from the update statements"""
+        self.assertEqual(transfer_points(self.alice.pk, self.bob.pk, 4), (6, 14))
+        self.assertEqual(transfer_points(self.bob.pk, self.alice.pk, 14), (0, 20))
+        print("✓ Transfer engine balance test passed")
+
+    def test_insufficient_points_rolls_back(self):
+        """Test that a failed debit leaves both balances untouched"""
+        # bob has the higher pk, so the credit to alice runs before the failing debit
+        with self.assertRaises(InsufficientPoints) as ctx:
+            transfer_points(self.bob.pk, self.alice.pk, 11)
+
+        self.assertEqual(ctx.exception.balance, 10)
+        self.alice.refresh_from_db()
+        self.bob.refresh_from_db()
+        self.assertEqual((self.alice.total_points, self.bob.total_points), (10, 10))
+        print("✓ Transfer engine rollback test passed")
+
+
+class TransferConcurrencyTest(TransactionTestCase):
+    """Stress the transfer engine with parallel transfers between a few accounts"""
+
+    accounts = 4
+    workers = 8
+    transfers_per_worker = 25
+
+    def setUp(self):
+        self.users = [
+            create_user(f'stress{i}@example.com', f'+25191111130{i}') for i in range(self.accounts)
+        ]
+        User.objects.update(total_points=50)
+
+    def run_worker(self, seed, outcomes):
+        rng = random.Random(seed)
+        try:
+            for _ in range(self.transfers_per_worker):
+                sender, receiver = rng.sample(self.users, 2)
+                points = rng.randint(1, 30)
+                while True:
+                    try:
+                        transfer_points(sender.pk, receiver.pk, points)
+                        outcomes.append('ok')
+                    except InsufficientPoints:
+                        outcomes.append('insufficient')
+                    except OperationalError as e:
+                        # SQLite serializes writers; retry when the database is busy
+                        if 'locked' not in str(e):
+                            raise
+                        time.sleep(0.001)
+                        continue
+                    break
+        finally:
+            connection.close()
+
+    def test_parallel_transfers_conserve_points(self):
+        """Test that concurrent transfers never lose points or overdraw"""
+        outcomes = []
+        threads = [
+            threading.Thread(target=self.run_worker, args=(seed, outcomes))
+            for seed in range(self.workers)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(outcomes), self.workers * self.transfers_per_worker)
+        balances = list(User.objects.values_list('total_points', flat=True))
+        self.assertEqual(sum(balances), 50 * self.accounts)
+        self.assertTrue(all(balance >= 0 for balance in balances))
+        print(f"✓ Concurrent transfer test passed ({outcomes.count('ok')} transfers applied)")
+
+
+class FastHistorySerializerTest(APITestCase):
+    """Test that the values() fast path matches HistorySerializer"""
+
+    def setUp(self):
+        self.user = create_user('fastserializer@example.com', '+251911111209')
+        self.client.force_authenticate(user=self.user)
+        History.objects.bulk_create([
+            History(user=self.user, points=5, action='scan', material_type='plastic',
+                    description='QR Scan: Recycled Plastic'),
+            History(user=self.user, points=7, action='scan', material_type='glass',
+                    description='Unknown material'),
+            History(user=self.user, points=9, action='transfer_out', description='Sent'),
+            History(user=self.user, points=3, action='refund', description='Unknown action'),
+        ])
+
+    def test_fast_path_matches_serializer(self):
+        """Test that both serializers produce identical rows"""
+        queryset = History.objects.filter(user=self.user)
+
+        expected = HistorySerializer(queryset, many=True).data
+        actual = serialize_history_rows(queryset.values(*HISTORY_VALUE_FIELDS))
+
+        self.assertEqual(actual, expected)
+        print("✓ Fast history serializer test passed")
+
+    def test_list_and_recent_use_same_shape(self):
+        """Test the history endpoints return serializer-shaped rows"""
+        expected = HistorySerializer(History.objects.filter(user=self.user), many=True).data
+
+        response = self.client.get(reverse('history-list'))
+        self.assertEqual(response.data['results'], expected)
+
+        response = self.client.get(reverse('recent-history'), {'limit': 2})
+        self.assertEqual(response.data['transactions'], expected[:2])
+        self.assertEqual(response.data['count'], 2)
+        print("✓ History endpoint shape test passed")
+
+
+@override_settings(REST_FRAMEWORK={
+    **settings.REST_FRAMEWORK,
+    'DEFAULT_THROTTLE_RATES': {'qr_scan': '3/min', 'check_receiver_ip': '2/min'},
+})
+class PointsThrottleTest(APITestCase):
+    """Test token-bucket limits on qr-scan and check-receiver"""
+
+    def setUp(self):
+        cache.clear()
+        self.user = create_user('throttleuser@example.com', '+251911111210')
+        self.client.force_authenticate(user=self.user)
+
+    def tearDown(self):
+        cache.clear()
+
+    def test_qr_scan_limited_per_user(self):
+        """Test that scans beyond the bucket get 429 with Retry-After"""
+        scan = {'materialType': 'plastic', 'pointsToAdd': 1, 'date': '2025-01-01T10:00:00Z'}
+        for _ in range(3):
+            self.assertEqual(self.client.post(reverse('qr-scan'), scan, format='json').status_code, 200)
+
+        response = self.client.post(reverse('qr-scan'), scan, format='json')
+
+        self.assertEqual(response.status_code, 429)
+        self.assertGreaterEqual(int(response['Retry-After']), 1)
+        self.assertEqual(History.objects.filter(user=self.user).count(), 3)
+
+        other = create_user('throttleother@example.com', '+251911111211')
+        self.client.force_authenticate(user=other)
+        self.assertEqual(self.client.post(reverse('qr-scan'), scan, format='json').status_code, 200)
+        print("✓ QR scan throttle test passed")
+
+    def test_bulk_scan_charged_per_item(self):
+        """Test that each scan in a batch takes a token from the qr-scan bucket"""
+        scan = {'materialType': 'plastic', 'pointsToAdd': 1, 'date': '2025-01-01T10:00:00Z'}
+        # More scans than the bucket holds could never be accepted; the
+        # refusal costs one token like any other request
+        response = self.client.post(reverse('qr-scan-bulk'), [scan] * 4, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['message'], "At most 3 scans can be sent at once")
+
+        response = self.client.post(reverse('qr-scan-bulk'), [scan] * 2, format='json')
+        self.assertEqual(response.status_code, 200)
+
+        response = self.client.post(reverse('qr-scan-bulk'), [scan], format='json')
+        self.assertEqual(response.status_code, 429)
+        self.assertGreaterEqual(int(response['Retry-After']), 1)
+        self.assertEqual(self.client.post(reverse('qr-scan'), scan, format='json').status_code, 429)
+        self.assertEqual(History.objects.filter(user=self.user).count(), 2)
+        print("✓ Bulk scan throttle test passed")
+
+    def test_check_receiver_limited_per_ip(self):
+        """Test that receiver enumeration from one IP is limited"""
+        for phone in ['+251900000001', '+251900000002']:
+            response = self.client.post(reverse('check-receiver'), {'email_or_phone': phone}, format='json')
+            self.assertEqual(response.status_code, 200)
+
+        response = self.client.post(reverse('check-receiver'), {'email_or_phone': '+251900000003'}, format='json')
+
+        self.assertEqual(response.status_code, 429)
+        self.assertIn('Retry-After', response)
+        print("✓ Check receiver throttle test passed")
+
+    def test_ip_limit_ignores_client_supplied_forwarded_for(self):
+        """Test that varying the client's own X-Forwarded-For entries doesn't reset the IP bucket"""
+        def check(spoofed):
+            # The platform router appends the address it saw after the client's entries
+            return self.client.post(
+                reverse('check-receiver'), {'email_or_phone': '+251900000001'}, format='json',
+                HTTP_X_FORWARDED_FOR=f'{spoofed}, 203.0.113.9',
+            )
+
+        for spoofed in ['10.0.0.1', '10.0.0.2']:
+            self.assertEqual(check(spoofed).status_code, 200)
+        self.assertEqual(check('10.0.0.3').status_code, 429)
+        print("✓ Forwarded-for spoofing test passed")
+
+
+@override_settings(TOKEN_REVOCATION={'SYNC_SECONDS': 3600})
+class PointsQueryBudgetTest(QueryBudgetMixin, APITestCase):
+    """Test that the points endpoints stay within their query budgets"""
+
+    def setUp(self):
+        cache.clear()
+        identity.clear_cache()
+        clear_principals()
+        # Sync the revocation list now so its query doesn't land in a budget
+        revocation._next_sync = 0
+        revocation.is_revoked('warm-up')
+        self.addCleanup(setattr, revocation, '_next_sync', 0)
+        self.user = create_user('budgetuser@example.com', '+251911111230')
+        self.receiver = create_user('budgetreceiver@example.com', '+251911111231')
+        User.objects.filter(pk=self.user.pk).update(total_points=500)
+        for i in range(30):
+            History.objects.create(user=self.user, points=i + 1, action='scan', material_type='metal')
+        self.headers = {'HTTP_AUTHORIZATION': f'Bearer {AccessToken.for_user(self.user)}'}
+
+    def tearDown(self):
+        cache.clear()
+
+    def scan(self):
+        return self.client.post(reverse('qr-scan'), {
+            'materialType': 'plastic', 'pointsToAdd': 10, 'date': '2025-01-01T10:00:00Z'
+        }, format='json', **self.headers)
+
+    def bulk_scan(self):
+        scans = [
+            {'materialType': 'metal', 'pointsToAdd': 5, 'date': '2025-01-01T10:00:00Z'}
+            for _ in range(5)
+        ]
+        return self.client.post(reverse('qr-scan-bulk'), {'scans': scans}, format='json', **self.headers)
+
+    def check_receiver(self):
+        return self.client.post(reverse('check-receiver'), {
+            'email_or_phone': self.receiver.email
+        }, format='json', **self.headers)
+
+    def transfer(self):
+        return self.client.post(reverse('points-transfer'), {
+            'receiver_email_or_phone': self.receiver.email, 'points': 20
+        }, format='json', **self.headers)
+
+    def warm_up(self):
+        """Send each request once: principal, identity, summary and leaderboard rows all exist after"""
+        for request in [self.scan, self.bulk_scan, self.check_receiver, self.transfer]:
+            self.assertEqual(request().status_code, 200)
+
+    def test_read_endpoint_budgets(self):
+        """Test the history list and recent feed budgets once caches are warm"""
+        self.warm_up()
+
+        # Summary row, count and page, plus the balance for net_points: the
+        # cached principal never holds it
+        with self.assertMaxQueries(4):
+            response = self.client.get(reverse('history-list'), **self.headers)
+        self.assertEqual(response.status_code, 200)
+
+        with self.assertMaxQueries(3):
+            response = self.client.get(reverse('history-list') + '?pagination=cursor', **self.headers)
+        self.assertEqual(response.status_code, 200)
+
+        with self.assertMaxQueries(1):
+            response = self.client.get(reverse('recent-history'), **self.headers)
+        self.assertEqual(response.status_code, 200)
+        print("✓ Read endpoint query budget test passed")
+
+    def test_write_endpoint_budgets(self):
+        """Test the scan, bulk scan, receiver check and transfer budgets once caches are warm"""
+        self.warm_up()
+
+        # Credit, insert, summary update and three leaderboard upserts, in a savepoint
+        with self.assertMaxQueries(8):
+            self.assertEqual(self.scan().status_code, 200)
+
+        with self.assertMaxQueries(8):
+            self.assertEqual(self.bulk_scan().status_code, 200)
+
+        with self.assertMaxQueries(0):
+            self.assertEqual(self.check_receiver().status_code, 200)
+
+        # Both balance updates, both history rows in one insert, both
+        # summaries and both global leaderboard rows
+        with self.assertMaxQueries(11):
+            self.assertEqual(self.transfer().status_code, 200)
+        print("✓ Write endpoint query budget test passed")
+
+    def test_cold_cache_work(self):
+        """Test the one-off work a cold cache adds on top of the warm budgets"""
+        # Building a summary row: two aggregates (History and the archive)
+        # and a get_or_create, 8 queries with its savepoints. The list also
+        # loads the principal, which saves it the separate balance query.
+        with self.assertNumQueries(4 + 8):
+            response = self.client.get(reverse('history-list'), **self.headers)
+        self.assertEqual(response.status_code, 200)
+
+        # The user's first weekly and plastic leaderboard rows: an UPDATE
+        # that misses, then an INSERT in a savepoint, 3 more queries each
+        with self.assertNumQueries(8 + 2 * 3):
+            self.assertEqual(self.scan().status_code, 200)
+
+        # Only the metal leaderboard row is new this time
+        with self.assertNumQueries(8 + 3):
+            self.assertEqual(self.bulk_scan().status_code, 200)
+
+        # The receiver lookup before it is cached
+        with self.assertNumQueries(0 + 1):
+            self.assertEqual(self.check_receiver().status_code, 200)
+
+        # The receiver's summary row is built the first time they get points
+        with self.assertNumQueries(11 + 8):
+            self.assertEqual(self.transfer().status_code, 200)
+        print("✓ Cold cache query count test passed")
+
+
+class HistoryArchiveTest(APITestCase):
+    """Test archiving cold history rows and reading the feed across both tiers"""
+
+    def setUp(self):
+        self.user = create_user('archiveuser@example.com', '+251911111232')
+        self.other = create_user('archiveother@example.com', '+251911111233')
+        self.client.force_authenticate(user=self.user)
+        now = timezone.now()
+        # 10 recent rows and 20 from more than a year ago, a few sharing a timestamp
+        ages = [timedelta(days=i) for i in range(10)]
+        ages += [timedelta(days=400 + i // 3) for i in range(20)]
+        for i, age in enumerate(ages):
+            entry = History.objects.create(
+                user=self.user, points=i + 1, action='scan' if i % 2 else 'transfer_in',
+                material_type='metal' if i % 2 else None, description=f'Entry {i}',
+            )
+            History.objects.filter(pk=entry.pk).update(created_at=now - age)
+        old = History.objects.create(user=self.other, points=9, action='scan', material_type='plastic')
+        History.objects.filter(pk=old.pk).update(created_at=now - timedelta(days=500))
+        # Summaries exist before the move, as they would in production
+        self.client.get(reverse('history-list'))
+        self.summary_before = HistorySummary.objects.get(user=self.user)
+
+    def archive(self):
+        call_command('archive_history', days=365, batch_size=7, stdout=StringIO())
+
+    def expected_ids(self, **filters):
+        rows = [
+            (row.created_at, row.pk)
+            for model in (History, HistoryArchive)
+            for row in model.objects.filter(user=self.user, **filters)
+        ]
+        return [pk for _, pk in sorted(rows, reverse=True)]
+
+    def collect(self, params):
+        ids = []
+        response = self.client.get(reverse('history-list'), params)
+        while True:
+            self.assertEqual(response.status_code, 200)
+            ids.extend(row['id'] for row in response.data['results'])
+            if not response.data['next']:
+                return ids, response
+            response = self.client.get(response.data['next'])
+
+    def archive_queries(self, params):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('history-list'), params)
+        self.assertEqual(response.status_code, 200)
+        return [query['sql'] for query in queries if 'history_historyarchive' in query['sql']]
+
+    def test_filter_matching_nothing_across_tiers(self):
+        """Test that an empty result over both tiers is an empty page, not an error"""
+        self.archive()
+
+        for params in [{'action': 'transfer_out'}, {'action': 'transfer_out', 'days': 500}]:
+            response = self.client.get(reverse('history-list'), params)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.data['count'], 0)
+            self.assertEqual(response.data['results'], [])
+        print("✓ Empty tiered feed test passed")
+
+    def test_archive_moves_cold_rows(self):
+        """Test that old rows move with their ids and the summary keeps its totals"""
+        expected = self.expected_ids()
+        self.archive()
+
+        self.assertEqual(History.objects.filter(user=self.user).count(), 10)
+        self.assertEqual(HistoryArchive.objects.filter(user=self.user).count(), 20)
+        self.assertEqual(HistoryArchive.objects.filter(user=self.other).count(), 1)
+        self.assertEqual(self.expected_ids(), expected)
+
+        summary = HistorySummary.objects.get(user=self.user)
+        self.assertEqual(summary.total_transactions, self.summary_before.total_transactions)
+        self.assertEqual(summary.total_scanned, self.summary_before.total_scanned)
+        self.assertEqual(summary.archived_transactions, 20)
+        self.assertEqual(summary.archived_scans, 10)
+        self.assertEqual(summary.archived_transfers_in, 10)
+        self.assertEqual(
+            summary.archived_until, HistoryArchive.objects.filter(user=self.user).latest('created_at').created_at
+        )
+        # The other user had no summary row yet; it is built from both tables
+        self.assertEqual(HistorySummary.objects.get(user=self.other).archived_scans, 1)
+
+        call_command('rebuild_history_summary', stdout=StringIO())
+        rebuilt = HistorySummary.objects.get(user=self.user)
+        for field in ['total_transactions', 'total_scanned', 'total_received', 'scanned_metal',
+                      'archived_transactions', 'archived_scans', 'archived_until']:
+            self.assertEqual(getattr(rebuilt, field), getattr(summary, field), field)
+        print("✓ History archive move test passed")
+
+    def test_feed_spans_both_tiers(self):
+        """Test that both paginators walk hot and archived rows in one order"""
+        self.archive()
+        expected = self.expected_ids()
+
+        ids, _ = self.collect({'page_size': 4})
+        self.assertEqual(ids, expected)
+        response = self.client.get(reverse('history-list'), {'page_size': 4})
+        self.assertEqual(response.data['count'], 30)
+
+        ids, _ = self.collect({'pagination': 'cursor', 'page_size': 4})
+        self.assertEqual(ids, expected)
+
+        ids, _ = self.collect({'pagination': 'cursor', 'page_size': 3, 'action': 'scan'})
+        self.assertEqual(ids, self.expected_ids(action='scan'))
+
+        print("✓ Tiered feed pagination test passed")
+
+    def test_late_rows_older_than_the_boundary(self):
+        """Test that old-dated rows scanned after archiving interleave with the archive"""
+        self.archive()
+        late = History.objects.create(user=self.user, points=50, action='scan', material_type='metal')
+        History.objects.filter(pk=late.pk).update(created_at=timezone.now() - timedelta(days=403))
+        expected = self.expected_ids()
+        self.assertIn(late.pk, expected[10:-1])
+
+        ids, _ = self.collect({'page_size': 4})
+        self.assertEqual(ids, expected)
+        ids, _ = self.collect({'pagination': 'cursor', 'page_size': 4})
+        self.assertEqual(ids, expected)
+        print("✓ Late row interleaving test passed")
+
+    def test_archive_only_read_when_reached(self):
+        """Test that recent pages and short ?days= windows never touch the archive"""
+        self.archive()
+
+        self.assertEqual(self.archive_queries({'page_size': 5}), [])
+        self.assertEqual(self.archive_queries({'pagination': 'cursor', 'page_size': 5}), [])
+        self.assertEqual(self.archive_queries({'days': 30}), [])
+        self.assertNotEqual(self.archive_queries({'page_size': 5, 'page': 3}), [])
+
+        response = self.client.get(reverse('history-list'), {'days': 401, 'page_size': 100})
+        self.assertEqual([row['id'] for row in response.data['results']], self.expected_ids(
+            created_at__gte=timezone.now() - timedelta(days=401)
+        ))
+        print("✓ Archive read avoidance test passed")
+
+    def test_dry_run(self):
+        """Test that --dry-run only counts"""
+        out = StringIO()
+        call_command('archive_history', days=365, dry_run=True, stdout=out)
+
+        self.assertIn('21 History rows', out.getvalue())
+        self.assertFalse(HistoryArchive.objects.exists())
+        print("✓ Archive dry run test passed")
+
+
+class HistoryCompactionTest(APITestCase):
+    """Test collapsing archived scans into monthly rollup rows"""
+
+    def setUp(self):
+        self.user = create_user('compactuser@example.com', '+251911111234')
+        self.client.force_authenticate(user=self.user)
+        entries = []
+        for day in range(1, 11):
+            entries.append(('scan', 'plastic' if day % 2 else 'metal', day, datetime(2023, 3, day, 12)))
+        entries.append(('scan', 'plastic', 7, datetime(2023, 4, 2, 9)))
+        entries.append(('scan', 'plastic', 8, datetime(2023, 4, 30, 23)))
+        entries.append(('transfer_in', None, 20, datetime(2023, 3, 5, 8)))
+        entries.append(('transfer_in', None, 30, datetime(2023, 3, 6, 8)))
+        entries.append(('scan', 'metal', 4, None))
+        for action, material, points, created_at in entries:
+            entry = History.objects.create(
+                user=self.user, points=points, action=action, material_type=material, description='Entry'
+            )
+            if created_at is not None:
+                History.objects.filter(pk=entry.pk).update(created_at=created_at.replace(tzinfo=dt_timezone.utc))
+        self.client.get(reverse('history-list'))
+        call_command('archive_history', days=365, stdout=StringIO())
+        self.summary_before = HistorySummary.objects.get(user=self.user)
+
+    def compact(self, *args):
+        out = StringIO()
+        call_command('compact_history', *args, stdout=out)
+        return out.getvalue()
+
+    def test_scans_become_monthly_rollups(self):
+        """Test that each user/month/material keeps its exact totals in one row"""
+        points_before = HistoryArchive.objects.aggregate(total=Sum('points'))['total']
+        output = self.compact('--verify', '--chunk-size', '1')
+
+        self.assertIn('Merged 3 scan groups', output)
+        self.assertIn('removing 9 rows', output)
+        self.assertIn('Verified', output)
+        archive = HistoryArchive.objects.filter(user=self.user)
+        self.assertEqual(archive.aggregate(total=Sum('points'))['total'], points_before)
+        self.assertEqual(archive.filter(action='transfer_in', scan_count__isnull=True).count(), 2)
+        rollups = {
+            (row.created_at.month, row.material_type): row
+            for row in archive.filter(scan_count__isnull=False)
+        }
+        self.assertEqual(set(rollups), {(3, 'plastic'), (3, 'metal'), (4, 'plastic')})
+        self.assertEqual((rollups[3, 'plastic'].points, rollups[3, 'plastic'].scan_count), (25, 5))
+        self.assertEqual((rollups[3, 'metal'].points, rollups[3, 'metal'].scan_count), (30, 5))
+        self.assertEqual(rollups[4, 'plastic'].created_at.day, 30)
+
+        summary = HistorySummary.objects.get(user=self.user)
+        for field in ['total_transactions', 'total_scanned', 'scanned_plastic', 'scanned_metal']:
+            self.assertEqual(getattr(summary, field), getattr(self.summary_before, field), field)
+        self.assertEqual(summary.archived_transactions, 5)
+        self.assertEqual(summary.archived_scans, 3)
+        call_command('rebuild_history_summary', stdout=StringIO())
+        rebuilt = HistorySummary.objects.get(user=self.user)
+        self.assertEqual(rebuilt.total_transactions, self.summary_before.total_transactions)
+        self.assertEqual(rebuilt.archived_transactions, 5)
+
+        self.assertIn('Merged 0 scan groups', self.compact())
+        print("✓ Monthly scan compaction test passed")
+
+    def test_late_rows_join_the_rollup(self):
+        """Test that scans archived after compaction merge into the existing rollup"""
+        self.compact()
+        late = History.objects.create(user=self.user, points=100, action='scan', material_type='metal')
+        History.objects.filter(pk=late.pk).update(created_at=datetime(2023, 3, 15, tzinfo=dt_timezone.utc))
+        call_command('archive_history', days=365, stdout=StringIO())
+
+        self.assertIn('Merged 1 scan groups', self.compact('--verify'))
+        rollup = HistoryArchive.objects.get(user=self.user, material_type='metal')
+        self.assertEqual((rollup.points, rollup.scan_count), (130, 6))
+        self.assertEqual(rollup.pk, late.pk)
+        self.assertEqual(HistorySummary.objects.get(user=self.user).archived_transactions, 5)
+        print("✓ Late scan compaction test passed")
+
+    def test_feed_renders_monthly_summaries(self):
+        """Test that rollups show up in the feed as their own entry type"""
+        self.compact()
+
+        response = self.client.get(reverse('history-list'), {'page_size': 100})
+        self.assertEqual(response.data['count'], 6)
+        results = response.data['results']
+        self.assertEqual([row['entry_type'] for row in results].count('monthly_summary'), 3)
+        rollup = next(row for row in results if row['entry_type'] == 'monthly_summary')
+        self.assertEqual(rollup['formatted_date'], 'Apr 2023')
+        self.assertEqual(rollup['scan_count'], 2)
+        self.assertEqual(rollup['description'], 'Monthly summary: 2 Plastic scans in April 2023')
+        self.assertEqual(results[0]['entry_type'], 'transaction')
+        self.assertIsNone(results[0]['scan_count'])
+
+        archive = HistoryArchive.objects.filter(user=self.user).order_by('-created_at', '-id')
+        self.assertEqual(
+            serialize_history_rows(archive.values(*ARCHIVE_VALUE_FIELDS)),
+            HistorySerializer(archive, many=True).data,
+        )
+        print("✓ Monthly summary rendering test passed")
+
+    def test_verify_detects_changed_totals(self):
+        """Test that --verify fails when the totals move, and --dry-run changes nothing"""
+        self.assertIn('3 scan groups (12 rows)', self.compact('--dry-run'))
+        self.assertFalse(HistoryArchive.objects.filter(scan_count__isnull=False).exists())
+
+        def lossy(before, chunk_size, verify, on_chunk):
+            HistoryArchive.objects.filter(action='scan').update(points=F('points') - 1)
+            return 0, 0
+
+        with mock.patch('history.management.commands.compact_history.compact_history', lossy):
+            with self.assertRaisesMessage(CommandError, 'Totals differ for 3'):
+                self.compact('--verify')
+        print("✓ Compaction verification test passed")
+
+
+class ReplicaRoutingTest(APITestCase):
+    """Test replica reads with read-your-writes stickiness, using a second SQLite database"""
+
+    def setUp(self):
+        cache.clear()
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+
+        connections.settings['replica'] = dict(
+            connections['default'].settings_dict, NAME=os.path.join(directory, 'replica.sqlite3')
+        )
+        self.addCleanup(connections.settings.pop, 'replica')
+        self.addCleanup(connections.__delitem__, 'replica')
+        self.addCleanup(lambda: connections['replica'].close())
+        with connections['replica'].schema_editor() as editor:
+            for model in [User, History, HistorySummary]:
+                editor.create_model(model)
+
+        patcher = mock.patch.object(routers, 'replica_configured', return_value=True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.user = create_user('replicauser@example.com', '+251911111230')
+        User.objects.using('replica').bulk_create([self.user])
+        self.user._state.db = 'default'
+        self.client.force_authenticate(user=self.user)
+        # The replica lags: it has only the first of the user's three entries
+        for points in [5, 6, 7]:
+            entry = History.objects.create(user=self.user, points=points, action='scan', material_type='metal')
+            if points == 5:
+                History.objects.using('replica').create(
+                    id=entry.id, user_id=self.user.id, points=points, action='scan',
+                    material_type='metal', created_at=entry.created_at
+                )
+
+    def recent_count(self):
+        return self.client.get(reverse('recent-history')).data['count']
+
+    def test_reads_stick_to_primary_after_a_write(self):
+        """Test that a scan pins the user's reads to the primary for the sticky window"""
+        self.assertEqual(self.recent_count(), 1)
+        self.assertEqual(self.client.get(reverse('history-list')).data['count'], 1)
+
+        response = self.client.post(reverse('qr-scan'), {
+            'materialType': 'plastic', 'pointsToAdd': 3, 'date': '2025-01-01T10:00:00Z'
+        }, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(History.objects.using('replica').count(), 1)
+
+        self.assertEqual(self.recent_count(), 4)
+        self.assertEqual(self.client.get(reverse('history-list')).data['count'], 4)
+
+        # Once the pin expires reads go back to the replica
+        cache.clear()
+        self.assertEqual(self.recent_count(), 1)
+        print("✓ Replica stickiness test passed")
+
+    def test_failed_request_does_not_leak_replica_reads(self):
+        """Test that a view raising an exception still resets the replica choice"""
+        with mock.patch('history.views.recent_history', side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                self.client.get(reverse('recent-history'))
+
+        self.assertIsNone(routers._replica_reader.get())
+        self.assertIsNone(routers.ReplicaRouter().db_for_read(History))
+        print("✓ Replica reset on error test passed")
+
+    def test_only_history_reads_inside_replica_views_are_routed(self):
+        """Test that other reads and all writes stay on the primary"""
+        router = routers.ReplicaRouter()
+        self.assertIsNone(router.db_for_read(History))
+
+        routers._replica_reader.set(self.user.id)
+        self.addCleanup(routers._replica_reader.set, None)
+        self.assertEqual(router.db_for_read(History), 'replica')
+        self.assertIsNone(router.db_for_read(User))
+
+        stale = History.objects.using('replica').get()
+        self.assertEqual(router.db_for_write(History, instance=stale), 'default')
+        self.assertIsNone(router.db_for_write(History))
+        print("✓ Replica routing rules test passed")
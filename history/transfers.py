@@ -0,0 +1,85 @@
+# history/transfers.py - Points balance updates done in the database
+from django.contrib.auth import get_user_model
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+
+User = get_user_model()
+
+
+class InsufficientPoints(Exception):
+    def __init__(self, balance):
+        self.balance = balance
+        super().__init__(f"Insufficient points. You have {balance} points.")
+
+
+def _supports_update_returning(connection):
+    if connection.vendor == 'postgresql':
+        return True
+    if connection.vendor == 'sqlite':
+        return connection.Database.sqlite_version_info >= (3, 35)
+    return False
+
+
+def _adjust(connection, user_id, delta, minimum=None):
+    """
+    Add ``delta`` to one balance and return the new value, or None when the
+    row is missing or would drop below ``minimum``.
+    """
+    qn = connection.ops.quote_name
+    table = qn(User._meta.db_table)
+    column = qn('total_points')
+    pk = qn(User._meta.pk.column)
+
+    sql = f"UPDATE {table} SET {column} = {column} + %s WHERE {pk} = %s"
+    params = [delta, user_id]
+    if minimum is not None:
+        sql += f" AND {column} >= %s"
+        params.append(minimum)
+
+    with connection.cursor() as cursor:
+        if _supports_update_returning(connection):
+            cursor.execute(sql + f" RETURNING {column}", params)
+            row = cursor.fetchone()
+            return row[0] if row else None
+
+        cursor.execute(sql, params)
+        if cursor.rowcount == 0:
+            return None
+        cursor.execute(f"SELECT {column} FROM {table} WHERE {pk} = %s", [user_id])
+        return cursor.fetchone()[0]
+
+
+def credit_points(user_id, points, using=DEFAULT_DB_ALIAS):
+    """Add points to a user in one statement and return the new balance."""
+    return _adjust(connections[using], user_id, points)
+
+
+def transfer_points(sender_id, receiver_id, points, using=DEFAULT_DB_ALIAS):
+    """
+    Move points between two users and return (sender_balance, receiver_balance).
+
+    The debit only applies while the sender still has enough points, so the
+    check can't race with another transfer. Rows are updated in primary-key
+    order, which keeps two transfers in opposite directions from deadlocking.
+    Raises InsufficientPoints and rolls back when the debit doesn't apply.
+    """
+    connection = connections[using]
+    balances = {}
+    with transaction.atomic(using=using):
+        steps = sorted([(sender_id, -points), (receiver_id, points)])
+        for user_id, delta in steps:
+            if user_id == sender_id:
+                balance = _adjust(connection, user_id, delta, minimum=points)
+                if balance is None:
+                    current = (
+                        User.objects.using(using)
+                        .filter(pk=sender_id)
+                        .values_list('total_points', flat=True)
+                        .first()
+                    )
+                    raise InsufficientPoints(current or 0)
+            else:
+                balance = _adjust(connection, user_id, delta)
+                if balance is None:
+                    raise User.DoesNotExist(f"User {user_id} does not exist")
+            balances[user_id] = balance
+    return balances[sender_id], balances[receiver_id]
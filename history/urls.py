@@ -4,6 +4,7 @@ from .views import (
     CheckReceiverAPIView,
     TransactionAPIView,
     QRScanAPIView,
+    QRScanBulkAPIView,
     HistoryListAPIView,
     RecentTransactionsAPIView,
 )
@@ -15,6 +16,7 @@ urlpatterns = [
     
     # QR Scan endpoints
     path('qr-scan/', QRScanAPIView.as_view(), name='qr-scan'),
+    path('qr-scan/bulk/', QRScanBulkAPIView.as_view(), name='qr-scan-bulk'),
     
     # History endpoints - REMOVE 'history/' prefix since it's already in the main URL
     path('', HistoryListAPIView.as_view(), name='history-list'),  # This will be /api/points/
@@ -2,16 +2,37 @@ from rest_framework.views import APIView
 from rest_framework.generics import ListAPIView
 from rest_framework.response import Response
 from rest_framework import status, permissions
-from rest_framework.pagination import PageNumberPagination
 from django.db import transaction
-from django.db.models import F, Sum
 from django.utils import timezone
 from datetime import timedelta
 from django.contrib.auth import get_user_model
 from django.core.exceptions import ObjectDoesNotExist
 
-from .models import History
-from .serializers import TransactionSerializer, QRScanSerializer, HistorySerializer
+from trash2cash.routers import ReplicaReadMixin
+from trash2cash.throttling import IPTokenBucketThrottle, UserTokenBucketThrottle
+from user.authentication import TokenUserAuthentication
+from user.identity import resolve_user
+from .models import History, HistoryArchive
+from .pagination import HistoryCursorPagination, HistoryPagination, TieredHistory
+from .serializers import (
+    TransactionSerializer,
+    QRScanSerializer,
+    HistorySerializer,
+    ARCHIVE_VALUE_FIELDS,
+    HISTORY_VALUE_FIELDS,
+    MATERIAL_DISPLAY,
+    serialize_history_rows,
+)
+from .signals import points_scanned, points_transferred
+from .summary import (
+    archived_count,
+    get_summary,
+    record_scan,
+    record_scans,
+    record_transfer,
+    summary_data,
+)
+from .transfers import InsufficientPoints, credit_points, transfer_points
 
 User = get_user_model()
 
@@ -19,6 +40,8 @@ User = get_user_model()
 # ============ TRANSFER VIEWS ============
 class CheckReceiverAPIView(APIView):
     permission_classes = [permissions.IsAuthenticated]
+    throttle_classes = [UserTokenBucketThrottle, IPTokenBucketThrottle]
+    throttle_scope = 'check_receiver'
     
     def post(self, request):
         email_or_phone = request.data.get('email_or_phone', '').strip()
@@ -32,43 +55,43 @@ class CheckReceiverAPIView(APIView):
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        try:
-            receiver = User.objects.get(email=email_or_phone)
-        except User.DoesNotExist:
-            try:
-                receiver = User.objects.get(phone_number=email_or_phone)
-            except User.DoesNotExist:
-                return Response(
-                    {
-                        "success": False,
-                        "message": "User not found",
-                        "exists": False  # This is a boolean
-                    },
-                    status=status.HTTP_200_OK
-                )
-        
-        if receiver == request.user:
-            return Response(
-                {
-                    "success": False,
-                    "message": "Cannot send points to yourself",
-                    "exists": True,
-                    "is_self": True
-                },
-                status=status.HTTP_200_OK
-            )
-        
-        return Response({
-            "success": True,
-            "message": "User found",
-            "exists": True,
-            "user": {  # Make sure this returns a dictionary, not boolean
-                "id": receiver.id,
-                "full_name": f"{receiver.first_name} {receiver.last_name}",
-                "email": receiver.email,
-                "phone_number": receiver.phone_number,
-            }
-        })
+        return receiver_check_response(resolve_user(email_or_phone), request.user)
+
+
+def receiver_check_response(receiver, user):
+    """Response for a check-receiver lookup; shared with the async view."""
+    if receiver is None:
+        return Response(
+            {
+                "success": False,
+                "message": "User not found",
+                "exists": False  # This is a boolean
+            },
+            status=status.HTTP_200_OK
+        )
+    
+    if receiver.pk == user.pk:
+        return Response(
+            {
+                "success": False,
+                "message": "Cannot send points to yourself",
+                "exists": True,
+                "is_self": True
+            },
+            status=status.HTTP_200_OK
+        )
+    
+    return Response({
+        "success": True,
+        "message": "User found",
+        "exists": True,
+        "user": {  # Make sure this returns a dictionary, not boolean
+            "id": receiver.id,
+            "full_name": f"{receiver.first_name} {receiver.last_name}",
+            "email": receiver.email,
+            "phone_number": receiver.phone_number,
+        }
+    })
 
 
 class TransactionAPIView(APIView):
@@ -85,29 +108,43 @@ class TransactionAPIView(APIView):
             sender_name = f"{sender.first_name} {sender.last_name}".strip()
             receiver_name = f"{receiver.first_name} {receiver.last_name}".strip()
 
-            # Update points
-            sender.total_points = F('total_points') - points
-            receiver.total_points = F('total_points') + points
-            
-            sender.save(update_fields=['total_points'])
-            receiver.save(update_fields=['total_points'])
-            
-            sender.refresh_from_db()
-            receiver.refresh_from_db()
+            try:
+                sender_points, receiver_points = transfer_points(sender.pk, receiver.pk, points)
+            except InsufficientPoints as e:
+                return Response(
+                    {
+                        "success": False,
+                        "message": "Transfer failed",
+                        "errors": {"non_field_errors": [str(e)]}
+                    },
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            sender.total_points = sender_points
+            receiver.total_points = receiver_points
             
             # Create history records
-            History.objects.create(
-                user=sender,
+            History.objects.bulk_create([
+                History(
+                    user=sender,
+                    points=points,
+                    action='transfer_out',
+                    description=f"Sent {points} points to {receiver_name}"
+                ),
+                History(
+                    user=receiver,
+                    points=points,
+                    action='transfer_in',
+                    description=f"Received {points} points from {sender_name}"
+                ),
+            ])
+            record_transfer(sender, receiver, points)
+            points_transferred.send(
+                sender=History,
+                sender_id=sender.pk,
+                receiver_id=receiver.pk,
                 points=points,
-                action='transfer_out',
-                description=f"Sent {points} points to {receiver_name}"
-            )
-            
-            History.objects.create(
-                user=receiver,
-                points=points,
-                action='transfer_in',
-                description=f"Received {points} points from {sender_name}"
+                sender_balance=sender_points,
+                receiver_balance=receiver_points,
             )
 
             return Response(
@@ -136,6 +173,8 @@ class TransactionAPIView(APIView):
 # ============ QR SCAN VIEWS ============
 class QRScanAPIView(APIView):
     permission_classes = [permissions.IsAuthenticated]
+    throttle_classes = [UserTokenBucketThrottle, IPTokenBucketThrottle]
+    throttle_scope = 'qr_scan'
     
     @transaction.atomic
     def post(self, request):
@@ -155,16 +194,10 @@ class QRScanAPIView(APIView):
         scan_date = serializer.validated_data['date']
         user = request.user
         
-        material_display = {
-            'plastic': 'Plastic',
-            'metal': 'Metal',
-            'non-recycle': 'Non-Recyclable'
-        }.get(material_type, material_type)
+        material_display = MATERIAL_DISPLAY.get(material_type, material_type)
         
         # Update user's points
-        user.total_points = F('total_points') + points
-        user.save(update_fields=['total_points'])
-        user.refresh_from_db()
+        user.total_points = credit_points(user.pk, points)
         
         # Create scan history record
         description = f"QR Scan: Recycled {material_display}"
@@ -177,6 +210,13 @@ class QRScanAPIView(APIView):
             description=description,
             created_at=scan_date
         )
+        record_scan(user, points, material_type)
+        points_scanned.send(
+            sender=History,
+            user_id=user.pk,
+            scans=[(material_type, points)],
+            balance=user.total_points,
+        )
         
         return Response(
             {
@@ -193,85 +233,251 @@ class QRScanAPIView(APIView):
         )
 
 
+class QRScanBulkAPIView(APIView):
+    """
+    Ingest scans the app buffered while offline.
+    
+    Every item is validated on its own; the valid ones are written with one
+    bulk insert and a single summed points update, and the response reports
+    the outcome of each item in request order.
+    
+    Each scan takes a token from the same qr_scan buckets as a single scan,
+    so a batch can't carry more scans than the buckets hold.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+    throttle_classes = [UserTokenBucketThrottle, IPTokenBucketThrottle]
+    throttle_scope = 'qr_scan'
+    max_batch_size = 500
+    
+    def get_scans(self, request):
+        items = request.data
+        if isinstance(items, dict):
+            items = items.get('scans')
+        return items
+    
+    def get_max_batch_size(self):
+        capacities = [throttle.capacity(self) for throttle in self.get_throttles()]
+        return min([self.max_batch_size] + [c for c in capacities if c is not None])
+    
+    def throttle_cost(self, request):
+        items = self.get_scans(request)
+        if not isinstance(items, list) or not items or len(items) > self.get_max_batch_size():
+            # Rejected by post() before anything is scanned
+            return 1
+        return len(items)
+    
+    def post(self, request):
+        items = self.get_scans(request)
+        
+        if not isinstance(items, list) or not items:
+            return Response(
+                {
+                    "success": False,
+                    "message": "Expected a non-empty list of scans",
+                },
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        max_batch_size = self.get_max_batch_size()
+        if len(items) > max_batch_size:
+            return Response(
+                {
+                    "success": False,
+                    "message": f"At most {max_batch_size} scans can be sent at once",
+                },
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        user = request.user
+        results = []
+        rows = []
+        for index, item in enumerate(items):
+            serializer = QRScanSerializer(data=item)
+            if not serializer.is_valid():
+                results.append({
+                    "index": index,
+                    "success": False,
+                    "errors": serializer.errors,
+                })
+                continue
+            
+            material_type = serializer.validated_data['materialType']
+            points = serializer.validated_data['pointsToAdd']
+            material_display = MATERIAL_DISPLAY.get(material_type, material_type)
+            rows.append(History(
+                user=user,
+                points=points,
+                action='scan',
+                material_type=material_type,
+                description=f"QR Scan: Recycled {material_display}",
+                created_at=serializer.validated_data['date']
+            ))
+            results.append({
+                "index": index,
+                "success": True,
+                "material": material_display,
+                "points_added": points,
+                "scan_date": serializer.validated_data['date'],
+            })
+        
+        if not rows:
+            return Response(
+                {
+                    "success": False,
+                    "message": "No valid scans in batch",
+                    "results": results,
+                },
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        total_added = sum(row.points for row in rows)
+        with transaction.atomic():
+            History.objects.bulk_create(rows)
+            user.total_points = credit_points(user.pk, total_added)
+            scans = [(row.material_type, row.points) for row in rows]
+            record_scans(user, scans)
+            points_scanned.send(
+                sender=History,
+                user_id=user.pk,
+                scans=scans,
+                balance=user.total_points,
+            )
+        
+        return Response(
+            {
+                "success": True,
+                "message": f"{total_added} points added from {len(rows)} scans",
+                "data": {
+                    "total_points": user.total_points,
+                    "points_added": total_added,
+                    "accepted": len(rows),
+                    "rejected": len(items) - len(rows),
+                },
+                "results": results,
+            },
+            status=status.HTTP_200_OK
+        )
+
+
 # ============ HISTORY VIEWS ============
-class HistoryPagination(PageNumberPagination):
-    page_size = 20
-    page_size_query_param = 'page_size'
-    max_page_size = 100
+def history_start_date(params):
+    """Oldest created_at the feed's ?days= filter lets through, or None."""
+    days = params.get('days')
+    if days and days.isdigit():
+        return timezone.now() - timedelta(days=int(days))
+    return None
+
+
+def filter_history(queryset, params, start_date=None):
+    """Apply the feed's ?action= and ?days= filters."""
+    action = params.get('action')
+    if start_date is None:
+        start_date = history_start_date(params)
+    
+    if action and action != 'all':
+        queryset = queryset.filter(action=action)
+    
+    if start_date is not None:
+        queryset = queryset.filter(created_at__gte=start_date)
+    
+    return queryset
 
 
-class HistoryListAPIView(ListAPIView):
+def history_feed(user, params, summary):
+    """
+    The user's filtered feed as values() rows over History and, only when
+    the ?days= filter reaches back past the user's archived rows, the archive.
+    """
+    start_date = history_start_date(params)
+    hot = filter_history(History.objects.filter(user=user), params, start_date)
+    hot = hot.values(*HISTORY_VALUE_FIELDS)
+    boundary = summary.archived_until
+    if boundary is None or (start_date is not None and start_date > boundary):
+        return TieredHistory(hot)
+    
+    archive = filter_history(HistoryArchive.objects.filter(user=user), params, start_date)
+    return TieredHistory(
+        hot,
+        archive.values(*ARCHIVE_VALUE_FIELDS),
+        boundary,
+        # Without ?days= the summary's counters give the archive's share of the count
+        archived_count(summary, params.get('action')) if start_date is None else None,
+    )
+
+
+class HistoryListAPIView(ReplicaReadMixin, ListAPIView):
     serializer_class = HistorySerializer
     permission_classes = [permissions.IsAuthenticated]
     pagination_class = HistoryPagination
     
+    @property
+    def paginator(self):
+        """
+        Use keyset pagination when the client asks for it with
+        ?pagination=cursor or by sending a cursor.
+        """
+        if not hasattr(self, '_paginator'):
+            params = self.request.query_params
+            if params.get('pagination') == 'cursor' or 'cursor' in params:
+                self._paginator = HistoryCursorPagination()
+            else:
+                self._paginator = self.pagination_class()
+        return self._paginator
+    
     def get_queryset(self):
-        user = self.request.user
-        
-        action = self.request.query_params.get('action')
-        days = self.request.query_params.get('days')
-        
-        queryset = History.objects.filter(user=user)
-        
-        if action and action != 'all':
-            queryset = queryset.filter(action=action)
-        
-        if days and days.isdigit():
-            days_int = int(days)
-            start_date = timezone.now() - timedelta(days=days_int)
-            queryset = queryset.filter(created_at__gte=start_date)
-        
-        return queryset
+        return filter_history(
+            History.objects.filter(user=self.request.user), self.request.query_params
+        )
     
     def list(self, request, *args, **kwargs):
-        response = super().list(request, *args, **kwargs)
-        
+        # The summary says whether the archive needs reading at all
         user = request.user
-        all_history = History.objects.filter(user=user)
-        
-        total_received = all_history.filter(action='transfer_in').aggregate(
-            total=Sum('points')
-        )['total'] or 0
-        
-        total_sent = all_history.filter(action='transfer_out').aggregate(
-            total=Sum('points')
-        )['total'] or 0
+        summary = get_summary(user)
         
-        total_scanned = all_history.filter(action='scan').aggregate(
-            total=Sum('points')
-        )['total'] or 0
+        # Page over plain values() rows and render them with the fast path
+        feed = history_feed(user, request.query_params, summary)
+        page = self.paginate_queryset(feed)
+        if page is not None:
+            response = self.get_paginated_response(serialize_history_rows(page))
+        else:
+            response = Response(serialize_history_rows(feed[0:feed.count()]))
         
         response.data.update({
-            'summary': {
-                'total_transactions': all_history.count(),
-                'total_points_received': total_received,
-                'total_points_sent': total_sent,
-                'total_points_scanned': total_scanned,
-                'net_points': user.total_points,
-            }
+            'summary': summary_data(summary, user)
         })
         
         return response
 
 
-class RecentTransactionsAPIView(APIView):
+class RecentTransactionsAPIView(ReplicaReadMixin, APIView):
+    # Read-only poll: trust the token claims instead of loading the user
+    authentication_classes = [TokenUserAuthentication]
     permission_classes = [permissions.IsAuthenticated]
     
     def get(self, request):
-        user = request.user
-        limit = request.query_params.get('limit', 10)
-        
-        try:
-            limit = int(limit)
-        except ValueError:
-            limit = 10
-        
-        recent_transactions = History.objects.filter(user=user).order_by('-created_at')[:limit]
-        
-        serializer = HistorySerializer(recent_transactions, many=True)
-        
-        return Response({
-            "success": True,
-            "transactions": serializer.data,
-            "count": recent_transactions.count()
-        })
\ No newline at end of file
+        recent_transactions = recent_history(request.user, request.query_params)
+        return recent_response(serialize_history_rows(recent_transactions))
+
+
+def recent_history(user, params):
+    """values() rows for the recent feed, limited by ?limit= (default 10)."""
+    limit = params.get('limit', 10)
+    
+    try:
+        limit = int(limit)
+    except ValueError:
+        limit = 10
+    
+    return (
+        History.objects.filter(user_id=user.id)
+        .order_by('-created_at')
+        .values(*HISTORY_VALUE_FIELDS)[:limit]
+    )
+
+
+def recent_response(transactions):
+    return Response({
+        "success": True,
+        "transactions": transactions,
+        "count": len(transactions)
+    })
\ No newline at end of file
@@ -0,0 +1,233 @@
+# leaderboard/boards.py - Board registry, snapshot persistence and feed
+import threading
+import time
+import uuid
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from django.db.models import F, Sum
+from django.utils import timezone
+
+from history.models import History, HistoryArchive
+from .models import LeaderboardScore
+from .ranking import RankedBoard
+
+User = get_user_model()
+
+GLOBAL = 'global'
+MATERIALS = [material for material, _ in History.MATERIAL_CHOICES]
+
+# Rows are re-read for this long before the last sync as well, covering
+# transactions still open at the time and clock skew between servers
+SYNC_SLACK = timedelta(seconds=60)
+GENERATION_KEY = 'leaderboard-generation'
+
+# board key -> _LoadedBoard
+_boards = {}
+_lock = threading.Lock()
+
+
+class _LoadedBoard:
+    def __init__(self, key):
+        self.generation = cache.get(GENERATION_KEY)
+        self.synced_at = timezone.now()
+        self.board = RankedBoard(
+            LeaderboardScore.objects.filter(board=key).values_list('user_id', 'score')
+        )
+        self.checked_at = time.monotonic()
+        self.syncing = threading.Lock()
+
+    def sync(self, key):
+        """Apply the rows updated since the last sync; returns False when a full reload is due."""
+        if cache.get(GENERATION_KEY) != self.generation:
+            return False
+        started = timezone.now()
+        updated = LeaderboardScore.objects.filter(
+            board=key, updated_at__gte=self.synced_at - SYNC_SLACK
+        ).values_list('user_id', 'score')
+        for user_id, score in updated:
+            self.board.set_score(user_id, score)
+        self.synced_at = started
+        self.checked_at = time.monotonic()
+        return True
+
+
+def weekly_key(moment=None):
+    year, week, _ = (moment or timezone.now()).isocalendar()
+    return f"weekly:{year}-W{week:02d}"
+
+
+def material_key(material_type):
+    return f"material:{material_type}"
+
+
+def board_key(name):
+    """Map a public board name to its storage key, or None when unknown."""
+    if name == 'global':
+        return GLOBAL
+    if name == 'weekly':
+        return weekly_key()
+    if name in MATERIALS:
+        return material_key(name)
+    return None
+
+
+def get_board(key):
+    """
+    Return the in-process board, bringing it up to date with the snapshot
+    table once it is older than LEADERBOARD['REFRESH_SECONDS'] so other
+    workers' updates show up.
+
+    Only the rows changed since the last sync are read, by one thread at a
+    time; the others keep serving the board as it is meanwhile. The whole
+    board is reloaded only after rebuild_boards() or a user deletion in
+    some worker, which change the shared generation stamp.
+    """
+    entry = _boards.get(key)
+    if entry is None:
+        with _lock:
+            entry = _boards.get(key)
+            if entry is None:
+                entry = _boards[key] = _LoadedBoard(key)
+                _evict_old_weeks()
+        return entry.board
+
+    if time.monotonic() - entry.checked_at < settings.LEADERBOARD['REFRESH_SECONDS']:
+        return entry.board
+    if not entry.syncing.acquire(blocking=False):
+        return entry.board
+    try:
+        if time.monotonic() - entry.checked_at < settings.LEADERBOARD['REFRESH_SECONDS']:
+            return entry.board
+        if entry.sync(key):
+            return entry.board
+        reloaded = _LoadedBoard(key)
+        with _lock:
+            _boards[key] = reloaded
+        return reloaded.board
+    finally:
+        entry.syncing.release()
+
+
+def _evict_old_weeks():
+    """Drop weekly boards from before last week; call with _lock held."""
+    now = timezone.now()
+    keep = {weekly_key(now), weekly_key(now - timedelta(weeks=1))}
+    for key in [key for key in _boards if key.startswith('weekly:') and key not in keep]:
+        del _boards[key]
+
+
+def reset_boards():
+    with _lock:
+        _boards.clear()
+
+
+def bump_generation():
+    """Make every worker reload its boards in full at its next refresh."""
+    cache.set(GENERATION_KEY, uuid.uuid4().hex, timeout=None)
+    reset_boards()
+
+
+def _loaded(key):
+    entry = _boards.get(key)
+    return entry.board if entry is not None else None
+
+
+def _store_score(key, user_id, score):
+    LeaderboardScore.objects.bulk_create(
+        [LeaderboardScore(board=key, user_id=user_id, score=score)],
+        update_conflicts=True,
+        unique_fields=['board', 'user'],
+        update_fields=['score', 'updated_at'],
+    )
+
+
+def _add_score(key, user_id, delta):
+    rows = LeaderboardScore.objects.filter(board=key, user_id=user_id)
+    # update() skips auto_now, and get_board() syncs by updated_at
+    if rows.update(score=F('score') + delta, updated_at=timezone.now()):
+        return
+    try:
+        with transaction.atomic():
+            LeaderboardScore.objects.create(board=key, user_id=user_id, score=delta)
+    except IntegrityError:
+        # Another request created the row first
+        rows.update(score=F('score') + delta, updated_at=timezone.now())
+
+
+def record_balance(user_id, balance):
+    """Store a user's new balance on the global board."""
+    _store_score(GLOBAL, user_id, balance)
+
+    def apply():
+        board = _loaded(GLOBAL)
+        if board is not None:
+            board.set_score(user_id, balance)
+
+    transaction.on_commit(apply)
+
+
+def record_scans(user_id, scans):
+    """Add scanned points to the weekly and per-material boards."""
+    deltas = defaultdict(int)
+    week = weekly_key()
+    for material_type, points in scans:
+        deltas[week] += points
+        if material_type:
+            deltas[material_key(material_type)] += points
+
+    for key, delta in deltas.items():
+        _add_score(key, user_id, delta)
+
+    def apply():
+        for key, delta in deltas.items():
+            board = _loaded(key)
+            if board is not None:
+                board.add(user_id, delta)
+
+    transaction.on_commit(apply)
+
+
+@transaction.atomic
+def rebuild_boards():
+    """Recompute every snapshot row from User balances and History scans, archived ones included."""
+    LeaderboardScore.objects.all().delete()
+
+    rows = [
+        LeaderboardScore(board=GLOBAL, user_id=user_id, score=points)
+        for user_id, points in User.objects.values_list('id', 'total_points')
+    ]
+
+    now = timezone.now()
+    week_start = (now - timedelta(days=now.weekday())).replace(
+        hour=0, minute=0, second=0, microsecond=0
+    )
+    weekly = defaultdict(int)
+    by_material = defaultdict(int)
+    for model in (History, HistoryArchive):
+        scans = model.objects.filter(action='scan').order_by()
+        for row in scans.filter(created_at__gte=week_start).values('user_id').annotate(total=Sum('points')):
+            weekly[row['user_id']] += row['total']
+        for row in (
+            scans.exclude(material_type__isnull=True)
+            .values('user_id', 'material_type')
+            .annotate(total=Sum('points'))
+        ):
+            by_material[row['user_id'], row['material_type']] += row['total']
+
+    rows.extend(
+        LeaderboardScore(board=weekly_key(now), user_id=user_id, score=total)
+        for user_id, total in weekly.items()
+    )
+    rows.extend(
+        LeaderboardScore(board=material_key(material), user_id=user_id, score=total)
+        for (user_id, material), total in by_material.items()
+    )
+
+    LeaderboardScore.objects.bulk_create(rows, batch_size=1000)
+    transaction.on_commit(bump_generation)
+    return len(rows)
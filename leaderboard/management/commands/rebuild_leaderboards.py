@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from leaderboard.boards import rebuild_boards
+
+
+class Command(BaseCommand):
+    help = "Rebuild the leaderboard snapshot from user balances and scan history"
+
+    def handle(self, *args, **options):
+        count = rebuild_boards()
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {count} leaderboard entries"))
@@ -0,0 +1,29 @@
+from django.db import models
+from django.contrib.auth import get_user_model
+
+User = get_user_model()
+
+
+class LeaderboardScore(models.Model):
+    """
+    Persistent snapshot of one user's score on one board.
+
+    Boards are keyed as 'global', 'weekly:<iso-year>-W<week>' and
+    'material:<material_type>'. Workers load their in-process rankings
+    from these rows.
+    """
+    board = models.CharField(max_length=40)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='leaderboard_scores')
+    score = models.IntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['board', 'user'], name='leaderboard_board_user_unique'),
+        ]
+        indexes = [
+            models.Index(fields=['board', '-score'], name='leaderboard_board_score_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.board} - user {self.user_id} - {self.score} points"
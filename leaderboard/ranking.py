@@ -0,0 +1,79 @@
+# leaderboard/ranking.py - In-process ranked scoreboard
+import threading
+from bisect import bisect_left, insort
+
+
+class RankedBoard:
+    """
+    Scores kept as a sorted list of (-score, user_id) keys.
+
+    Rank and neighbor lookups are binary searches; a score change is a
+    removal plus an insort. Equal scores share a rank ("1224" ranking) and
+    are listed by user id.
+    """
+
+    def __init__(self, scores=None):
+        self._lock = threading.Lock()
+        self._scores = {}
+        self._keys = []
+        if scores:
+            self._scores = dict(scores)
+            self._keys = sorted((-score, user_id) for user_id, score in self._scores.items())
+
+    def __len__(self):
+        return len(self._keys)
+
+    def __contains__(self, user_id):
+        return user_id in self._scores
+
+    def _remove(self, user_id):
+        score = self._scores.pop(user_id, None)
+        if score is not None:
+            index = bisect_left(self._keys, (-score, user_id))
+            del self._keys[index]
+
+    def set_score(self, user_id, score):
+        with self._lock:
+            self._remove(user_id)
+            self._scores[user_id] = score
+            insort(self._keys, (-score, user_id))
+
+    def add(self, user_id, delta):
+        with self._lock:
+            score = self._scores.get(user_id, 0) + delta
+            self._remove(user_id)
+            self._scores[user_id] = score
+            insort(self._keys, (-score, user_id))
+            return score
+
+    def score(self, user_id):
+        return self._scores.get(user_id)
+
+    def rank(self, user_id):
+        """1-based rank, or None when the user isn't on the board."""
+        with self._lock:
+            score = self._scores.get(user_id)
+            if score is None:
+                return None
+            # (-score,) sorts before every key holding that score
+            return bisect_left(self._keys, (-score,)) + 1
+
+    def _entries(self, start, stop):
+        return [
+            (bisect_left(self._keys, (neg_score,)) + 1, user_id, -neg_score)
+            for neg_score, user_id in self._keys[start:stop]
+        ]
+
+    def top(self, limit):
+        """[(rank, user_id, score)] for the first ``limit`` entries."""
+        with self._lock:
+            return self._entries(0, limit)
+
+    def around(self, user_id, neighbors):
+        """Entries within ``neighbors`` positions of the user, including the user."""
+        with self._lock:
+            score = self._scores.get(user_id)
+            if score is None:
+                return []
+            position = bisect_left(self._keys, (-score, user_id))
+            return self._entries(max(position - neighbors, 0), position + neighbors + 1)
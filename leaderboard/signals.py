@@ -0,0 +1,33 @@
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from history.signals import points_scanned, points_transferred
+from . import boards
+
+User = get_user_model()
+
+
+@receiver(points_scanned)
+def update_boards_on_scan(sender, user_id, scans, balance, **kwargs):
+    boards.record_balance(user_id, balance)
+    boards.record_scans(user_id, scans)
+
+
+@receiver(points_transferred)
+def update_boards_on_transfer(sender, sender_id, receiver_id, sender_balance, receiver_balance, **kwargs):
+    boards.record_balance(sender_id, sender_balance)
+    boards.record_balance(receiver_id, receiver_balance)
+
+
+@receiver(post_save, sender=User)
+def add_new_user_to_global_board(sender, instance, created, **kwargs):
+    if created:
+        boards.record_balance(instance.pk, instance.total_points)
+
+
+@receiver(post_delete, sender=User)
+def drop_deleted_user_from_boards(sender, instance, **kwargs):
+    # Their rows are gone, which an incremental sync can't see
+    transaction.on_commit(boards.bump_generation)
@@ -0,0 +1,191 @@
+from datetime import timedelta
+
+from django.test import SimpleTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.db import connection
+from django.utils import timezone
+from django.urls import reverse
+from django.core.management import call_command
+from rest_framework.test import APITestCase
+from django.contrib.auth import get_user_model
+
+from . import boards
+from .models import LeaderboardScore
+from .ranking import RankedBoard
+
+User = get_user_model()
+
+
+class RankedBoardTest(SimpleTestCase):
+    """Test the in-process ranked structure"""
+
+    def test_rank_and_ties(self):
+        """Test that equal scores share a rank"""
+        board = RankedBoard([(1, 50), (2, 80), (3, 50), (4, 10)])
+
+        self.assertEqual(board.rank(2), 1)
+        self.assertEqual(board.rank(1), 2)
+        self.assertEqual(board.rank(3), 2)
+        self.assertEqual(board.rank(4), 4)
+        self.assertIsNone(board.rank(99))
+        self.assertEqual(board.top(2), [(1, 2, 80), (2, 1, 50)])
+        print("✓ Ranked board tie test passed")
+
+    def test_updates_move_users(self):
+        """Test that score changes re-rank users"""
+        board = RankedBoard([(1, 50), (2, 80), (3, 20)])
+
+        board.add(3, 70)
+        board.set_score(2, 5)
+
+        self.assertEqual(board.top(3), [(1, 3, 90), (2, 1, 50), (3, 2, 5)])
+        self.assertEqual(board.around(1, 1), [(1, 3, 90), (2, 1, 50), (3, 2, 5)])
+        self.assertEqual(len(board), 3)
+        print("✓ Ranked board update test passed")
+
+
+class LeaderboardAPITest(APITestCase):
+    """Test leaderboard endpoints fed by scans and transfers"""
+
+    def setUp(self):
+        boards.reset_boards()
+        self.alice = User.objects.create_user(
+            email='boardalice@example.com', first_name='Alice', last_name='Board',
+            phone_number='+251911111401', password='testpass123'
+        )
+        self.bob = User.objects.create_user(
+            email='boardbob@example.com', first_name='Bob', last_name='Board',
+            phone_number='+251911111402', password='testpass123'
+        )
+        self.client.force_authenticate(user=self.alice)
+
+    def test_scans_and_transfers_feed_boards(self):
+        """Test that global, weekly and material boards follow points changes"""
+        self.client.post(reverse('qr-scan'), {
+            'materialType': 'plastic', 'pointsToAdd': 30, 'date': '2025-01-01T10:00:00Z'
+        }, format='json')
+        self.client.post(reverse('points-transfer'), {
+            'receiver_email_or_phone': self.bob.email, 'points': 35
+        }, format='json')
+
+        response = self.client.get(reverse('leaderboard', args=['global']))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [(e['full_name'], e['score']) for e in response.data['entries']],
+            [('Bob Board', 45), ('Alice Board', 5)]
+        )
+
+        response = self.client.get(reverse('leaderboard', args=['weekly']))
+        self.assertEqual([e['score'] for e in response.data['entries']], [30])
+
+        response = self.client.get(reverse('leaderboard-rank', args=['plastic']))
+        self.assertEqual(response.data['rank'], 1)
+        self.assertEqual(response.data['score'], 30)
+        self.assertTrue(response.data['neighbors'][0]['is_me'])
+        print("✓ Leaderboard feed test passed")
+
+    def test_rank_lookup_does_not_scan_users(self):
+        """Test that a rank lookup reads the snapshot once and no user rows"""
+        boards.get_board(boards.GLOBAL)
+
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('leaderboard-rank', args=['global']), {'neighbors': 0})
+
+        self.assertEqual(response.data['rank'], 1)
+        self.assertEqual(response.data['total_ranked'], 2)
+        print("✓ Leaderboard rank query test passed")
+
+    def test_unknown_board(self):
+        """Test that unknown boards return 404"""
+        response = self.client.get(reverse('leaderboard', args=['glass']))
+        self.assertEqual(response.status_code, 404)
+        print("✓ Unknown leaderboard test passed")
+
+    def test_rebuild_command(self):
+        """Test that the snapshot can be rebuilt from balances"""
+        LeaderboardScore.objects.all().delete()
+        User.objects.filter(pk=self.bob.pk).update(total_points=99)
+
+        call_command('rebuild_leaderboards', verbosity=0)
+
+        self.assertEqual(
+            LeaderboardScore.objects.get(board=boards.GLOBAL, user=self.bob).score, 99
+        )
+        print("✓ Leaderboard rebuild test passed")
+
+
+@override_settings(LEADERBOARD={'REFRESH_SECONDS': 0})
+class BoardRefreshTest(APITestCase):
+    """Test how workers keep their in-process boards in step with the snapshot"""
+
+    def setUp(self):
+        boards.reset_boards()
+        self.users = [
+            User.objects.create_user(
+                email=f'refresh{i}@example.com', first_name='Refresh', last_name=str(i),
+                phone_number=f'+25191111150{i}', password='testpass123'
+            )
+            for i in range(3)
+        ]
+        key = boards.material_key('plastic')
+        for i, user in enumerate(self.users):
+            LeaderboardScore.objects.create(board=key, user=user, score=10 * (i + 1))
+        LeaderboardScore.objects.filter(board=key).update(updated_at=timezone.now() - timedelta(hours=1))
+
+    def tearDown(self):
+        boards.reset_boards()
+
+    def test_refresh_reads_only_changed_rows(self):
+        """Test that a refresh applies other workers' changes without reloading the board"""
+        key = boards.material_key('plastic')
+        board = boards.get_board(key)
+        # As another worker would: the row changes, this process isn't told
+        boards._add_score(key, self.users[0].pk, 25)
+
+        with CaptureQueriesContext(connection) as queries:
+            self.assertIs(boards.get_board(key), board)
+        self.assertEqual(len(queries), 1)
+        self.assertIn('updated_at', queries[0]['sql'])
+        self.assertEqual(board.rank(self.users[0].pk), 1)
+        self.assertEqual(board.score(self.users[0].pk), 35)
+        print("✓ Incremental board refresh test passed")
+
+    def test_one_refresh_at_a_time(self):
+        """Test that requests arriving during a refresh get the current board without querying"""
+        key = boards.material_key('plastic')
+        board = boards.get_board(key)
+        entry = boards._boards[key]
+
+        with entry.syncing:
+            with self.assertNumQueries(0):
+                self.assertIs(boards.get_board(key), board)
+        print("✓ Board refresh lock test passed")
+
+    def test_user_deletion_reloads_boards(self):
+        """Test that a deleted user leaves the board at the next refresh"""
+        key = boards.material_key('plastic')
+        board = boards.get_board(key)
+        entry = boards._boards[key]
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.users[2].delete()
+        # Another worker still has the board; only the shared stamp tells it
+        boards._boards[key] = entry
+
+        self.assertIsNot(boards.get_board(key), board)
+        self.assertNotIn(self.users[2].pk, boards.get_board(key))
+        self.assertEqual(len(boards.get_board(key)), 2)
+        print("✓ Board reload after deletion test passed")
+
+    def test_old_weeks_evicted(self):
+        """Test that weekly boards before last week are dropped"""
+        now = timezone.now()
+        for weeks in [3, 1]:
+            boards.get_board(boards.weekly_key(now - timedelta(weeks=weeks)))
+        boards.get_board(boards.weekly_key(now))
+
+        self.assertEqual(
+            sorted(key for key in boards._boards if key.startswith('weekly:')),
+            sorted([boards.weekly_key(now - timedelta(weeks=1)), boards.weekly_key(now)])
+        )
+        print("✓ Weekly board eviction test passed")
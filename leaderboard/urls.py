@@ -0,0 +1,9 @@
+# leaderboard/urls.py
+from django.urls import path
+from .views import LeaderboardAPIView, LeaderboardRankAPIView
+
+urlpatterns = [
+    # Boards: global, weekly, plastic, metal, non-recycle
+    path('<str:board>/', LeaderboardAPIView.as_view(), name='leaderboard'),
+    path('<str:board>/me/', LeaderboardRankAPIView.as_view(), name='leaderboard-rank'),
+]
@@ -0,0 +1,85 @@
+from rest_framework.views import APIView
+from rest_framework.response import Response
+from rest_framework import status, permissions
+from django.contrib.auth import get_user_model
+
+from . import boards
+
+User = get_user_model()
+
+
+def _int_param(request, name, default, maximum):
+    try:
+        value = int(request.query_params.get(name, default))
+    except ValueError:
+        return default
+    return max(0, min(value, maximum))
+
+
+def _describe(entries, current_user_id):
+    """Attach names to (rank, user_id, score) entries with one primary-key lookup."""
+    names = {
+        row['id']: f"{row['first_name']} {row['last_name']}"
+        for row in User.objects.filter(pk__in=[user_id for _, user_id, _ in entries])
+        .values('id', 'first_name', 'last_name')
+    }
+    return [
+        {
+            "rank": rank,
+            "user_id": user_id,
+            "full_name": names.get(user_id, ''),
+            "score": score,
+            "is_me": user_id == current_user_id,
+        }
+        for rank, user_id, score in entries
+    ]
+
+
+def _unknown_board(board):
+    return Response(
+        {
+            "success": False,
+            "message": f"Unknown leaderboard '{board}'",
+        },
+        status=status.HTTP_404_NOT_FOUND
+    )
+
+
+class LeaderboardAPIView(APIView):
+    permission_classes = [permissions.IsAuthenticated]
+    
+    def get(self, request, board):
+        key = boards.board_key(board)
+        if key is None:
+            return _unknown_board(board)
+        
+        limit = _int_param(request, 'limit', 10, 100)
+        entries = boards.get_board(key).top(limit)
+        
+        return Response({
+            "success": True,
+            "board": board,
+            "entries": _describe(entries, request.user.id),
+        })
+
+
+class LeaderboardRankAPIView(APIView):
+    permission_classes = [permissions.IsAuthenticated]
+    
+    def get(self, request, board):
+        key = boards.board_key(board)
+        if key is None:
+            return _unknown_board(board)
+        
+        neighbors = _int_param(request, 'neighbors', 2, 25)
+        ranked = boards.get_board(key)
+        user_id = request.user.id
+        
+        return Response({
+            "success": True,
+            "board": board,
+            "rank": ranked.rank(user_id),
+            "score": ranked.score(user_id),
+            "total_ranked": len(ranked),
+            "neighbors": _describe(ranked.around(user_id, neighbors), user_id),
+        })
@@ -0,0 +1,8 @@
+# trash2cash/benchmarking.py - Helpers shared by the benchmark commands
+import math
+
+
+def percentile(samples, pct):
+    """Nearest-rank ``pct`` percentile of ``samples``."""
+    ordered = sorted(samples)
+    return ordered[max(math.ceil(pct * len(ordered) / 100) - 1, 0)]
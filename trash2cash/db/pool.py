@@ -0,0 +1,135 @@
+# trash2cash/db/pool.py - In-process connection pool for Django database backends
+import os
+import threading
+import time
+from collections import deque
+
+DEFAULT_POOL = {
+    'MAX_SIZE': 4,
+    # Idle connections older than this are closed instead of reused; keep it
+    # under the server's idle timeout (Neon suspends idle compute after 5 min)
+    'MAX_IDLE': 240,
+    # Connections idle for longer than this are pinged before being handed out
+    'CHECK_AFTER': 30,
+    # Recycle connections after this many seconds regardless of use
+    'MAX_LIFETIME': 1800,
+}
+
+# pool key -> deque of (raw connection, created_at, returned_at)
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def _pool_for(key):
+    with _pools_lock:
+        return _pools.setdefault(key, deque())
+
+
+def clear_pools():
+    """Close every idle pooled connection (tests, shutdown, after fork)."""
+    with _pools_lock:
+        pools = list(_pools.values())
+    for pool in pools:
+        while True:
+            try:
+                raw, _, _ = pool.pop()
+            except IndexError:
+                break
+            _close_quietly(raw)
+
+
+def pool_size(key=None):
+    with _pools_lock:
+        if key is not None:
+            return len(_pools.get(key, ()))
+        return sum(len(pool) for pool in _pools.values())
+
+
+def _forget_pools():
+    # A forked child must not reuse (or close) sockets that belong to its parent
+    global _pools_lock
+    _pools.clear()
+    _pools_lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_forget_pools)
+
+
+def _close_quietly(raw):
+    try:
+        raw.close()
+    except Exception:
+        pass
+
+
+class PooledDatabaseWrapperMixin:
+    """
+    Hand back raw connections to a per-process pool on close() and reuse
+    them on connect(), skipping the connect and TLS handshake.
+
+    Mixed into a backend's DatabaseWrapper (see trash2cash.db.backends).
+    Tuned by a 'POOL' dict in the DATABASES entry, see DEFAULT_POOL.
+    Connections are only returned when no transaction is open, autocommit
+    is as configured and no error occurred since the last commit, so
+    state never leaks between requests. Works alongside CONN_MAX_AGE,
+    which then decides when a connection goes back to the pool rather
+    than when it's torn down.
+    """
+
+    @property
+    def pool_options(self):
+        return {**DEFAULT_POOL, **self.settings_dict.get('POOL', {})}
+
+    @property
+    def pool_key(self):
+        s = self.settings_dict
+        return (self.vendor, self.alias, str(s['NAME']), s.get('HOST'), s.get('PORT'), s.get('USER'))
+
+    def get_new_connection(self, conn_params):
+        pool = _pool_for(self.pool_key)
+        options = self.pool_options
+        now = time.monotonic()
+        while True:
+            try:
+                raw, created_at, returned_at = pool.pop()
+            except IndexError:
+                break
+            if now - returned_at > options['MAX_IDLE'] or now - created_at > options['MAX_LIFETIME']:
+                _close_quietly(raw)
+                continue
+            if now - returned_at > options['CHECK_AFTER'] and not self._ping(raw):
+                _close_quietly(raw)
+                continue
+            self._pool_created_at = created_at
+            return raw
+
+        self._pool_created_at = now
+        return super().get_new_connection(conn_params)
+
+    def _ping(self, raw):
+        try:
+            cursor = raw.cursor()
+            try:
+                cursor.execute('SELECT 1')
+            finally:
+                cursor.close()
+        except self.Database.Error:
+            return False
+        return True
+
+    def _close(self):
+        raw = self.connection
+        if raw is None:
+            return None
+        reusable = (
+            not self.in_atomic_block
+            and not self.errors_occurred
+            and self.autocommit == self.settings_dict['AUTOCOMMIT']
+        )
+        if reusable:
+            pool = _pool_for(self.pool_key)
+            with _pools_lock:
+                if len(pool) < self.pool_options['MAX_SIZE']:
+                    pool.append((raw, self._pool_created_at, time.monotonic()))
+                    return None
+        return super()._close()
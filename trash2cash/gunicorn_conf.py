@@ -0,0 +1,88 @@
+# trash2cash/gunicorn_conf.py - gunicorn settings, each overridable from the environment
+#
+#   gunicorn trash2cash.wsgi:application -c python:trash2cash.gunicorn_conf
+import multiprocessing
+import os
+
+
+def _int(name, default):
+    return int(os.environ.get(name, default))
+
+
+def _bool(name, default):
+    return os.environ.get(name, str(default)) == 'True'
+
+
+cpus = multiprocessing.cpu_count()
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '8000')}"
+
+# Threads let a worker keep serving while one request waits on Neon or
+# Cloudinary; the usual 2 x CPU + 1 processes, capped so small instances
+# don't run out of memory. Each request thread gets its database
+# connections opened before the worker takes traffic (see trash2cash.warmup)
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'gthread')
+workers = _int('WEB_CONCURRENCY', min(cpus * 2 + 1, _int('GUNICORN_MAX_WORKERS', 4)))
+threads = _int('GUNICORN_THREADS', 4 if worker_class == 'gthread' else 1)
+
+# Import Django, the URLconf and every view once in the master so workers
+# share those pages copy-on-write and start without importing anything
+preload_app = _bool('GUNICORN_PRELOAD', True)
+
+# Recycle workers to cap memory growth; the jitter keeps them from all
+# restarting at once
+max_requests = _int('GUNICORN_MAX_REQUESTS', 1000)
+max_requests_jitter = _int('GUNICORN_MAX_REQUESTS_JITTER', 100)
+
+# Large image uploads on slow mobile connections need more than the 30s default
+timeout = _int('GUNICORN_TIMEOUT', 60)
+graceful_timeout = _int('GUNICORN_GRACEFUL_TIMEOUT', 30)
+keepalive = _int('GUNICORN_KEEPALIVE', 5)
+
+# Heartbeat files on tmpfs so a slow disk can't make workers look hung
+if os.path.isdir('/dev/shm'):
+    worker_tmp_dir = '/dev/shm'
+
+# Set GUNICORN_ACCESS_LOG to an empty string to turn access logging off
+accesslog = os.environ.get('GUNICORN_ACCESS_LOG', '-') or None
+errorlog = '-'
+loglevel = os.environ.get('GUNICORN_LOG_LEVEL', 'info')
+
+
+def on_starting(server):
+    # Runs in the master before any worker starts; metrics from the previous
+    # run would otherwise be added to this one's
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'trash2cash.settings')
+    from trash2cash import metrics
+
+    metrics.clear_dir()
+
+
+def when_ready(server):
+    # Runs in the master once the app is loaded, before any worker forks
+    if not preload_app:
+        return
+    from django.db import connections
+
+    from trash2cash.warmup import warm_url_resolver
+
+    warm_url_resolver()
+    # Workers must never inherit an open database socket from the master
+    connections.close_all()
+    server.log.info("URL resolver warmed in the master")
+
+
+def post_worker_init(worker):
+    # Runs in each worker after the app is loaded, before it accepts requests
+    from trash2cash.warmup import warm_up
+
+    # gthread workers create their request thread pool before this hook
+    warm_up(threads, getattr(worker, 'tpool', None))
+    worker.log.info("Worker %s warmed: URL resolver, database connections, revocation list", worker.pid)
+
+
+def child_exit(server, worker):
+    # Runs in the master when a worker exits; its requests can't be in flight any more
+    from trash2cash import metrics
+
+    metrics.mark_process_dead(worker.pid)
@@ -0,0 +1,154 @@
+# trash2cash/instrumentation.py - Per-request query, serializer and view timings
+import json
+import logging
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+from . import metrics
+
+logger = logging.getLogger('trash2cash.requests')
+
+# Timings of the request being handled, set by RequestTimingMiddleware
+_current = ContextVar('request_timings', default=None)
+
+
+class RequestTimings:
+    def __init__(self):
+        self.queries = 0
+        # Seconds spent per phase ('db', 'serialize', 'view')
+        self.durations = defaultdict(float)
+        # Phases being timed right now, so nested timers count once
+        self.active = set()
+        self.view_started = None
+
+
+@contextmanager
+def timed(phase):
+    """Add the time spent in the block (or decorated function) to the current request's ``phase``."""
+    timings = _current.get()
+    if timings is None or phase in timings.active:
+        yield
+        return
+    timings.active.add(phase)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings.durations[phase] += time.perf_counter() - start
+        timings.active.discard(phase)
+
+
+def record_query(execute, sql, params, many, context):
+    timings = _current.get()
+    if timings is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        timings.queries += 1
+        timings.durations['db'] += time.perf_counter() - start
+
+
+def install_query_timer(connection):
+    # execute_wrappers belongs to the wrapper, which outlives reconnects
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+@receiver(connection_created, dispatch_uid='trash2cash.instrumentation')
+def _install_on_connect(sender, connection, **kwargs):
+    install_query_timer(connection)
+
+
+class TimedSerializerMixin:
+    """Count a serializer's ``.data`` towards the request's serialize time."""
+
+    @property
+    def data(self):
+        with timed('serialize'):
+            return super().data
+
+
+class RequestTimingMiddleware:
+    """
+    Count and time each request's SQL queries, serializer work and view.
+
+    Adds a ``Server-Timing`` header (REQUEST_TIMING['HEADER']), logs one
+    JSON line per request to the ``trash2cash.requests`` logger and feeds
+    the latency, in-flight and query metrics (trash2cash.metrics). The db
+    and serialize times overlap the view time; view includes rendering.
+    Should be the first middleware so total covers the others.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        # Connections opened before this module was loaded never sent
+        # connection_created to our receiver
+        for connection in connections.all(initialized_only=True):
+            install_query_timer(connection)
+
+    def __call__(self, request):
+        timings = RequestTimings()
+        token = _current.set(timings)
+        record_metrics = metrics.enabled()
+        if record_metrics:
+            metrics.REQUESTS_IN_FLIGHT.inc()
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+            if record_metrics:
+                metrics.REQUESTS_IN_FLIGHT.dec()
+        end = time.perf_counter()
+
+        if timings.view_started is not None:
+            timings.durations['view'] = end - timings.view_started
+        total = end - start
+
+        if settings.REQUEST_TIMING['HEADER']:
+            response['Server-Timing'] = self.server_timing(timings, total)
+        if logger.isEnabledFor(logging.INFO):
+            self.log(request, response, timings, total)
+        if record_metrics:
+            metrics.record_request(
+                request, response.status_code, total, timings.queries, timings.durations['db']
+            )
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        timings = _current.get()
+        if timings is not None:
+            timings.view_started = time.perf_counter()
+
+    def server_timing(self, timings, total):
+        durations = timings.durations
+        return ', '.join([
+            f'db;dur={durations["db"] * 1000:.2f};desc="{timings.queries} queries"',
+            f'serialize;dur={durations["serialize"] * 1000:.2f}',
+            f'view;dur={durations["view"] * 1000:.2f}',
+            f'total;dur={total * 1000:.2f}',
+        ])
+
+    def log(self, request, response, timings, total):
+        match = request.resolver_match
+        record = {
+            'method': request.method,
+            'path': request.path,
+            'route': match.route if match else None,
+            'status': response.status_code,
+            'queries': timings.queries,
+            'db_ms': round(timings.durations['db'] * 1000, 2),
+            'serialize_ms': round(timings.durations['serialize'] * 1000, 2),
+            'view_ms': round(timings.durations['view'] * 1000, 2),
+            'total_ms': round(total * 1000, 2),
+        }
+        logger.info(json.dumps(record), extra={'request_timing': record})
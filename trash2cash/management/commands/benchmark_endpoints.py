@@ -0,0 +1,284 @@
+import json
+import random
+import statistics
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Q
+from django.test.utils import (
+    override_settings,
+    setup_databases,
+    setup_test_environment,
+    teardown_databases,
+    teardown_test_environment,
+)
+from django.utils import timezone
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from history.models import History
+from trash2cash.benchmarking import percentile
+
+User = get_user_model()
+
+PASSWORD = 'benchpass123'
+DEFAULT_MIX = 'register=1,login=2,qr-scan=6,transfer=3,history=5,recent=8'
+MATERIALS = ['plastic', 'metal', 'non-recycle']
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark register, login, qr-scan, transfer, history and recent in "
+        "process against a throwaway database; report p50/p95/p99 and req/s "
+        "per endpoint and optionally save or compare JSON results"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=1000,
+                            help="Measured requests across the whole mix")
+        parser.add_argument('--warmup', type=int, default=50,
+                            help="Unmeasured requests sent first")
+        parser.add_argument('--mix', default=DEFAULT_MIX,
+                            help="Relative weight of each endpoint, as name=weight pairs")
+        parser.add_argument('--users', type=int, default=20)
+        parser.add_argument('--history-rows', type=int, default=200,
+                            help="History entries seeded per user")
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument('--keepdb', action='store_true',
+                            help="Reuse the benchmark database between runs (seeds it again)")
+        parser.add_argument('--output', help="Write the results to this JSON file")
+        parser.add_argument('--compare', help="Results JSON from an earlier run to compare against")
+        parser.add_argument('--threshold', type=float, default=20.0,
+                            help="Fail --compare when an endpoint's p95 grows by more than this percent")
+
+    def parse_mix(self, mix):
+        weights = {}
+        for pair in mix.split(','):
+            name, _, weight = pair.partition('=')
+            name = name.strip()
+            if name not in self.endpoints:
+                raise CommandError(f"Unknown endpoint {name!r}; choose from {', '.join(self.endpoints)}")
+            weights[name] = float(weight or 1)
+        return weights
+
+    @property
+    def endpoints(self):
+        return {
+            'register': self.register,
+            'login': self.login,
+            'qr-scan': self.qr_scan,
+            'transfer': self.transfer,
+            'history': self.history,
+            'recent': self.recent,
+        }
+
+    # ---- seeding ----
+
+    def seed(self, users, history_rows):
+        # Hash once: PBKDF2 per seeded user would dominate the setup time
+        password = make_password(PASSWORD)
+        self.users = []
+        for i in range(users):
+            user = User(
+                email=f"bench{i}@example.com",
+                first_name='Bench',
+                last_name=f"User{i}",
+                phone_number=f"+2519{i:08d}",
+                password=password,
+                total_points=1_000_000,
+            )
+            user.save()
+            self.users.append(user)
+
+        now = timezone.now()
+        History.objects.bulk_create([
+            History(
+                user=user,
+                points=5 + i % 40,
+                action='scan',
+                material_type=MATERIALS[i % 3],
+                description="QR Scan: seeded",
+                created_at=now - timedelta(minutes=i),
+            )
+            for user in self.users
+            for i in range(history_rows)
+        ], batch_size=1000)
+        self.tokens = {user.pk: f"Bearer {AccessToken.for_user(user)}" for user in self.users}
+        self.registered = 0
+
+    # ---- one request per endpoint ----
+
+    def auth(self, user):
+        return {'HTTP_AUTHORIZATION': self.tokens[user.pk]}
+
+    def register(self):
+        self.registered += 1
+        n = self.registered
+        return self.client.post('/api/auth/register/', {
+            'email': f"newbench{n}@example.com",
+            'first_name': 'New',
+            'last_name': 'Bench',
+            'phone_number': f"+2517{n:08d}",
+            'password': PASSWORD,
+        }, format='json')
+
+    def login(self):
+        user = self.random.choice(self.users)
+        return self.client.post('/api/auth/login/', {
+            'email_or_phone': user.email, 'password': PASSWORD,
+        }, format='json')
+
+    def qr_scan(self):
+        user = self.random.choice(self.users)
+        return self.client.post('/api/points/qr-scan/', {
+            'materialType': self.random.choice(MATERIALS),
+            'pointsToAdd': self.random.randint(1, 30),
+            'date': timezone.now().isoformat(),
+        }, format='json', **self.auth(user))
+
+    def transfer(self):
+        sender, receiver = self.random.sample(self.users, 2)
+        return self.client.post('/api/points/transfer/', {
+            'receiver_email_or_phone': receiver.email, 'points': 5,
+        }, format='json', **self.auth(sender))
+
+    def history(self):
+        return self.client.get('/api/points/', **self.auth(self.random.choice(self.users)))
+
+    def recent(self):
+        return self.client.get('/api/points/recent/', **self.auth(self.random.choice(self.users)))
+
+    # ---- running and reporting ----
+
+    def run(self, weights, count):
+        names = self.random.choices(list(weights), weights=list(weights.values()), k=count)
+        latencies = {name: [] for name in weights}
+        errors = {name: 0 for name in weights}
+        endpoints = self.endpoints
+        start = time.perf_counter()
+        for name in names:
+            request_start = time.perf_counter()
+            response = endpoints[name]()
+            latencies[name].append((time.perf_counter() - request_start) * 1000)
+            if response.status_code >= 400:
+                errors[name] += 1
+        return latencies, errors, time.perf_counter() - start
+
+    def summarize(self, latencies, errors, elapsed, options, weights):
+        endpoints = {}
+        for name, samples in latencies.items():
+            if not samples:
+                continue
+            endpoints[name] = {
+                'requests': len(samples),
+                'errors': errors[name],
+                'mean_ms': statistics.mean(samples),
+                'p50_ms': percentile(samples, 50),
+                'p95_ms': percentile(samples, 95),
+                'p99_ms': percentile(samples, 99),
+                # Requests are sent one at a time, so this is single-worker throughput
+                'rps': len(samples) / (sum(samples) / 1000),
+            }
+        total = sum(len(samples) for samples in latencies.values())
+        return {
+            'meta': {
+                'started_at': self.started_at.isoformat(),
+                'database': connection.vendor,
+                'requests': total,
+                'mix': weights,
+                'users': options['users'],
+                'history_rows': options['history_rows'],
+                'seed': options['seed'],
+            },
+            'endpoints': endpoints,
+            'total': {'requests': total, 'seconds': elapsed, 'rps': total / elapsed},
+        }
+
+    def report(self, results):
+        self.stdout.write(
+            f"{'endpoint':<10} {'requests':>8} {'errors':>6} {'p50 ms':>8} "
+            f"{'p95 ms':>8} {'p99 ms':>8} {'req/s':>8}"
+        )
+        for name, row in results['endpoints'].items():
+            self.stdout.write(
+                f"{name:<10} {row['requests']:>8} {row['errors']:>6} {row['p50_ms']:>8.2f} "
+                f"{row['p95_ms']:>8.2f} {row['p99_ms']:>8.2f} {row['rps']:>8.1f}"
+            )
+        total = results['total']
+        self.stdout.write(
+            f"{total['requests']} requests in {total['seconds']:.1f}s, "
+            f"{total['rps']:.1f} req/s overall ({results['meta']['database']})"
+        )
+
+    def compare(self, results, path, threshold):
+        with open(path) as baseline_file:
+            baseline = json.load(baseline_file)
+
+        self.stdout.write(
+            f"\nCompared with {path} ({baseline['meta']['started_at']}):\n"
+            f"{'endpoint':<10} {'p50 ms':>18} {'p95 ms':>18} {'p99 ms':>18} {'p95 change':>11}"
+        )
+        regressions = []
+        for name, row in results['endpoints'].items():
+            old = baseline['endpoints'].get(name)
+            if old is None:
+                continue
+            change = (row['p95_ms'] - old['p95_ms']) / old['p95_ms'] * 100
+            columns = ' '.join(
+                f"{old[key]:>8.2f} -> {row[key]:>6.2f}" for key in ('p50_ms', 'p95_ms', 'p99_ms')
+            )
+            flag = ''
+            if change > threshold:
+                regressions.append(name)
+                flag = '  REGRESSION'
+            self.stdout.write(f"{name:<10} {columns} {change:>+10.1f}%{flag}")
+
+        if regressions:
+            raise CommandError(
+                f"p95 latency regressed by more than {threshold}% for: {', '.join(regressions)}"
+            )
+
+    def handle(self, *args, **options):
+        weights = self.parse_mix(options['mix'])
+        self.random = random.Random(options['seed'])
+        self.started_at = timezone.now()
+
+        # Same isolation as the test runner (a separate database), throttles
+        # that still run but never reject, and production's DEBUG off and
+        # query inspector off: both would otherwise record every query
+        setup_test_environment()
+        old_config = setup_databases(verbosity=0, interactive=False, keepdb=options['keepdb'])
+        rates = {scope: '1000000/s' for scope in settings.REST_FRAMEWORK['DEFAULT_THROTTLE_RATES']}
+        try:
+            with override_settings(
+                DEBUG=False,
+                QUERY_INSPECTOR={**settings.QUERY_INSPECTOR, 'ENABLED': False},
+                REST_FRAMEWORK={**settings.REST_FRAMEWORK, 'DEFAULT_THROTTLE_RATES': rates},
+            ):
+                if options['keepdb']:
+                    User.objects.filter(
+                        Q(email__startswith='bench') | Q(email__startswith='newbench')
+                    ).delete()
+                self.seed(options['users'], options['history_rows'])
+                self.client = APIClient()
+                self.run(weights, options['warmup'])
+                latencies, errors, elapsed = self.run(weights, options['requests'])
+        finally:
+            teardown_databases(old_config, verbosity=0, keepdb=options['keepdb'])
+            teardown_test_environment()
+
+        results = self.summarize(latencies, errors, elapsed, options, weights)
+        self.report(results)
+
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                json.dump(results, output, indent=2)
+            self.stdout.write(f"Results written to {options['output']}")
+
+        if options['compare']:
+            self.compare(results, options['compare'], options['threshold'])
@@ -0,0 +1,74 @@
+import copy
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+from django.db.utils import load_backend
+
+from trash2cash.db.pool import clear_pools
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure per-request database connection overhead without reuse, with "
+        "persistent connections (CONN_MAX_AGE) and with the in-process pool"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default='default')
+        parser.add_argument('--requests', type=int, default=200)
+        parser.add_argument('--queries', type=int, default=3,
+                            help="Queries per simulated request")
+
+    def modes(self, settings_dict):
+        engine = settings_dict['ENGINE'].replace('trash2cash.db.backends.', 'django.db.backends.')
+        pooled = engine.replace('django.db.backends.', 'trash2cash.db.backends.')
+        return [
+            ('new connection per request', engine, {'CONN_MAX_AGE': 0, 'CONN_HEALTH_CHECKS': False}),
+            ('persistent + health checks', engine, {'CONN_MAX_AGE': 60, 'CONN_HEALTH_CHECKS': True}),
+            ('pooled + health checks', pooled, {'CONN_MAX_AGE': 0, 'CONN_HEALTH_CHECKS': True}),
+        ]
+
+    def simulate(self, wrapper, requests, queries):
+        """Run requests the way Django's request_started/request_finished handlers drive a connection."""
+        raw_connections = []
+        start = time.perf_counter()
+        for _ in range(requests):
+            wrapper.close_if_unusable_or_obsolete()
+            for _ in range(queries):
+                with wrapper.cursor() as cursor:
+                    cursor.execute('SELECT 1')
+                    cursor.fetchone()
+            if not any(raw is wrapper.connection for raw in raw_connections):
+                raw_connections.append(wrapper.connection)
+            wrapper.close_if_unusable_or_obsolete()
+        elapsed = time.perf_counter() - start
+        wrapper.close()
+        return elapsed, len(raw_connections)
+
+    def handle(self, *args, **options):
+        alias = options['database']
+        base_settings = connections[alias].settings_dict
+        requests, queries = options['requests'], options['queries']
+
+        self.stdout.write(
+            f"{base_settings['ENGINE']} {base_settings['NAME']}: "
+            f"{requests} requests x {queries} queries\n"
+            f"{'mode':<30} {'ms/request':>11} {'connections':>12}"
+        )
+        results = []
+        for label, engine, overrides in self.modes(base_settings):
+            settings_dict = copy.deepcopy(base_settings)
+            settings_dict.update(overrides, ENGINE=engine)
+            wrapper = load_backend(engine).DatabaseWrapper(settings_dict, f"{alias}-measure")
+            elapsed, opened = self.simulate(wrapper, requests, queries)
+            clear_pools()
+            per_request = elapsed * 1000 / requests
+            results.append((label, per_request))
+            self.stdout.write(f"{label:<30} {per_request:>11.3f} {opened:>12}")
+
+        baseline = results[0][1]
+        for label, per_request in results[1:]:
+            self.stdout.write(
+                f"{label}: {baseline - per_request:.3f} ms/request saved ({baseline / per_request:.1f}x)"
+            )
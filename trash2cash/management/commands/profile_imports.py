@@ -0,0 +1,123 @@
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+# What a freshly started worker does before its first response: load
+# settings and apps, build the URLconf, then serve one request
+BOOT_SCRIPT = """
+import io, json, sys, time
+start = time.perf_counter()
+from django.core.wsgi import get_wsgi_application
+application = get_wsgi_application()
+from django.urls import get_resolver
+get_resolver().url_patterns
+ready = time.perf_counter()
+environ = {
+    'REQUEST_METHOD': 'GET', 'PATH_INFO': sys.argv[1], 'QUERY_STRING': '',
+    'SERVER_NAME': 'localhost', 'SERVER_PORT': '80', 'HTTP_HOST': 'localhost',
+    'wsgi.input': io.BytesIO(), 'wsgi.errors': sys.stderr, 'wsgi.url_scheme': 'http',
+}
+status = []
+b''.join(application(environ, lambda code, headers: status.append(code)))
+done = time.perf_counter()
+print(json.dumps({'setup': ready - start, 'first_response': done - start, 'status': status[0]}))
+"""
+
+IMPORTTIME_LINE = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$')
+
+
+class Command(BaseCommand):
+    help = (
+        "Profile a cold start in a fresh interpreter: time to the first "
+        "response, and the import cost of each module (python -X importtime)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--path', default='/api/leaderboard/global/',
+                            help="Request to serve once the app is loaded")
+        parser.add_argument('--runs', type=int, default=5,
+                            help="Cold starts to time; the median is reported")
+        parser.add_argument('--top', type=int, default=20,
+                            help="Modules and packages to list")
+        parser.add_argument('--sort', choices=['self', 'cumulative'], default='self')
+        parser.add_argument('--json', action='store_true',
+                            help="Print the report as JSON")
+
+    def boot(self, path, importtime=False):
+        args = [sys.executable]
+        if importtime:
+            args += ['-X', 'importtime']
+        env = dict(os.environ, DJANGO_SETTINGS_MODULE=os.environ.get(
+            'DJANGO_SETTINGS_MODULE', 'trash2cash.settings'
+        ))
+        result = subprocess.run(
+            args + ['-c', BOOT_SCRIPT, path],
+            cwd=settings.BASE_DIR, env=env, capture_output=True, text=True,
+        )
+        if result.returncode:
+            raise CommandError(f"Cold start failed:\n{result.stderr[-2000:]}")
+        return json.loads(result.stdout.strip().splitlines()[-1]), result.stderr
+
+    def parse_importtime(self, stderr):
+        """(module, self_us, cumulative_us) for each import, in import order."""
+        modules = []
+        for line in stderr.splitlines():
+            match = IMPORTTIME_LINE.match(line)
+            if match:
+                modules.append((match[4], int(match[1]), int(match[2])))
+        return modules
+
+    def handle(self, *args, **options):
+        path = options['path']
+        timings = [self.boot(path)[0] for _ in range(options['runs'])]
+        _, stderr = self.boot(path, importtime=True)
+        modules = self.parse_importtime(stderr)
+
+        packages = defaultdict(int)
+        for name, self_us, _ in modules:
+            packages[name.split('.')[0]] += self_us
+        key = 1 if options['sort'] == 'self' else 2
+        top = options['top']
+
+        report = {
+            'path': path,
+            'status': timings[0]['status'],
+            'runs': len(timings),
+            'setup_ms': statistics.median(t['setup'] for t in timings) * 1000,
+            'first_response_ms': statistics.median(t['first_response'] for t in timings) * 1000,
+            'modules_imported': len(modules),
+            'import_ms': sum(self_us for _, self_us, _ in modules) / 1000,
+            'packages': [
+                {'package': name, 'ms': us / 1000}
+                for name, us in sorted(packages.items(), key=lambda item: -item[1])[:top]
+            ],
+            'modules': [
+                {'module': name, 'self_ms': self_us / 1000, 'cumulative_ms': cumulative_us / 1000}
+                for name, self_us, cumulative_us in sorted(modules, key=lambda m: -m[key])[:top]
+            ],
+        }
+
+        if options['json']:
+            self.stdout.write(json.dumps(report, indent=2))
+            return
+
+        self.stdout.write(
+            f"GET {path} -> {report['status']}, median of {report['runs']} cold starts\n"
+            f"  settings + apps + URLconf: {report['setup_ms']:.1f} ms\n"
+            f"  first response:            {report['first_response_ms']:.1f} ms\n"
+            f"  {report['modules_imported']} modules, {report['import_ms']:.1f} ms importing "
+            f"(-X importtime run)\n"
+        )
+        self.stdout.write(f"{'package':<40} {'ms':>9}")
+        for row in report['packages']:
+            self.stdout.write(f"{row['package']:<40} {row['ms']:>9.1f}")
+        self.stdout.write(f"\n{'module':<50} {'self ms':>9} {'cum ms':>9}")
+        for row in report['modules']:
+            self.stdout.write(f"{row['module']:<50} {row['self_ms']:>9.1f} {row['cumulative_ms']:>9.1f}")
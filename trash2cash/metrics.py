@@ -0,0 +1,360 @@
+# trash2cash/metrics.py - Multi-process metrics registry with Prometheus text output
+import glob
+import json
+import math
+import mmap
+import os
+import struct
+import threading
+from collections import defaultdict
+
+from django.conf import settings
+
+# Request latency buckets, in seconds
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, math.inf)
+
+_FILE_PATTERN = 'metrics_{pid}.db'
+_HEADER = struct.Struct('<i4x')  # bytes in use, padded so entries start 8-aligned
+_INITIAL_SIZE = 64 * 1024
+
+
+class _MmapStore:
+    """
+    Append-only ``key -> float64`` table in a memory-mapped file.
+
+    Each process writes only its own file, so no cross-process locking is
+    needed; readers parse every process's file and add the values up. An
+    entry is written before the header's used-bytes count moves past it,
+    so a reader never sees a half-written entry.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, 'a+b')
+        if os.fstat(self._file.fileno()).st_size < _INITIAL_SIZE:
+            self._file.truncate(_INITIAL_SIZE)
+        self._map()
+        self._positions = {}
+        self._used = _HEADER.unpack_from(self._mmap, 0)[0] or _HEADER.size
+        for key, _, position in _read_entries(self._mmap, self._used):
+            self._positions[key] = position
+
+    def _map(self):
+        self._capacity = os.fstat(self._file.fileno()).st_size
+        self._mmap = mmap.mmap(self._file.fileno(), self._capacity)
+
+    def _position(self, key):
+        position = self._positions.get(key)
+        if position is not None:
+            return position
+        encoded = key.encode('utf-8')
+        # Pad the key so the value that follows it is 8-aligned
+        padded = len(encoded) + (-(4 + len(encoded)) % 8)
+        size = 4 + padded + 8
+        while self._used + size > self._capacity:
+            self._mmap.close()
+            self._file.truncate(self._capacity * 2)
+            self._map()
+        struct.pack_into(f'<i{padded}sd', self._mmap, self._used, len(encoded), encoded, 0.0)
+        position = self._used + 4 + padded
+        self._used += size
+        _HEADER.pack_into(self._mmap, 0, self._used)
+        self._positions[key] = position
+        return position
+
+    def add(self, key, amount):
+        position = self._position(key)
+        value = struct.unpack_from('<d', self._mmap, position)[0]
+        struct.pack_into('<d', self._mmap, position, value + amount)
+
+    def close(self):
+        self._mmap.close()
+        self._file.close()
+
+
+def _read_entries(data, used):
+    position = _HEADER.size
+    while position < used:
+        length = struct.unpack_from('<i', data, position)[0]
+        padded = length + (-(4 + length) % 8)
+        key = bytes(data[position + 4:position + 4 + length]).decode('utf-8')
+        value_position = position + 4 + padded
+        yield key, struct.unpack_from('<d', data, value_position)[0], value_position
+        position = value_position + 8
+
+
+_store = None
+_store_pid = None
+_lock = threading.Lock()
+
+
+def metrics_dir():
+    return settings.METRICS['DIR']
+
+
+def _add(key, amount):
+    global _store, _store_pid
+    with _lock:
+        # Re-open after a fork so workers never share the master's file
+        if _store_pid != os.getpid():
+            os.makedirs(metrics_dir(), exist_ok=True)
+            _store = _MmapStore(os.path.join(metrics_dir(), _FILE_PATTERN.format(pid=os.getpid())))
+            _store_pid = os.getpid()
+        _store.add(key, amount)
+
+
+def close_store():
+    """Close this process's file; the next write opens one under the current METRICS['DIR']."""
+    global _store, _store_pid
+    with _lock:
+        if _store is not None and _store_pid == os.getpid():
+            _store.close()
+        _store = _store_pid = None
+
+
+def clear_dir():
+    """Remove every process's file, e.g. when the gunicorn master starts."""
+    close_store()
+    for path in glob.glob(os.path.join(metrics_dir(), _FILE_PATTERN.format(pid='*'))):
+        os.remove(path)
+
+
+def mark_process_dead(pid):
+    """Zero a finished worker's gauges; its counters and histograms keep counting in the totals."""
+    path = os.path.join(metrics_dir(), _FILE_PATTERN.format(pid=pid))
+    if not os.path.exists(path):
+        return
+    store = _MmapStore(path)
+    try:
+        for key, value, _ in list(_read_entries(store._mmap, store._used)):
+            name = json.loads(key)[0]
+            if value and isinstance(REGISTRY.get(name), Gauge):
+                store.add(key, -value)
+    finally:
+        store.close()
+
+
+# ---- metric types ----
+
+REGISTRY = {}
+
+
+def _key(name, suffix, labels):
+    return json.dumps([name, suffix, labels], separators=(',', ':'))
+
+
+class _Metric:
+    type = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+        self._children_lock = threading.Lock()
+        REGISTRY[name] = self
+
+    def labels(self, *values, **kwargs):
+        if kwargs:
+            values = tuple(kwargs[name] for name in self.labelnames)
+        values = tuple(str(value) for value in values)
+        child = self._children.get(values)
+        if child is None:
+            with self._children_lock:
+                child = self._children.setdefault(
+                    values, self._child(dict(zip(self.labelnames, values)))
+                )
+        return child
+
+
+class _CounterChild:
+    def __init__(self, name, labels):
+        self._key = _key(name, '', labels)
+
+    def inc(self, amount=1):
+        if amount < 0:
+            raise ValueError("Counters can only go up")
+        _add(self._key, amount)
+
+
+class Counter(_Metric):
+    type = 'counter'
+
+    def _child(self, labels):
+        return _CounterChild(self.name, labels)
+
+    def inc(self, amount=1):
+        self.labels().inc(amount)
+
+
+class _GaugeChild:
+    def __init__(self, name, labels):
+        self._key = _key(name, '', labels)
+
+    def inc(self, amount=1):
+        _add(self._key, amount)
+
+    def dec(self, amount=1):
+        _add(self._key, -amount)
+
+
+class Gauge(_Metric):
+    """Summed across live processes."""
+    type = 'gauge'
+
+    def _child(self, labels):
+        return _GaugeChild(self.name, labels)
+
+    def inc(self, amount=1):
+        self.labels().inc(amount)
+
+    def dec(self, amount=1):
+        self.labels().dec(amount)
+
+
+class _HistogramChild:
+    def __init__(self, name, labels, buckets):
+        self._buckets = buckets
+        self._bucket_keys = [
+            _key(name, '_bucket', {**labels, 'le': _format_le(bound)}) for bound in buckets
+        ]
+        self._sum_key = _key(name, '_sum', labels)
+        self._count_key = _key(name, '_count', labels)
+
+    def observe(self, value):
+        # Buckets are stored uncumulated and summed up when exported
+        for bound, key in zip(self._buckets, self._bucket_keys):
+            if value <= bound:
+                _add(key, 1)
+                break
+        _add(self._sum_key, value)
+        _add(self._count_key, 1)
+
+
+class Histogram(_Metric):
+    type = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        super().__init__(name, documentation, labelnames)
+
+    def _child(self, labels):
+        return _HistogramChild(self.name, labels, self.buckets)
+
+    def observe(self, value):
+        self.labels().observe(value)
+
+
+def _format_le(bound):
+    return '+Inf' if bound == math.inf else repr(float(bound))
+
+
+# ---- collection and exposition ----
+
+def collect():
+    """Values of every sample, summed over all processes' files: {(name, suffix, labels): value}."""
+    totals = defaultdict(float)
+    for path in glob.glob(os.path.join(metrics_dir(), _FILE_PATTERN.format(pid='*'))):
+        try:
+            with open(path, 'rb') as metrics_file:
+                data = metrics_file.read()
+        except FileNotFoundError:
+            continue
+        if len(data) < _HEADER.size:
+            continue
+        used = min(_HEADER.unpack_from(data, 0)[0], len(data))
+        for key, value, _ in _read_entries(data, used):
+            totals[key] += value
+
+    samples = {}
+    for key, value in totals.items():
+        name, suffix, labels = json.loads(key)
+        samples[(name, suffix, tuple(sorted(labels.items())))] = value
+    return samples
+
+
+def _escape(value):
+    return value.replace('\\', r'\\').replace('\n', r'\n').replace('"', r'\"')
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in labels) + '}'
+
+
+def _format_value(value):
+    if value == math.inf:
+        return '+Inf'
+    return repr(float(value))
+
+
+def generate_latest():
+    """All registered metrics in the Prometheus text exposition format."""
+    samples = collect()
+    by_metric = defaultdict(list)
+    for (name, suffix, labels), value in samples.items():
+        by_metric[name].append((suffix, labels, value))
+
+    lines = []
+    for name, metric in sorted(REGISTRY.items()):
+        lines.append(f"# HELP {name} {metric.documentation}")
+        lines.append(f"# TYPE {name} {metric.type}")
+        rows = by_metric.get(name, [])
+        if metric.type != 'histogram':
+            for _, labels, value in sorted(rows):
+                lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+            continue
+
+        # Turn the stored per-bucket counts into cumulative le buckets
+        series = defaultdict(dict)
+        for suffix, labels, value in rows:
+            labels = dict(labels)
+            le = labels.pop('le', None)
+            entry = series[tuple(sorted(labels.items()))]
+            if suffix == '_bucket':
+                entry.setdefault('buckets', {})[le] = value
+            else:
+                entry[suffix] = value
+        for labels, entry in sorted(series.items()):
+            cumulative = 0.0
+            for bound in metric.buckets:
+                le = _format_le(bound)
+                cumulative += entry.get('buckets', {}).get(le, 0.0)
+                bucket_labels = labels + (('le', le),)
+                lines.append(f"{name}_bucket{_format_labels(bucket_labels)} {_format_value(cumulative)}")
+            lines.append(f"{name}_sum{_format_labels(labels)} {_format_value(entry.get('_sum', 0.0))}")
+            lines.append(f"{name}_count{_format_labels(labels)} {_format_value(entry.get('_count', 0.0))}")
+    return '\n'.join(lines) + '\n'
+
+
+# ---- application metrics ----
+
+REQUEST_DURATION = Histogram(
+    'http_request_duration_seconds', "Request latency by view, method and status",
+    ['view', 'method', 'status'],
+)
+REQUESTS_IN_FLIGHT = Gauge('http_requests_in_flight', "Requests being handled right now")
+DB_QUERIES = Counter('db_queries_total', "SQL queries run while handling requests", ['view'])
+DB_QUERY_SECONDS = Counter('db_query_seconds_total', "Time spent in SQL queries while handling requests", ['view'])
+CACHE_LOOKUPS = Counter('cache_lookups_total', "In-process cache lookups by cache and result", ['cache', 'result'])
+
+
+def enabled():
+    return settings.METRICS['ENABLED']
+
+
+def view_label(request):
+    """Low-cardinality name for the view that handled ``request``."""
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return 'unmatched'
+    return match.view_name or match.route
+
+
+def record_request(request, status, seconds, queries, db_seconds):
+    view = view_label(request)
+    REQUEST_DURATION.labels(view, request.method, status).observe(seconds)
+    if queries:
+        DB_QUERIES.labels(view).inc(queries)
+        DB_QUERY_SECONDS.labels(view).inc(db_seconds)
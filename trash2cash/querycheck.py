@@ -0,0 +1,183 @@
+# trash2cash/querycheck.py - N+1 and slow-query detection for development and staging
+import logging
+import os
+import re
+import time
+import traceback
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+logger = logging.getLogger('trash2cash.queries')
+
+# Inspector of the request or block being checked, see inspect_queries()
+_current = ContextVar('query_inspector', default=None)
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r'\b\d+(?:\.\d+)?\b')
+_PLACEHOLDER = re.compile(r'%s|\?')
+_IN_LIST = re.compile(r'\bIN \(\?(?:, \?)*\)', re.IGNORECASE)
+_VALUES_LIST = re.compile(r'\bVALUES \([?, ]+\)(?:, \([?, ]+\))*', re.IGNORECASE)
+_WHITESPACE = re.compile(r'\s+')
+# Savepoints get a fresh name each time and say nothing about the data access
+_TRANSACTION_CONTROL = re.compile(r'^\s*(SAVEPOINT|RELEASE|ROLLBACK TO|BEGIN|COMMIT)\b', re.IGNORECASE)
+
+
+def fingerprint(sql):
+    """
+    The shape of ``sql``: literals and placeholders become ``?`` and
+    ``IN``/``VALUES`` lists collapse, so ``WHERE id = 1`` and
+    ``WHERE id = 2`` share a fingerprint.
+    """
+    sql = _STRING.sub('?', sql)
+    sql = _NUMBER.sub('?', sql)
+    sql = _PLACEHOLDER.sub('?', sql)
+    sql = _WHITESPACE.sub(' ', sql).strip()
+    sql = _IN_LIST.sub('IN (...)', sql)
+    return _VALUES_LIST.sub('VALUES (...)', sql)
+
+
+def _project_stack():
+    """Frames of our own code that led to the current query, innermost last."""
+    base = str(settings.BASE_DIR) + os.sep
+    this_file = os.path.abspath(__file__)
+    frames = []
+    for frame in traceback.extract_stack():
+        path = os.path.abspath(frame.filename)
+        if not path.startswith(base) or path == this_file or 'site-packages' in path:
+            continue
+        frames.append(frame)
+    return traceback.StackSummary.from_list(frames)
+
+
+class QueryProblem:
+    def __init__(self, kind, fingerprint, sql, count, seconds, stack):
+        self.kind = kind  # 'repeated' or 'slow'
+        self.fingerprint = fingerprint
+        self.sql = sql
+        self.count = count
+        self.seconds = seconds
+        self.stack = stack
+
+    def __str__(self):
+        if self.kind == 'repeated':
+            summary = f"Repeated query ran {self.count} times ({self.seconds * 1000:.1f} ms in all)"
+        else:
+            summary = f"Slow query took {self.seconds * 1000:.1f} ms"
+        stack = ''.join(self.stack.format()) if self.stack else '  (no project frames)\n'
+        return f"{summary}: {self.sql}\nFirst issued from:\n{stack}"
+
+
+class QueryProblemsDetected(Exception):
+    def __init__(self, label, problems):
+        self.problems = problems
+        super().__init__(f"{len(problems)} query problem(s) in {label}:\n\n" + '\n'.join(map(str, problems)))
+
+
+class QueryInspector:
+    """
+    Fingerprint every query and keep the call stack behind the first
+    repeat and every slow one. The stack is only captured when a query
+    turns out to be interesting, so a clean request pays little for it.
+    """
+
+    def __init__(self, repeat_threshold, slow_ms):
+        self.repeat_threshold = repeat_threshold
+        self.slow_seconds = slow_ms / 1000
+        # fingerprint -> [count, seconds, first sql, stack of the second run]
+        self.queries = {}
+        self.slow = []
+
+    def record(self, sql, seconds):
+        if _TRANSACTION_CONTROL.match(sql):
+            return
+        key = fingerprint(sql)
+        entry = self.queries.get(key)
+        if entry is None:
+            self.queries[key] = entry = [0, 0.0, sql, None]
+        entry[0] += 1
+        entry[1] += seconds
+        # The second run is where a loop becomes visible; its stack points at the loop
+        if entry[0] == 2:
+            entry[3] = _project_stack()
+        if seconds >= self.slow_seconds:
+            self.slow.append(QueryProblem('slow', key, sql, 1, seconds, _project_stack()))
+
+    def problems(self):
+        repeated = [
+            QueryProblem('repeated', key, sql, count, seconds, stack)
+            for key, (count, seconds, sql, stack) in self.queries.items()
+            if count >= self.repeat_threshold
+        ]
+        repeated.sort(key=lambda problem: -problem.count)
+        return repeated + self.slow
+
+
+def inspect_query(execute, sql, params, many, context):
+    inspector = _current.get()
+    if inspector is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        inspector.record(sql, time.perf_counter() - start)
+
+
+def install_query_inspector(connection):
+    if inspect_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(inspect_query)
+
+
+@receiver(connection_created, dispatch_uid='trash2cash.querycheck')
+def _install_on_connect(sender, connection, **kwargs):
+    install_query_inspector(connection)
+
+
+@contextmanager
+def inspect_queries(label='block', repeat_threshold=None, slow_ms=None, raise_problems=None):
+    """
+    Check the queries run inside the block. Problems are logged as
+    warnings to ``trash2cash.queries`` and, with ``raise_problems``,
+    raised as QueryProblemsDetected when the block exits. Unset arguments
+    come from QUERY_INSPECTOR.
+    """
+    config = settings.QUERY_INSPECTOR
+    inspector = QueryInspector(
+        config['REPEAT_THRESHOLD'] if repeat_threshold is None else repeat_threshold,
+        config['SLOW_MS'] if slow_ms is None else slow_ms,
+    )
+    for connection in connections.all(initialized_only=True):
+        install_query_inspector(connection)
+    token = _current.set(inspector)
+    try:
+        yield inspector
+    finally:
+        _current.reset(token)
+
+    problems = inspector.problems()
+    for problem in problems:
+        logger.warning("%s: %s", label, problem, extra={'query_problem': problem})
+    if problems and (config['RAISE'] if raise_problems is None else raise_problems):
+        raise QueryProblemsDetected(label, problems)
+
+
+class QueryInspectorMiddleware:
+    """
+    Run each request under inspect_queries() when QUERY_INSPECTOR['ENABLED'].
+    Meant for development and staging; with QUERY_INSPECTOR['RAISE'] the
+    request fails instead, which makes the test suite catch new N+1s.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not settings.QUERY_INSPECTOR['ENABLED']:
+            return self.get_response(request)
+        with inspect_queries(f"{request.method} {request.path}"):
+            return self.get_response(request)
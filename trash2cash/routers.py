@@ -0,0 +1,97 @@
+# trash2cash/routers.py - Send read-heavy history views to a read replica
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+
+REPLICA_ALIAS = 'replica'
+# Only these apps' tables are read from the replica; user rows (balances,
+# auth) always come from the primary
+REPLICA_APPS = {'history'}
+
+# Id of the user whose request may read from the replica, set by ReplicaReadMixin
+_replica_reader = ContextVar('replica_reader', default=None)
+
+
+def replica_configured():
+    return REPLICA_ALIAS in settings.DATABASES
+
+
+def _pin_key(user_id):
+    return f"primary-pin:{user_id}"
+
+
+def pin_primary(*user_ids):
+    """
+    Keep these users' reads on the primary for REPLICA['STICKY_SECONDS'] so
+    they see their own writes despite replication lag. Stored in the default
+    cache, which every worker shares once REDIS_URL is set (see CACHES).
+    """
+    if not replica_configured():
+        return
+    timeout = settings.REPLICA['STICKY_SECONDS']
+    cache.set_many({_pin_key(user_id): True for user_id in user_ids}, timeout=timeout)
+
+
+def is_pinned(user_id):
+    return bool(cache.get(_pin_key(user_id)))
+
+
+class ReplicaReadMixin:
+    """
+    For read-only views: route the request's history queries to the replica
+    unless the user is pinned to the primary by a recent write.
+
+    Decided once per request after authentication, so the router itself
+    never touches the cache. The choice is undone when dispatch returns or
+    raises, so it can't leak into the thread's next request.
+    """
+
+    def dispatch(self, request, *args, **kwargs):
+        if self.view_is_async:
+            return self._adispatch(request, *args, **kwargs)
+        token = _replica_reader.set(None)
+        try:
+            return super().dispatch(request, *args, **kwargs)
+        finally:
+            _replica_reader.reset(token)
+
+    async def _adispatch(self, request, *args, **kwargs):
+        token = _replica_reader.set(None)
+        try:
+            return await super().dispatch(request, *args, **kwargs)
+        finally:
+            _replica_reader.reset(token)
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        user_id = getattr(request.user, 'id', None)
+        if replica_configured() and user_id is not None and not is_pinned(user_id):
+            _replica_reader.set(user_id)
+
+
+class ReplicaRouter:
+    """Reads go to the replica only inside a ReplicaReadMixin view; everything else uses default."""
+
+    def db_for_read(self, model, **hints):
+        if _replica_reader.get() is None or model._meta.app_label not in REPLICA_APPS:
+            return None
+        return REPLICA_ALIAS if replica_configured() else None
+
+    def db_for_write(self, model, **hints):
+        # Django would otherwise save an instance back to the database it was read from
+        instance = hints.get('instance')
+        if instance is not None and instance._state.db == REPLICA_ALIAS:
+            return DEFAULT_DB_ALIAS
+        return None
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # The replica holds the same rows as default
+        aliases = {DEFAULT_DB_ALIAS, REPLICA_ALIAS}
+        if obj1._state.db in aliases and obj2._state.db in aliases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return None
@@ -1,18 +1,23 @@
 from pathlib import Path
 from datetime import timedelta
 import os
-from dotenv import load_dotenv
+import tempfile
+import warnings
 from urllib.parse import urlparse, parse_qsl
 
 # ======================
-# LOAD ENVIRONMENT VARIABLES
+# BASE DIR
 # ======================
-load_dotenv()
+BASE_DIR = Path(__file__).resolve().parent.parent
 
 # ======================
-# BASE DIR
+# LOAD ENVIRONMENT VARIABLES
 # ======================
-BASE_DIR = Path(__file__).resolve().parent.parent
+# Deployed hosts set real environment variables; only import python-dotenv
+# when there is a .env file to read
+if (BASE_DIR / '.env').exists():
+    from dotenv import load_dotenv
+    load_dotenv(BASE_DIR / '.env')
 
 # ======================
 # SECURITY
@@ -41,20 +46,29 @@ INSTALLED_APPS = [
     # Third-party
     'rest_framework',
     'corsheaders',
-    'cloudinary_storage',  # Add Cloudinary storage
     'cloudinary',          # Add Cloudinary
 
     # Local apps
     'user',
     'history',
+    'leaderboard',
+
+    # Project-wide management commands (benchmarks, profiling)
+    'trash2cash',
 ]
 
 AUTH_USER_MODEL = 'user.User'
 
+AUTHENTICATION_BACKENDS = [
+    'user.backends.EmailOrPhoneBackend',
+]
+
 # ======================
 # MIDDLEWARE
 # ======================
 MIDDLEWARE = [
+    'trash2cash.instrumentation.RequestTimingMiddleware',  # First, so its total covers the rest
+    'trash2cash.querycheck.QueryInspectorMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
@@ -66,6 +80,33 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
+# Per-request query counts and timings, see trash2cash.instrumentation
+REQUEST_TIMING = {
+    # Timings help an attacker tell code paths apart; off in production unless asked for
+    'HEADER': os.environ.get('SERVER_TIMING_HEADER', str(DEBUG)) == 'True',
+}
+
+# Latency, in-flight and cache metrics, see trash2cash.metrics. Each
+# process writes its own file under DIR and /metrics adds them up, so DIR
+# must be shared by all gunicorn workers. /metrics answers 404 until
+# METRICS_TOKEN is set and then wants "Authorization: Bearer <token>".
+METRICS = {
+    'ENABLED': os.environ.get('METRICS_ENABLED', 'True') == 'True',
+    'DIR': os.environ.get('METRICS_DIR', os.path.join(tempfile.gettempdir(), 'trash2cash-metrics')),
+    'TOKEN': os.environ.get('METRICS_TOKEN', ''),
+}
+
+# N+1 and slow-query detection, see trash2cash.querycheck. Flags any query
+# shape run REPEAT_THRESHOLD or more times in one request and any single
+# query over SLOW_MS, logging the call stack to trash2cash.queries. On by
+# default under DEBUG; RAISE turns the warnings into request errors.
+QUERY_INSPECTOR = {
+    'ENABLED': os.environ.get('QUERY_INSPECTOR', str(DEBUG)) == 'True',
+    'REPEAT_THRESHOLD': int(os.environ.get('QUERY_REPEAT_THRESHOLD', '5')),
+    'SLOW_MS': float(os.environ.get('SLOW_QUERY_MS', '100')),
+    'RAISE': os.environ.get('QUERY_INSPECTOR_RAISE', 'False') == 'True',
+}
+
 # ======================
 # URLS / WSGI
 # ======================
@@ -94,39 +135,48 @@ WSGI_APPLICATION = 'trash2cash.wsgi.application'
 # ======================
 DATABASE_URL = os.environ.get('DATABASE_URL')
 
+
+def database_from_url(url):
+    """DATABASES entry for a Neon/PostgreSQL URL, or sqlite:///path for local setups."""
+    parsed = urlparse(url)
+    if parsed.scheme == 'sqlite':
+        return {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': parsed.path[1:] or BASE_DIR / 'db.sqlite3',
+        }
+    
+    # Extract database name (remove leading slash)
+    db_name = parsed.path.replace('/', '')
+    if not db_name:
+        db_name = 'neondb'  # Default database name
+    
+    # Extract query parameters
+    query_params = dict(parse_qsl(parsed.query))
+    
+    database = {
+        'ENGINE': 'django.db.backends.postgresql',
+        'NAME': db_name,
+        'USER': parsed.username,
+        'PASSWORD': parsed.password,
+        'HOST': parsed.hostname,
+        'PORT': parsed.port or 5432,
+        'OPTIONS': query_params,
+    }
+    
+    # Ensure sslmode is set for Neon
+    if 'sslmode' not in database['OPTIONS']:
+        database['OPTIONS']['sslmode'] = 'require'
+    return database
+
+
 if DATABASE_URL:
     # Parse Neon PostgreSQL connection URL
     try:
-        tmpPostgres = urlparse(DATABASE_URL)
-        
-        # Extract database name (remove leading slash)
-        db_name = tmpPostgres.path.replace('/', '')
-        if not db_name:
-            db_name = 'neondb'  # Default database name
-        
-        # Extract query parameters
-        query_params = dict(parse_qsl(tmpPostgres.query))
-        
         DATABASES = {
-            'default': {
-                'ENGINE': 'django.db.backends.postgresql',
-                'NAME': db_name,
-                'USER': tmpPostgres.username,
-                'PASSWORD': tmpPostgres.password,
-                'HOST': tmpPostgres.hostname,
-                'PORT': tmpPostgres.port or 5432,
-                'OPTIONS': query_params,
-            }
+            'default': database_from_url(DATABASE_URL)
         }
-        
-        # Ensure sslmode is set for Neon
-        if 'sslmode' not in DATABASES['default']['OPTIONS']:
-            DATABASES['default']['OPTIONS']['sslmode'] = 'require'
-        
-        print(f"✅ Connected to Neon PostgreSQL: {tmpPostgres.hostname}")
-        
     except Exception as e:
-        print(f"❌ Error parsing DATABASE_URL: {e}")
+        warnings.warn(f"Error parsing DATABASE_URL ({e}), falling back to SQLite")
         # Fallback to SQLite
         DATABASES = {
             'default': {
@@ -134,7 +184,6 @@ if DATABASE_URL:
                 'NAME': BASE_DIR / 'db.sqlite3',
             }
         }
-        print("⚠️ Falling back to SQLite database")
 else:
     # Fallback to SQLite for local development
     DATABASES = {
@@ -143,7 +192,69 @@ else:
             'NAME': BASE_DIR / 'db.sqlite3',
         }
     }
-    print("⚠️ DATABASE_URL not set. Using SQLite for local development.")
+
+# Optional read replica for the history feed, see trash2cash.routers
+DATABASE_REPLICA_URL = os.environ.get('DATABASE_REPLICA_URL')
+if DATABASE_REPLICA_URL:
+    DATABASES['replica'] = database_from_url(DATABASE_REPLICA_URL)
+DATABASE_ROUTERS = ['trash2cash.routers.ReplicaRouter']
+REPLICA = {
+    # How long a user's reads stay on the primary after they scan or transfer
+    'STICKY_SECONDS': int(os.environ.get('REPLICA_STICKY_SECONDS', 10)),
+}
+
+# Scans keep the date the app reports within this window, so scans buffered
+# offline are dated when they happened; anything outside it is stored as now.
+# MAX_AGE_DAYS must stay below HISTORY_ARCHIVE['HOT_DAYS'].
+QR_SCAN_DATES = {
+    'MAX_AGE_DAYS': int(os.environ.get('QR_SCAN_MAX_AGE_DAYS', 7)),
+    'MAX_SKEW_SECONDS': int(os.environ.get('QR_SCAN_MAX_SKEW_SECONDS', 300)),
+}
+
+# History rows older than HOT_DAYS are moved to HistoryArchive by
+# `manage.py archive_history` (run it daily), BATCH_SIZE rows per transaction
+HISTORY_ARCHIVE = {
+    'HOT_DAYS': int(os.environ.get('HISTORY_HOT_DAYS', 365)),
+    'BATCH_SIZE': int(os.environ.get('HISTORY_ARCHIVE_BATCH_SIZE', 5000)),
+}
+
+# Reuse connections across requests instead of paying a TCP + TLS handshake
+# each time, and ping a reused connection before its first query of a
+# request (Neon drops idle connections when it suspends compute)
+for db in DATABASES.values():
+    db['CONN_MAX_AGE'] = int(os.environ.get('DB_CONN_MAX_AGE', 60))  # seconds
+    db['CONN_HEALTH_CHECKS'] = os.environ.get('DB_CONN_HEALTH_CHECKS', 'True') == 'True'
+
+    # Optional in-process pool shared by a worker's threads (ASGI, upload
+    # workers); see trash2cash.db.pool
+    if os.environ.get('DB_POOL', 'False') == 'True':
+        db['ENGINE'] = db['ENGINE'].replace('django.db.backends.', 'trash2cash.db.backends.')
+        db['POOL'] = {
+            'MAX_SIZE': int(os.environ.get('DB_POOL_MAX_SIZE', 4)),
+            'MAX_IDLE': int(os.environ.get('DB_POOL_MAX_IDLE', 240)),  # seconds
+        }
+
+# ======================
+# CACHE
+# ======================
+# The throttle buckets and the replica pins have to be seen by every
+# gunicorn worker and need an atomic incr, so production sets REDIS_URL.
+# Without it each process gets its own local-memory cache, which is only
+# right for development and tests.
+REDIS_URL = os.environ.get('REDIS_URL')
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
 
 # ======================
 # PASSWORD VALIDATION
@@ -160,11 +271,26 @@ AUTH_PASSWORD_VALIDATORS = [
 # ======================
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'user.authentication.CachedJWTAuthentication',
     ),
     'DEFAULT_PERMISSION_CLASSES': (
         'rest_framework.permissions.IsAuthenticated',
     ),
+    # Proxies in front of the app that append to X-Forwarded-For (1: the
+    # platform router). The IP throttles key on the address the outermost of
+    # them saw; everything a client put in the header before it is ignored.
+    'NUM_PROXIES': int(os.environ.get('NUM_PROXIES', 1)),
+    # Token-bucket rates for views with a throttle_scope, see trash2cash.throttling.
+    # '<scope>' is per user, '<scope>_ip' per client IP, '<scope>_account' per
+    # account named in the request body.
+    'DEFAULT_THROTTLE_RATES': {
+        'qr_scan': os.environ.get('THROTTLE_QR_SCAN', '60/min'),
+        'qr_scan_ip': os.environ.get('THROTTLE_QR_SCAN_IP', '600/min'),
+        'check_receiver': os.environ.get('THROTTLE_CHECK_RECEIVER', '30/min'),
+        'check_receiver_ip': os.environ.get('THROTTLE_CHECK_RECEIVER_IP', '120/min'),
+        'login_ip': os.environ.get('THROTTLE_LOGIN_IP', '30/min'),
+        'login_account': os.environ.get('THROTTLE_LOGIN_ACCOUNT', '10/min'),
+    },
 }
 
 SIMPLE_JWT = {
@@ -173,6 +299,34 @@ SIMPLE_JWT = {
     'AUTH_HEADER_TYPES': ('Bearer',),
 }
 
+# ======================
+# IDENTITY CACHE
+# ======================
+# In-process cache for email/phone -> user lookups on the transfer path
+IDENTITY_CACHE = {
+    'MAX_SIZE': int(os.environ.get('IDENTITY_CACHE_MAX_SIZE', 1024)),
+    'TTL': int(os.environ.get('IDENTITY_CACHE_TTL', 60)),  # seconds
+}
+
+# In-process cache of authenticated users, see user.authentication
+PRINCIPAL_CACHE = {
+    'MAX_SIZE': int(os.environ.get('PRINCIPAL_CACHE_MAX_SIZE', 4096)),
+    'TTL': int(os.environ.get('PRINCIPAL_CACHE_TTL', 60)),  # seconds
+}
+
+TOKEN_REVOCATION = {
+    # How often each worker pulls revocations made by other workers
+    'SYNC_SECONDS': float(os.environ.get('TOKEN_REVOCATION_SYNC_SECONDS', 1)),
+}
+
+# ======================
+# LEADERBOARD
+# ======================
+LEADERBOARD = {
+    # How long a worker serves its in-process boards before syncing them with the snapshot
+    'REFRESH_SECONDS': int(os.environ.get('LEADERBOARD_REFRESH_SECONDS', 30)),
+}
+
 # ======================
 # CLOUDINARY CONFIGURATION
 # ======================
@@ -188,6 +342,30 @@ CLOUDINARY_STORAGE = {
 # Use Cloudinary for media files
 DEFAULT_FILE_STORAGE = 'cloudinary_storage.storage.MediaCloudinaryStorage'
 
+# Profile images are staged on local disk and uploaded by background
+# workers, see user.uploads
+PROFILE_IMAGE_UPLOADS = {
+    'BACKEND': os.environ.get('PROFILE_IMAGE_BACKEND', 'user.uploads.CloudinaryUploadBackend'),
+    'WORKERS': int(os.environ.get('PROFILE_IMAGE_WORKERS', 2)),
+    'RETRIES': int(os.environ.get('PROFILE_IMAGE_RETRIES', 2)),
+    'STAGING_DIR': os.environ.get(
+        'PROFILE_IMAGE_STAGING_DIR', os.path.join(tempfile.gettempdir(), 'trash2cash-uploads')
+    ),
+    # Run uploads inline instead of on the worker pool (tests, management commands)
+    'EAGER': os.environ.get('PROFILE_IMAGE_EAGER', 'False') == 'True',
+}
+
+# Image uploads are validated while they stream in (user.images); anything
+# over MAX_UPLOAD_SIZE is refused before it is buffered, and accepted files
+# above 256KB are spooled to disk instead of memory
+MAX_UPLOAD_SIZE = int(os.environ.get('MAX_UPLOAD_SIZE', 2 * 1024 * 1024))  # 2MB
+FILE_UPLOAD_MAX_MEMORY_SIZE = 256 * 1024
+FILE_UPLOAD_HANDLERS = [
+    'user.images.ImageUploadHandler',
+    'django.core.files.uploadhandler.MemoryFileUploadHandler',
+    'django.core.files.uploadhandler.TemporaryFileUploadHandler',
+]
+
 # Media URL will be automatically handled by Cloudinary
 # Don't define MEDIA_URL or MEDIA_ROOT when using Cloudinary
 # Cloudinary will serve files from https://res.cloudinary.com/your-cloud-name/
@@ -222,6 +400,31 @@ CORS_ALLOW_HEADERS = [
     'x-requested-with',
 ]
 
+# ======================
+# LOGGING
+# ======================
+# One JSON line per request from trash2cash.instrumentation; off under
+# DEBUG, where runserver already logs requests
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'trash2cash.requests': {
+            'handlers': ['console'],
+            'level': os.environ.get('REQUEST_LOG_LEVEL', 'WARNING' if DEBUG else 'INFO'),
+            'propagate': False,
+        },
+        'trash2cash.queries': {
+            'handlers': ['console'],
+            'level': 'WARNING',
+            'propagate': False,
+        },
+    },
+}
+
 # ======================
 # DEFAULT PK
 # ======================
@@ -234,9 +437,11 @@ if DEBUG and not os.environ.get('USE_CLOUDINARY', False):
     # Only use local media storage in development
     # Remove or comment Cloudinary settings above if needed
     MEDIA_URL = '/media/'
-    MEDIA_ROOT = BASE_DIR / 'media'
+    MEDIA_ROOT = BASE_DIR / 'media'  # Created by the storage on first save
     DEFAULT_FILE_STORAGE = 'django.core.files.storage.FileSystemStorage'
-    os.makedirs(MEDIA_ROOT, exist_ok=True)
-    print("⚠️ Using local media storage (development mode)")
 else:
-    print("✅ Using Cloudinary for media storage")
\ No newline at end of file
+    # The storage app is only loaded when it is the media storage in use
+    INSTALLED_APPS.insert(INSTALLED_APPS.index('cloudinary'), 'cloudinary_storage')
+
+# `python manage.py profile_imports` reports what a cold start spends on
+# imports; keep module-level work in this file cheap
\ No newline at end of file
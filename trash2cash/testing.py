@@ -0,0 +1,53 @@
+# trash2cash/testing.py - Test helpers shared by the apps' test suites
+from contextlib import contextmanager
+
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.test.utils import CaptureQueriesContext
+
+from .querycheck import QueryProblemsDetected, inspect_queries
+
+
+class _AssertMaxQueriesContext(CaptureQueriesContext):
+    def __init__(self, test_case, budget, connection):
+        self.test_case = test_case
+        self.budget = budget
+        super().__init__(connection)
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        super().__exit__(exc_type, exc_value, traceback)
+        if exc_type is not None:
+            return
+        executed = len(self)
+        self.test_case.assertLessEqual(
+            executed, self.budget,
+            "%d queries executed, over the budget of %d\nCaptured queries were:\n%s" % (
+                executed, self.budget,
+                '\n'.join(
+                    '%d. %s' % (i, query['sql'])
+                    for i, query in enumerate(self.captured_queries, start=1)
+                ),
+            ),
+        )
+
+
+class QueryBudgetMixin:
+    """
+    ``assertMaxQueries`` for TestCase classes: like ``assertNumQueries``, but
+    only fails when an endpoint goes over its query budget, so it guards
+    against N+1 regressions without pinning the exact count.
+    """
+
+    def assertMaxQueries(self, budget, using=DEFAULT_DB_ALIAS):
+        return _AssertMaxQueriesContext(self, budget, connections[using])
+
+    @contextmanager
+    def assertNoQueryProblems(self, repeat_threshold=None, slow_ms=None):
+        """
+        Fail if the block repeats a query shape or runs a slow query, see
+        trash2cash.querycheck; the failure shows where each was issued.
+        """
+        try:
+            with inspect_queries(self.id(), repeat_threshold, slow_ms, raise_problems=True) as inspector:
+                yield inspector
+        except QueryProblemsDetected as error:
+            self.fail(str(error))
@@ -0,0 +1,143 @@
+# trash2cash/throttling.py - Token-bucket request throttles
+import hashlib
+import math
+import time
+
+from django.core.cache import cache as default_cache
+from rest_framework.settings import api_settings
+from rest_framework.throttling import BaseThrottle
+
+DURATIONS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+
+def parse_rate(rate):
+    """'30/min' -> (30, 60). Only the first letter of the period counts, as in DRF."""
+    num, period = rate.split('/')
+    return int(num), DURATIONS[period[0]]
+
+
+class TokenBucketThrottle(BaseThrottle):
+    """
+    Token bucket kept as one integer cache entry per client.
+
+    A bucket holds up to N tokens for a 'N/period' rate and refills
+    continuously, so clients get smooth limits without a fixed window
+    edge. The entry is the time, in microseconds, at which the bucket will
+    be full again (the GCRA form of a token bucket): taking tokens is one
+    atomic ``incr``, and a request that overdraws the bucket puts its
+    tokens back with ``decr``. Concurrent requests therefore can't both
+    spend the last token, provided the cache's incr is atomic and shared
+    by every worker, which the Redis backend configured from REDIS_URL is
+    (see CACHES in settings). It all runs before the view's serializer.
+
+    Views may define ``throttle_cost(request)`` to take more than one
+    token per request. Such views should refuse requests costing more than
+    capacity() themselves, with a 400 that says so: the bucket can never
+    hold that many tokens, so here they are only refused after a full
+    period.
+
+    Rates come from REST_FRAMEWORK['DEFAULT_THROTTLE_RATES'] under the view's
+    ``throttle_scope`` plus ``scope_suffix``; views without a configured
+    rate are not throttled.
+    """
+    cache = default_cache
+    scope_suffix = ''
+
+    def get_ident_key(self, request):
+        raise NotImplementedError
+
+    def get_scope(self, view):
+        """The view's rate scope for this throttle, or None when it isn't throttled."""
+        scope = getattr(view, 'throttle_scope', None)
+        if not scope:
+            return None
+        scope += self.scope_suffix
+        return scope if scope in api_settings.DEFAULT_THROTTLE_RATES else None
+
+    def capacity(self, view):
+        """Most tokens one request can take from the view's bucket, or None without a rate."""
+        scope = self.get_scope(view)
+        return None if scope is None else parse_rate(api_settings.DEFAULT_THROTTLE_RATES[scope])[0]
+
+    def allow_request(self, request, view):
+        scope = self.get_scope(view)
+        if scope is None:
+            return True
+
+        capacity, period = parse_rate(api_settings.DEFAULT_THROTTLE_RATES[scope])
+        cost = view.throttle_cost(request) if hasattr(view, 'throttle_cost') else 1
+        if cost > capacity:
+            self.retry_after = period
+            return False
+
+        interval = period * 1_000_000 // capacity  # microseconds per token
+        charge = cost * interval
+        key = f"throttle:{scope}:{self.get_ident_key(request)}"
+
+        now = int(time.time() * 1_000_000)
+        # A missing entry means a full bucket
+        self.cache.add(key, now, timeout=period)
+        try:
+            full_at = self.cache.incr(key, charge)
+        except ValueError:
+            # The entry expired between add and incr
+            full_at = now + charge
+            self.cache.set(key, full_at, timeout=period)
+
+        overdraft = full_at - now - period * 1_000_000
+        if overdraft > 0:
+            try:
+                self.cache.decr(key, charge)
+            except ValueError:
+                pass
+            self.retry_after = overdraft / 1_000_000
+            return False
+
+        # Keep the entry until the bucket is full again, and not much longer
+        self.cache.touch(key, timeout=math.ceil((full_at - now) / 1_000_000) + 1)
+        return True
+
+    def wait(self):
+        return getattr(self, 'retry_after', None)
+
+
+class UserTokenBucketThrottle(TokenBucketThrottle):
+    """Per authenticated user; anonymous requests are left to the IP throttle."""
+
+    def allow_request(self, request, view):
+        if not (request.user and request.user.is_authenticated):
+            return True
+        return super().allow_request(request, view)
+
+    def get_ident_key(self, request):
+        return f"user:{request.user.pk}"
+
+
+class IPTokenBucketThrottle(TokenBucketThrottle):
+    """Per client IP, using the '<scope>_ip' rate."""
+    scope_suffix = '_ip'
+
+    def get_ident_key(self, request):
+        return f"ip:{self.get_ident(request)}"
+
+
+class IdentifierTokenBucketThrottle(TokenBucketThrottle):
+    """
+    Per account named in the request body, using the '<scope>_account' rate,
+    so attempts on one account are limited however many IPs they come from.
+
+    The view's ``throttle_identifier_field`` names the field. Its value is
+    normalised (trimmed, lowercased) and hashed for the cache key; requests
+    without it are left to the other throttles.
+    """
+    scope_suffix = '_account'
+
+    def allow_request(self, request, view):
+        identifier = request.data.get(getattr(view, 'throttle_identifier_field', ''))
+        if not isinstance(identifier, str) or not identifier.strip():
+            return True
+        self.identifier = identifier.strip().lower()
+        return super().allow_request(request, view)
+
+    def get_ident_key(self, request):
+        return f"account:{hashlib.sha256(self.identifier.encode()).hexdigest()}"
@@ -1,8 +1,8 @@
 from django.contrib import admin
 from django.urls import path, include
-from rest_framework_simplejwt.views import TokenRefreshView
+from user.views import TokenRefreshAPIView
+from trash2cash.views import metrics_view
 from django.conf import settings
-from django.conf.urls.static import static
 
 urlpatterns = [
     path('admin/', admin.site.urls),
@@ -13,11 +13,20 @@ urlpatterns = [
     # Transaction / History APIs
     path('api/points/', include('history.urls')),
 
+    # Leaderboard APIs
+    path('api/leaderboard/', include('leaderboard.urls')),
+
     # JWT refresh
-    path('api/auth/token/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
+    path('api/auth/token/refresh/', TokenRefreshAPIView.as_view(), name='token_refresh'),
+
+    # Prometheus scrape target, token protected
+    path('metrics', metrics_view, name='metrics'),
 ]
 
-# Serve media and static files in development
+# Serve media and static files in development; production never imports
+# the static serving views
 if settings.DEBUG:
+    from django.conf.urls.static import static
+
     urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
     urlpatterns += static(settings.STATIC_URL, document_root=settings.STATIC_ROOT)
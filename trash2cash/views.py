@@ -0,0 +1,24 @@
+# trash2cash/views.py - Project-level endpoints
+import hmac
+
+from django.conf import settings
+from django.http import Http404, HttpResponse
+from django.views.decorators.http import require_GET
+
+from . import metrics
+
+PROMETHEUS_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+@require_GET
+def metrics_view(request):
+    """Prometheus scrape target, summed over every worker process."""
+    token = settings.METRICS['TOKEN']
+    if not token:
+        raise Http404
+    scheme, _, supplied = request.headers.get('Authorization', '').partition(' ')
+    if scheme.lower() != 'bearer' or not hmac.compare_digest(supplied.encode(), token.encode()):
+        response = HttpResponse("Unauthorized", status=401, content_type='text/plain')
+        response['WWW-Authenticate'] = 'Bearer realm="metrics"'
+        return response
+    return HttpResponse(metrics.generate_latest(), content_type=PROMETHEUS_CONTENT_TYPE)
@@ -0,0 +1,83 @@
+# trash2cash/warmup.py - Pay first-request costs before a worker takes traffic
+import logging
+import threading
+
+from django.db import connections
+from django.urls import get_resolver
+
+from trash2cash.db.pool import PooledDatabaseWrapperMixin
+
+logger = logging.getLogger(__name__)
+
+# Seconds to wait for the request threads to open their connections
+WARM_TIMEOUT = 10
+
+
+def warm_url_resolver():
+    """Import every URLconf, view and serializer module and build the resolver's lookup tables."""
+    resolver = get_resolver()
+    resolver.url_patterns
+    resolver.reverse_dict
+
+
+def _warm_request_threads(alias, threads, executor):
+    """Open ``alias`` once on each of ``executor``'s threads."""
+    # Each task waits for the others, so every thread of the pool takes one
+    started = threading.Barrier(threads, timeout=WARM_TIMEOUT)
+
+    def warm():
+        try:
+            started.wait()
+        except threading.BrokenBarrierError:
+            pass
+        connections[alias].ensure_connection()
+
+    for future in [executor.submit(warm) for _ in range(threads)]:
+        future.result(timeout=WARM_TIMEOUT)
+
+
+def warm_connections(threads=1, executor=None):
+    """
+    Open the database connections the first requests would otherwise open.
+
+    Django connections are per thread, so they are opened where requests
+    will use them: on this thread for single-threaded workers, on each
+    thread of ``executor`` (the gthread worker's request pool), where
+    CONN_MAX_AGE keeps them for that thread's requests, or, for the pooled
+    backends (DB_POOL=True), one per thread parked in the pool. Without
+    any of those a connection opened here would never serve a request, so
+    it only checks the database is reachable and is closed again.
+    """
+    for alias in connections:
+        try:
+            if threads == 1:
+                connections[alias].ensure_connection()
+            elif isinstance(connections[alias], PooledDatabaseWrapperMixin):
+                wrappers = [connections.create_connection(alias) for _ in range(threads)]
+                for wrapper in wrappers:
+                    wrapper.ensure_connection()
+                for wrapper in wrappers:
+                    wrapper.close()
+            elif executor is not None:
+                _warm_request_threads(alias, threads, executor)
+            else:
+                connections[alias].ensure_connection()
+                connections[alias].close()
+        except Exception:
+            logger.warning("Could not pre-open the %r database connection", alias, exc_info=True)
+
+
+def warm_caches():
+    """Fill the in-process revocation list, which every authenticated request consults."""
+    from user.revocation import _sync
+
+    try:
+        _sync()
+    except Exception:
+        logger.warning("Could not pre-load revoked tokens", exc_info=True)
+
+
+def warm_up(threads=1, executor=None):
+    warm_url_resolver()
+    warm_connections(threads, executor)
+    warm_caches()
@@ -0,0 +1,91 @@
+# user/authentication.py - JWT authentication without a user query per request
+import time
+
+from django.conf import settings
+from rest_framework_simplejwt.authentication import (
+    JWTAuthentication,
+    JWTStatelessUserAuthentication,
+)
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.utils import get_md5_hash_password
+
+from .cache import TTLCache, freeze_instance, thaw_instance, user_version
+from .revocation import is_revoked
+
+# user id -> (frozen user, user_version() when it was loaded)
+_principals = TTLCache(
+    max_size=settings.PRINCIPAL_CACHE['MAX_SIZE'], ttl=settings.PRINCIPAL_CACHE['TTL'],
+    name='principals',
+)
+
+
+def forget_principal(user_id):
+    _principals.delete(user_id)
+
+
+def clear_principals():
+    _principals.clear()
+
+
+class RevocationCheckMixin:
+    """Reject tokens revoked through logout."""
+
+    def get_validated_token(self, raw_token):
+        validated_token = super().get_validated_token(raw_token)
+        if is_revoked(validated_token.get(api_settings.JTI_CLAIM)):
+            raise InvalidToken("Token has been revoked")
+        return validated_token
+
+
+class CachedJWTAuthentication(RevocationCheckMixin, JWTAuthentication):
+    """
+    JWTAuthentication that keeps the resolved user in process.
+
+    Entries live no longer than the token that loaded them and at most
+    PRINCIPAL_CACHE['TTL'] seconds. Saving or deleting the user row
+    (is_active, password and profile changes) drops this process's entry
+    and replaces the user's stamp in the shared cache, so every other
+    worker's entry stops matching on its next hit: a hit costs one shared
+    cache read and no query. Only identity and auth columns are kept; the
+    balance and image columns (User.VOLATILE_FIELDS) come back deferred
+    and are read from the database when a view uses them.
+    """
+
+    def get_user(self, validated_token):
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            return super().get_user(validated_token)
+
+        version = user_version(user_id)
+        cached = _principals.get(user_id)
+        if cached is not None and cached[1] == version:
+            user = thaw_instance(cached[0])
+            if api_settings.CHECK_REVOKE_TOKEN and validated_token.get(
+                api_settings.REVOKE_TOKEN_CLAIM
+            ) != get_md5_hash_password(user.password):
+                raise AuthenticationFailed(
+                    "The user's password has been changed.", code="password_changed"
+                )
+            return user
+
+        user = super().get_user(validated_token)
+        remaining = validated_token.get('exp', 0) - time.time()
+        if remaining > 0:
+            _principals.set(
+                user_id, (freeze_instance(user, exclude=user.VOLATILE_FIELDS), version),
+                ttl=min(remaining, _principals.ttl),
+            )
+        return user
+
+
+class TokenUserAuthentication(RevocationCheckMixin, JWTStatelessUserAuthentication):
+    """
+    Opt-in mode for read-only endpoints: trust the signed claims and use a
+    TokenUser without touching the database.
+
+    request.user only carries the token claims, and is_active isn't
+    re-checked until the token expires, so views using it must filter by
+    ``request.user.id`` and must not need any other user fields.
+    """
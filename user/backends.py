@@ -0,0 +1,34 @@
+# user/backends.py - Authentication backends
+from django.contrib.auth.backends import ModelBackend
+
+from .identity import identity_filter, pick_match
+from .models import User
+
+
+class EmailOrPhoneBackend(ModelBackend):
+    """
+    Authenticate with an email address or phone number.
+
+    The user is found with one query on the uniquely indexed email and
+    phone columns, and the password hash is checked once. check_password()
+    re-hashes and saves the password when the configured hasher or its
+    parameters (such as the PBKDF2 iteration count) have changed.
+    """
+
+    def authenticate(self, request, username=None, password=None, email_or_phone=None, **kwargs):
+        identifier = email_or_phone or username or kwargs.get(User.USERNAME_FIELD)
+        if not identifier or password is None:
+            return None
+        identifier = identifier.strip()
+
+        matches = list(User._default_manager.filter(identity_filter(identifier))[:2])
+        if not matches:
+            # Run the default password hasher once to reduce the timing
+            # difference between an existing and a nonexistent user.
+            User().set_password(password)
+            return None
+
+        user = pick_match(matches, identifier)
+        if user.check_password(password) and self.user_can_authenticate(user):
+            return user
+        return None
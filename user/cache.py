@@ -0,0 +1,100 @@
+# user/cache.py - Small in-process caches
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from django.core.cache import cache as shared_cache
+
+from trash2cash import metrics
+
+
+class TTLCache:
+    """
+    Thread-safe LRU cache whose entries also expire after ``ttl`` seconds.
+
+    Lives in one process only: every gunicorn worker has its own copy, so
+    invalidation through signals is local. Entries that must not outlive a
+    change made by another worker carry a user_version() stamp and are
+    checked against it on every hit. Named caches count their hits and
+    misses in the ``cache_lookups_total`` metric.
+    """
+
+    def __init__(self, max_size=1024, ttl=60, name=None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.name = name
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None and entry[1] <= time.monotonic():
+                del self._data[key]
+                entry = None
+            if entry is not None:
+                self._data.move_to_end(key)
+        if self.name is not None and metrics.enabled():
+            metrics.CACHE_LOOKUPS.labels(self.name, 'miss' if entry is None else 'hit').inc()
+        return default if entry is None else entry[0]
+
+    def set(self, key, value, ttl=None):
+        if self.max_size <= 0:
+            return
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+def freeze_instance(instance, exclude=()):
+    """
+    Capture a model instance's column values as an immutable cache entry.
+    Columns in ``exclude`` aren't kept; they come back deferred, so the
+    thawed instance reads them from the database when first used.
+    """
+    model = type(instance)
+    names = tuple(
+        field.attname for field in model._meta.concrete_fields if field.attname not in exclude
+    )
+    values = tuple(getattr(instance, name) for name in names)
+    return model, instance._state.db, names, values
+
+
+def thaw_instance(frozen):
+    """Build a fresh instance from freeze_instance() output so callers can't mutate the cache."""
+    model, db, names, values = frozen
+    return model.from_db(db, names, values)
+
+
+def _version_key(user_id):
+    return f"user-version:{user_id}"
+
+
+def user_version(user_id):
+    """
+    Stamp of the user's row in the shared cache, replaced whenever the row
+    is saved or deleted in any worker (see bump_user_version()). Read it
+    before loading the row, so a save that lands in between is noticed.
+    """
+    return shared_cache.get(_version_key(user_id))
+
+
+def bump_user_version(user_id):
+    # A fresh random stamp rather than a counter, so a stamp the cache lost
+    # and recreated can never match an entry stored under the old one
+    shared_cache.set(_version_key(user_id), uuid.uuid4().hex, timeout=None)
@@ -0,0 +1,116 @@
+# user/identity.py - Resolve users by email or phone number
+from django.conf import settings
+from django.db.models import Q
+from django.db.models.functions import Lower
+
+from .cache import TTLCache, freeze_instance, thaw_instance, user_version
+from .models import User
+
+# lookup string -> user pk
+_lookups = TTLCache(
+    max_size=settings.IDENTITY_CACHE['MAX_SIZE'], ttl=settings.IDENTITY_CACHE['TTL'],
+    name='identity_lookups',
+)
+# user pk -> (frozen user, user_version() when it was loaded)
+_users = TTLCache(
+    max_size=settings.IDENTITY_CACHE['MAX_SIZE'], ttl=settings.IDENTITY_CACHE['TTL'],
+    name='identity_users',
+)
+
+
+def _remember(lookup, user, version):
+    # The stamp is read just after the row: a save committed in between
+    # can leave one stale entry, and the TTL still bounds that
+    _users.set(user.pk, (freeze_instance(user, exclude=User.VOLATILE_FIELDS), version))
+    _lookups.set(lookup, user.pk)
+
+
+def _cached(lookup):
+    pk = _lookups.get(lookup)
+    if pk is None:
+        return None
+    cached = _users.get(pk)
+    if cached is None:
+        return None
+    if cached[1] != user_version(pk):
+        # Saved by some worker since; the email or phone may have moved
+        _users.delete(pk)
+        return None
+    user = thaw_instance(cached[0])
+    if lookup not in (user.email, user.phone_number):
+        # The user changed their email or phone since this lookup was cached
+        _lookups.delete(lookup)
+        return None
+    return user
+
+
+def identity_filter(email_or_phone):
+    """Q matching a user by email or phone number; both columns are uniquely indexed."""
+    return Q(email=email_or_phone) | Q(phone_number=email_or_phone)
+
+
+def identity_conflicts(email=None, phone_number=None):
+    """
+    Which of ``email`` (case-insensitively) and ``phone_number`` already
+    belong to a user, as a set of field names, from one query.
+
+    The email side compares LOWER(email), which the user_email_lower_idx
+    functional index serves; email__iexact can't use an index.
+    """
+    match = Q()
+    if email:
+        match |= Q(email_lower=email.lower())
+    if phone_number:
+        match |= Q(phone_number=phone_number)
+    if not match:
+        return set()
+
+    # At most one user can hold the email and one the phone number
+    rows = User.objects.alias(email_lower=Lower('email')).filter(match).values_list(
+        'email', 'phone_number'
+    )[:2]
+    conflicts = set()
+    for row_email, row_phone in rows:
+        if email and row_email.lower() == email.lower():
+            conflicts.add('email')
+        if phone_number and row_phone == phone_number:
+            conflicts.add('phone_number')
+    return conflicts
+
+
+def pick_match(matches, email_or_phone):
+    """An email match wins, mirroring the old email-then-phone lookup order."""
+    return next((m for m in matches if m.email == email_or_phone), matches[0])
+
+
+def resolve_user(email_or_phone):
+    """
+    Return the user whose email or phone number matches, or None.
+
+    Uses a single ``email = x OR phone_number = x`` query and caches the
+    result, so the transfer path only hits the database once per receiver.
+    """
+    lookup = (email_or_phone or '').strip()
+    if not lookup:
+        return None
+
+    user = _cached(lookup)
+    if user is not None:
+        return user
+
+    matches = list(User.objects.filter(identity_filter(lookup))[:2])
+    if not matches:
+        return None
+    user = pick_match(matches, lookup)
+    _remember(lookup, user, user_version(user.pk))
+    return user
+
+
+def forget_user(pk):
+    """Drop a user from the cache; stale lookup keys are discarded lazily."""
+    _users.delete(pk)
+
+
+def clear_cache():
+    _lookups.clear()
+    _users.clear()
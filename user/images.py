@@ -0,0 +1,187 @@
+# user/images.py - Header-only image checks, shared by the upload handler and serializers
+import os
+import struct
+
+from django.conf import settings
+from django.core.files.uploadhandler import FileUploadHandler
+from rest_framework import serializers
+
+ALLOWED_IMAGE_EXTENSIONS = ['jpg', 'jpeg', 'png', 'gif']
+ALLOWED_IMAGE_FORMATS = {'jpeg', 'png', 'gif'}
+MAX_IMAGE_DIMENSION = 5000
+INVALID_IMAGE_MESSAGE = "Upload a valid JPEG, PNG or GIF image"
+
+# Enough for JPEGs whose size marker sits after a large EXIF block
+HEADER_BYTES = 128 * 1024
+# Room for the other form fields sent alongside an image
+FORM_OVERHEAD_BYTES = 64 * 1024
+
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+# JPEG start-of-frame markers; C4, C8 and CC share the range but aren't frames
+JPEG_SOF_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+# Markers without a length field
+JPEG_STANDALONE_MARKERS = {0x01, 0xD0, 0xD1, 0xD2, 0xD3, 0xD4, 0xD5, 0xD6, 0xD7}
+
+
+class NotAnImage(ValueError):
+    pass
+
+
+def _sniff_jpeg(data):
+    i = 2
+    while True:
+        if i >= len(data):
+            return None
+        if data[i] != 0xFF:
+            raise NotAnImage("Corrupt JPEG marker")
+        # Markers may be padded with extra 0xFF fill bytes
+        while i < len(data) and data[i] == 0xFF:
+            i += 1
+        if i >= len(data):
+            return None
+        marker = data[i]
+        i += 1
+        if marker in JPEG_STANDALONE_MARKERS:
+            continue
+        if marker in (0xD9, 0xDA):
+            raise NotAnImage("JPEG has no frame header before its image data")
+        if i + 2 > len(data):
+            return None
+        if marker in JPEG_SOF_MARKERS:
+            if i + 7 > len(data):
+                return None
+            height, width = struct.unpack('>HH', data[i + 3:i + 7])
+            return 'jpeg', width, height
+        (length,) = struct.unpack('>H', data[i:i + 2])
+        i += length
+
+
+def sniff_image(data):
+    """
+    (format, width, height) from the first bytes of an image file.
+
+    Only the format header is parsed; nothing is decoded. Returns None when
+    ``data`` is too short to tell yet and raises NotAnImage when it can't be
+    a JPEG, PNG or GIF.
+    """
+    if data.startswith(PNG_SIGNATURE):
+        if len(data) < 24:
+            return None
+        if data[12:16] != b'IHDR':
+            raise NotAnImage("PNG has no IHDR chunk")
+        width, height = struct.unpack('>II', data[16:24])
+        return 'png', width, height
+    if data[:6] in (b'GIF87a', b'GIF89a'):
+        if len(data) < 10:
+            return None
+        width, height = struct.unpack('<HH', data[6:10])
+        return 'gif', width, height
+    if data[:2] == b'\xff\xd8':
+        return _sniff_jpeg(data)
+    if len(data) < len(PNG_SIGNATURE):
+        return None
+    raise NotAnImage("Unrecognised image format")
+
+
+def check_extension(name):
+    ext = os.path.splitext(name or '')[1].lstrip('.').lower()
+    if ext not in ALLOWED_IMAGE_EXTENSIONS:
+        raise serializers.ValidationError(
+            f"File type not allowed. Allowed types: {', '.join(ALLOWED_IMAGE_EXTENSIONS)}"
+        )
+
+
+def check_size(size):
+    if size > settings.MAX_UPLOAD_SIZE:
+        raise serializers.ValidationError(
+            f"Image size must be less than {settings.MAX_UPLOAD_SIZE/1024/1024}MB"
+        )
+
+
+def check_header(data, complete=False):
+    """
+    Validate the sniffed header. Returns False while more bytes are needed,
+    unless ``complete`` says there are no more.
+    """
+    try:
+        info = sniff_image(data)
+    except NotAnImage:
+        raise serializers.ValidationError(INVALID_IMAGE_MESSAGE)
+    if info is None:
+        if complete or len(data) >= HEADER_BYTES:
+            raise serializers.ValidationError(INVALID_IMAGE_MESSAGE)
+        return False
+
+    image_format, width, height = info
+    if image_format not in ALLOWED_IMAGE_FORMATS:
+        raise serializers.ValidationError(f"Image format {image_format} is not allowed")
+    if width > MAX_IMAGE_DIMENSION or height > MAX_IMAGE_DIMENSION:
+        raise serializers.ValidationError(
+            f"Image dimensions too large. Maximum {MAX_IMAGE_DIMENSION}x{MAX_IMAGE_DIMENSION} pixels"
+        )
+    return True
+
+
+def validate_image_file(value):
+    """Serializer-side check for uploads that didn't stream through ImageUploadHandler."""
+    if not value:
+        return value
+    check_size(value.size)
+    check_extension(value.name)
+
+    value.seek(0)
+    check_header(value.read(HEADER_BYTES), complete=True)
+    value.seek(0)
+    return value
+
+
+class ImageRejected(serializers.ValidationError):
+    """Raised out of request.data parsing; DRF turns it into a 400."""
+
+
+class ImageUploadHandler(FileUploadHandler):
+    """
+    Validate image uploads while they stream in, ahead of Django's memory and
+    temporary-file handlers.
+
+    Requests whose Content-Length already exceeds the limit are refused
+    before the body is read. Otherwise only the byte count and the first
+    HEADER_BYTES of each file are kept, and parsing stops at the first chunk
+    that breaks the size, type or dimension limits. Memory per request stays
+    bounded whatever the client sends.
+    """
+
+    def handle_raw_input(self, input_data, META, content_length, boundary, encoding=None):
+        if content_length and content_length > settings.MAX_UPLOAD_SIZE + FORM_OVERHEAD_BYTES:
+            self._reject('image', f"Image size must be less than {settings.MAX_UPLOAD_SIZE/1024/1024}MB")
+
+    def new_file(self, field_name, file_name, *args, **kwargs):
+        super().new_file(field_name, file_name, *args, **kwargs)
+        self.size = 0
+        self.header = bytearray()
+        self.header_checked = False
+        self._check(check_extension, file_name)
+
+    def receive_data_chunk(self, raw_data, start):
+        self.size += len(raw_data)
+        self._check(check_size, self.size)
+        if not self.header_checked:
+            self.header += raw_data[:HEADER_BYTES - len(self.header)]
+            self.header_checked = self._check(check_header, bytes(self.header))
+        return raw_data
+
+    def file_complete(self, file_size):
+        if not self.header_checked:
+            self._check(check_header, bytes(self.header), complete=True)
+        self.header = bytearray()
+        # Let the next handler build the UploadedFile
+        return None
+
+    def _check(self, check, *args, **kwargs):
+        try:
+            return check(*args, **kwargs)
+        except serializers.ValidationError as exc:
+            self._reject(self.field_name, exc.detail[0])
+
+    def _reject(self, field_name, message):
+        raise ImageRejected({field_name: [message]})
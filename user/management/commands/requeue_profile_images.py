@@ -0,0 +1,52 @@
+import os
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from user.models import User
+from user.uploads import process_image, staged_user_id
+
+
+class Command(BaseCommand):
+    help = (
+        "Upload profile images left in the staging directory by a worker that "
+        "stopped before finishing, and clear their pending status"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--older-than', type=int, default=10,
+                            help="Minutes a staged file must be untouched, so in-flight uploads are skipped")
+
+    def handle(self, *args, **options):
+        staging_dir = settings.PROFILE_IMAGE_UPLOADS['STAGING_DIR']
+        if not os.path.isdir(staging_dir):
+            self.stdout.write("Nothing staged")
+            return
+
+        cutoff = time.time() - options['older_than'] * 60
+        staged = {}
+        for entry in os.scandir(staging_dir):
+            user_id = staged_user_id(entry.name)
+            if not entry.is_file() or user_id is None or entry.stat().st_mtime > cutoff:
+                continue
+            staged.setdefault(user_id, []).append(entry)
+
+        pending = set(
+            User.objects.filter(pk__in=staged, image_status=User.IMAGE_PENDING)
+            .values_list('pk', flat=True)
+        )
+        counts = {}
+        for user_id, entries in staged.items():
+            # Only the most recent upload matters; older ones were superseded
+            entries.sort(key=lambda entry: entry.stat().st_mtime)
+            for entry in entries[:-1]:
+                os.remove(entry.path)
+            if user_id in pending:
+                status = process_image(user_id, entries[-1].path)
+                counts[status] = counts.get(status, 0) + 1
+            else:
+                os.remove(entries[-1].path)
+
+        summary = ', '.join(f"{count} {status}" for status, count in counts.items()) or 'none'
+        self.stdout.write(self.style.SUCCESS(f"Requeued uploads: {summary}"))
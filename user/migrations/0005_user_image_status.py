@@ -0,0 +1,24 @@
+# Generated by Django 4.2.8 on 2026-10-17 18:09
+
+from django.db import migrations, models
+
+
+def mark_existing_images_ready(apps, schema_editor):
+    User = apps.get_model('user', 'User')
+    User.objects.exclude(image__isnull=True).exclude(image='').update(image_status='ready')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('user', '0004_revokedtoken'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='image_status',
+            field=models.CharField(choices=[('none', 'No image'), ('pending', 'Uploading'), ('ready', 'Ready'), ('failed', 'Upload failed')], default='none', max_length=10),
+        ),
+        migrations.RunPython(mark_existing_images_ready, migrations.RunPython.noop),
+    ]
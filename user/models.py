@@ -1,6 +1,7 @@
 from django.db import models
 from django.contrib.auth.models import AbstractBaseUser, PermissionsMixin, BaseUserManager
 from django.core.validators import RegexValidator
+from django.db.models.functions import Lower
 from cloudinary.models import CloudinaryField  # Add this import
 
 
@@ -56,6 +57,22 @@ class User(AbstractBaseUser, PermissionsMixin):
         null=True,
         blank=True
     )
+    IMAGE_NONE = 'none'
+    IMAGE_PENDING = 'pending'
+    IMAGE_READY = 'ready'
+    IMAGE_FAILED = 'failed'
+    IMAGE_STATUS_CHOICES = [
+        (IMAGE_NONE, 'No image'),
+        (IMAGE_PENDING, 'Uploading'),
+        (IMAGE_READY, 'Ready'),
+        (IMAGE_FAILED, 'Upload failed'),
+    ]
+    # Set by user.uploads while a new image is on its way to Cloudinary
+    image_status = models.CharField(
+        max_length=10,
+        choices=IMAGE_STATUS_CHOICES,
+        default=IMAGE_NONE
+    )
     total_points = models.PositiveIntegerField(default=10)
     eco_level = models.CharField(
         max_length=30,
@@ -67,6 +84,24 @@ class User(AbstractBaseUser, PermissionsMixin):
 
     USERNAME_FIELD = 'email'
     REQUIRED_FIELDS = ['first_name', 'last_name', 'phone_number']
+    # Columns that change outside the request's own process (balance updates,
+    # background uploads). The in-process user caches never keep them.
+    VOLATILE_FIELDS = ('total_points', 'eco_level', 'image', 'image_status')
+    
+    class Meta:
+        indexes = [
+            # Case-insensitive email lookups, see user.identity.identity_conflicts
+            models.Index(Lower('email'), name='user_email_lower_idx'),
+        ]
+    
+    def refresh_from_db(self, using=None, fields=None):
+        # Reading one deferred volatile column loads the others with it, so
+        # a cached user costs one query for its balance and image, not four
+        if fields is not None:
+            deferred = self.get_deferred_fields().intersection(self.VOLATILE_FIELDS)
+            if deferred.intersection(fields):
+                fields = set(fields) | deferred
+        super().refresh_from_db(using=using, fields=fields)
     
     def update_eco_level(self):
         """Update eco level based on total points"""
@@ -89,4 +124,14 @@ class User(AbstractBaseUser, PermissionsMixin):
         return f"{self.first_name} {self.last_name}"
     
     def get_short_name(self):
-        return self.first_name
\ No newline at end of file
+        return self.first_name
+
+
+class RevokedToken(models.Model):
+    """A JWT revoked before its expiry, keyed by its jti claim."""
+    jti = models.CharField(max_length=255, unique=True)
+    expires_at = models.DateTimeField(db_index=True)
+    revoked_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    def __str__(self):
+        return f"{self.jti} (expires {self.expires_at})"
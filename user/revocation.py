@@ -0,0 +1,68 @@
+# user/revocation.py - Revoked JWT list
+import threading
+import time
+from datetime import datetime, timedelta, timezone as dt_timezone
+from hashlib import blake2b
+
+from django.conf import settings
+from django.utils import timezone
+from rest_framework_simplejwt.settings import api_settings
+
+from .models import RevokedToken
+
+# Rows committed by slow transactions can carry a revoked_at slightly older
+# than the previous sync, so each sync re-reads this much overlap.
+SYNC_OVERLAP = timedelta(seconds=60)
+
+# 64-bit jti digest -> expiry as a unix timestamp
+_revoked = {}
+_lock = threading.Lock()
+_next_sync = 0.0
+_synced_until = None
+
+
+def _digest(jti):
+    return int.from_bytes(blake2b(jti.encode(), digest_size=8).digest(), 'big')
+
+
+def _sync():
+    """Pull revocations made by other workers since the last sync and drop expired entries."""
+    global _next_sync, _synced_until
+    with _lock:
+        if time.monotonic() < _next_sync:
+            return
+        now = timezone.now()
+        rows = RevokedToken.objects.filter(expires_at__gt=now)
+        if _synced_until is not None:
+            rows = rows.filter(revoked_at__gte=_synced_until - SYNC_OVERLAP)
+        for jti, expires_at in rows.values_list('jti', 'expires_at'):
+            _revoked[_digest(jti)] = expires_at.timestamp()
+
+        cutoff = now.timestamp()
+        for digest in [d for d, exp in _revoked.items() if exp <= cutoff]:
+            del _revoked[digest]
+
+        _synced_until = now
+        _next_sync = time.monotonic() + settings.TOKEN_REVOCATION['SYNC_SECONDS']
+
+
+def is_revoked(jti):
+    """O(1) check against the in-process set, synced from the database at most once per SYNC_SECONDS."""
+    if not jti:
+        return False
+    if time.monotonic() >= _next_sync:
+        _sync()
+    expires_at = _revoked.get(_digest(jti))
+    return expires_at is not None and expires_at > time.time()
+
+
+def revoke_token(token):
+    """Revoke a simplejwt token until it would have expired anyway."""
+    jti = token.get(api_settings.JTI_CLAIM)
+    if not jti:
+        return
+    expires_at = datetime.fromtimestamp(token['exp'], tz=dt_timezone.utc)
+    RevokedToken.objects.get_or_create(jti=jti, defaults={'expires_at': expires_at})
+    _revoked[_digest(jti)] = expires_at.timestamp()
+    # Rows are only useful until their token expires; clean up on the way
+    RevokedToken.objects.filter(expires_at__lte=timezone.now()).delete()
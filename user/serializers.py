@@ -1,34 +1,45 @@
 from rest_framework import serializers
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.serializers import TokenRefreshSerializer as BaseTokenRefreshSerializer
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import RefreshToken
 from django.contrib.auth import authenticate
-from django.core.files.images import get_image_dimensions
-from django.core.exceptions import ValidationError
-from .models import User
+from trash2cash.instrumentation import TimedSerializerMixin
+from .identity import identity_conflicts
+from .models import User, phone_validator
+from .revocation import is_revoked
+from .images import validate_image_file
+from .uploads import queue_image
 import re
 
-# Constants matching your settings
-MAX_UPLOAD_SIZE = 2 * 1024 * 1024  # 2MB
-ALLOWED_IMAGE_EXTENSIONS = ['jpg', 'jpeg', 'png', 'gif']
-
 
 class CheckRegistrationSerializer(serializers.Serializer):
     email = serializers.EmailField(required=True)
     phone_number = serializers.CharField(required=True, max_length=15)
     
     def validate_email(self, value):
-        if User.objects.filter(email__iexact=value).exists():
-            raise serializers.ValidationError("Email already registered. Please login instead.")
         return value.lower()
     
     def validate_phone_number(self, value):
         phone_regex = r'^\+?\d{9,15}$'
         if not re.match(phone_regex, value):
             raise serializers.ValidationError("Phone number must be in the format +2519XXXXXXXX")
-        if User.objects.filter(phone_number=value).exists():
-            raise serializers.ValidationError("Phone number already registered. Please login instead.")
         return value
+    
+    def validate(self, data):
+        # One query tells which of the two is taken
+        conflicts = identity_conflicts(data['email'], data['phone_number'])
+        errors = {}
+        if 'email' in conflicts:
+            errors['email'] = ["Email already registered. Please login instead."]
+        if 'phone_number' in conflicts:
+            errors['phone_number'] = ["Phone number already registered. Please login instead."]
+        if errors:
+            raise serializers.ValidationError(errors)
+        return data
 
 
-class ProfileSerializer(serializers.ModelSerializer):
+class ProfileSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     image_url = serializers.SerializerMethodField(read_only=True)
     full_name = serializers.SerializerMethodField(read_only=True)
     
@@ -36,9 +47,11 @@ class ProfileSerializer(serializers.ModelSerializer):
         model = User
         fields = [
             'id', 'email', 'first_name', 'last_name', 'full_name',
-            'phone_number', 'image', 'image_url', 'total_points', 'eco_level'
+            'phone_number', 'image', 'image_url', 'image_status', 'total_points', 'eco_level'
+        ]
+        read_only_fields = [
+            'id', 'email', 'total_points', 'eco_level', 'image_url', 'image_status', 'full_name'
         ]
-        read_only_fields = ['id', 'email', 'total_points', 'eco_level', 'image_url', 'full_name']
     
     def get_full_name(self, obj):
         return f"{obj.first_name} {obj.last_name}"
@@ -54,35 +67,10 @@ class ProfileSerializer(serializers.ModelSerializer):
     
     def validate_image(self, value):
         """
-        Custom validation for image field
+        Size, type and dimensions from the file header; streamed uploads were
+        already checked by ImageUploadHandler
         """
-        if value:
-            # 1. Check file size
-            if hasattr(value, 'size') and value.size > MAX_UPLOAD_SIZE:
-                raise serializers.ValidationError(
-                    f"Image size must be less than {MAX_UPLOAD_SIZE/1024/1024}MB"
-                )
-            
-            # 2. Check file extension
-            if hasattr(value, 'name'):
-                ext = value.name.split('.')[-1].lower()
-                if ext not in ALLOWED_IMAGE_EXTENSIONS:
-                    raise serializers.ValidationError(
-                        f"File type not allowed. Allowed types: {', '.join(ALLOWED_IMAGE_EXTENSIONS)}"
-                    )
-            
-            # 3. Optional: Check image dimensions
-            try:
-                width, height = get_image_dimensions(value)
-                if width > 5000 or height > 5000:
-                    raise serializers.ValidationError(
-                        "Image dimensions too large. Maximum 5000x5000 pixels"
-                    )
-            except:
-                # If we can't read dimensions, still accept the file
-                pass
-        
-        return value
+        return validate_image_file(value)
     
     def update(self, instance, validated_data):
         # Update allowed fields
@@ -90,12 +78,16 @@ class ProfileSerializer(serializers.ModelSerializer):
         instance.last_name = validated_data.get('last_name', instance.last_name)
         instance.phone_number = validated_data.get('phone_number', instance.phone_number)
         
-        # Handle image separately to use validation
+        # Handle image separately: queue_image records the pending status
+        # itself and the upload finishes in the background
         image = validated_data.get('image')
         if image:
-            instance.image = image
+            queue_image(instance, image)
         
-        instance.save()
+        # Never write back columns this request didn't change, such as a
+        # balance credited by another worker since the user was loaded, or
+        # an image the background upload has already stored
+        instance.save(update_fields=['first_name', 'last_name', 'phone_number'])
         return instance
     
     def to_representation(self, instance):
@@ -111,7 +103,7 @@ class ProfileSerializer(serializers.ModelSerializer):
         return representation
 
 
-class RegisterSerializer(serializers.ModelSerializer):
+class RegisterSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     password = serializers.CharField(write_only=True, min_length=8)
     
     class Meta:
@@ -127,19 +119,19 @@ class RegisterSerializer(serializers.ModelSerializer):
             'eco_level',
         ]
         read_only_fields = ['total_points', 'eco_level']
+        # Uniqueness is checked in validate() with one query instead of a
+        # UniqueValidator query per field
+        extra_kwargs = {
+            'email': {'validators': []},
+            'phone_number': {'validators': [phone_validator]},
+        }
     
     def validate_email(self, value):
         """
-        Validate that email is unique and properly formatted
+        Validate that email is properly formatted
         """
         value = value.lower().strip()
         
-        # Check if email already exists
-        if User.objects.filter(email__iexact=value).exists():
-            raise serializers.ValidationError(
-                "This email is already registered. Please use a different email or login."
-            )
-        
         # Validate email format
         if not re.match(r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$', value):
             raise serializers.ValidationError("Please enter a valid email address.")
@@ -148,7 +140,7 @@ class RegisterSerializer(serializers.ModelSerializer):
     
     def validate_phone_number(self, value):
         """
-        Validate that phone number is unique and properly formatted
+        Validate that phone number is properly formatted
         """
         value = value.strip()
         
@@ -159,51 +151,39 @@ class RegisterSerializer(serializers.ModelSerializer):
                 "Phone number must be in Ethiopian format: +251XXXXXXXXX (e.g., +251911223344)"
             )
         
-        # Check if phone number already exists
-        if User.objects.filter(phone_number=value).exists():
-            raise serializers.ValidationError(
-                "This phone number is already registered. Please use a different number or login."
-            )
-        
         return value
     
+    def validate_image(self, value):
+        return validate_image_file(value)
+    
     def validate(self, data):
         """
         Additional validation that requires multiple fields
         """
-        # Check if both email and phone number already exist (for the same user)
-        email = data.get('email', '').lower()
-        phone_number = data.get('phone_number', '')
-        
-        # You could add additional cross-field validation here
-        # For example, check if the same person is trying to register with different emails
+        # Check whether the email or phone number is already registered, in one query
+        conflicts = identity_conflicts(data.get('email'), data.get('phone_number'))
+        errors = {}
+        if 'email' in conflicts:
+            errors['email'] = [
+                "This email is already registered. Please use a different email or login."
+            ]
+        if 'phone_number' in conflicts:
+            errors['phone_number'] = [
+                "This phone number is already registered. Please use a different number or login."
+            ]
+        if errors:
+            raise serializers.ValidationError(errors)
         
         return data
     
     def create(self, validated_data):
         password = validated_data.pop('password')
+        image = validated_data.pop('image', None)
         
-        # Handle image if present
-        image = validated_data.get('image')
-        if image:
-            # Validate image size
-            if hasattr(image, 'size') and image.size > MAX_UPLOAD_SIZE:
-                raise ValidationError(
-                    f"Image size must be less than {MAX_UPLOAD_SIZE/1024/1024}MB. "
-                    f"Your image is {image.size/1024/1024:.2f}MB."
-                )
-            
-            # Validate image extension
-            if hasattr(image, 'name'):
-                ext = image.name.split('.')[-1].lower()
-                if ext not in ALLOWED_IMAGE_EXTENSIONS:
-                    raise ValidationError(
-                        f"Only {', '.join(ALLOWED_IMAGE_EXTENSIONS)} files are allowed. "
-                        f"Your file type is .{ext}"
-                    )
-        
-        # Create user
+        # Create user; the image is uploaded in the background after save
         user = User.objects.create_user(password=password, **validated_data)
+        if image:
+            queue_image(user, image)
         return user
     
     def to_representation(self, instance):
@@ -224,19 +204,10 @@ class LoginSerializer(serializers.Serializer):
         password = data.get('password')
         request = self.context.get('request')
         
-        user = None
-        try:
-            user = User.objects.get(email=email_or_phone)
-        except User.DoesNotExist:
-            try:
-                user = User.objects.get(phone_number=email_or_phone)
-            except User.DoesNotExist:
-                raise serializers.ValidationError("Invalid credentials")
-        
-        # Authenticate with request context
+        # EmailOrPhoneBackend resolves the user and checks the password in one pass
         authenticated_user = authenticate(
             request=request,
-            username=user.email,
+            email_or_phone=email_or_phone,
             password=password
         )
         
@@ -244,4 +215,14 @@ class LoginSerializer(serializers.Serializer):
             raise serializers.ValidationError("Invalid credentials")
         
         data['user'] = authenticated_user
-        return data
\ No newline at end of file
+        return data
+
+
+class TokenRefreshSerializer(BaseTokenRefreshSerializer):
+    """Refuse to mint access tokens from a refresh token revoked at logout."""
+    
+    def validate(self, attrs):
+        refresh = RefreshToken(attrs['refresh'])
+        if is_revoked(refresh.get(api_settings.JTI_CLAIM)):
+            raise InvalidToken("Token has been revoked")
+        return super().validate(attrs)
@@ -0,0 +1,18 @@
+from functools import partial
+
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from . import authentication, identity
+from .cache import bump_user_version
+from .models import User
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_identity_cache(sender, instance, **kwargs):
+    identity.forget_user(instance.pk)
+    authentication.forget_principal(instance.pk)
+    # Other workers notice through the shared stamp, once the change is visible to them
+    transaction.on_commit(partial(bump_user_version, instance.pk))
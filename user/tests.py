@@ -1,10 +1,33 @@
-from django.test import TestCase
+from django.test import TestCase, override_settings
 from django.urls import reverse
+from django.conf import settings
+from django.core.cache import cache
 from rest_framework.test import APITestCase, APIClient
-from rest_framework import status
+from rest_framework import serializers, status
+from rest_framework_simplejwt.tokens import RefreshToken
 from django.contrib.auth import get_user_model
-from io import BytesIO
+from django.contrib.auth.hashers import make_password
+from django.db.models.functions import Lower
+from django.utils import timezone
+from datetime import timedelta
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.files.uploadhandler import MemoryFileUploadHandler
+from django.core.management import call_command
+from io import BytesIO, StringIO
+from unittest import mock
 from PIL import Image
+import os
+import shutil
+import struct
+import tempfile
+import time
+
+from trash2cash.testing import QueryBudgetMixin
+from . import identity, images, revocation, uploads
+from .identity import identity_conflicts
+from .authentication import clear_principals
+from .cache import bump_user_version, user_version
+from .models import RevokedToken
 
 User = get_user_model()
 
@@ -268,6 +291,106 @@ class LoginViewTest(APITestCase):
             print("Note: Login requires 'email_or_phone' field, not 'email'")
 
 
+class EmailOrPhoneBackendTest(APITestCase):
+    """Test the single-query login backend"""
+    
+    def setUp(self):
+        self.user = User.objects.create_user(
+            email='backenduser@example.com',
+            first_name='Backend',
+            last_name='User',
+            phone_number='+251911111137',
+            password='testpass123'
+        )
+    
+    def test_login_runs_one_query(self):
+        """Test that login finds the user and checks the password with one query"""
+        with self.assertNumQueries(1):
+            response = self.client.post(reverse('login'), {
+                'email_or_phone': '+251911111137',
+                'password': 'testpass123'
+            }, format='json')
+        
+        self.assertEqual(response.status_code, 200)
+        print("✓ Single-query login test passed")
+    
+    def test_unknown_user_rejected(self):
+        """Test login with an unknown email or phone"""
+        response = self.client.post(reverse('login'), {
+            'email_or_phone': 'nobody@example.com',
+            'password': 'testpass123'
+        }, format='json')
+        
+        self.assertEqual(response.status_code, 400)
+        print("✓ Unknown user login test passed")
+    
+    @override_settings(PASSWORD_HASHERS=[
+        'django.contrib.auth.hashers.PBKDF2PasswordHasher',
+        'django.contrib.auth.hashers.MD5PasswordHasher',
+    ])
+    def test_password_rehashed_on_login(self):
+        """Test that an outdated hash is upgraded on successful login"""
+        User.objects.filter(pk=self.user.pk).update(
+            password=make_password('testpass123', hasher='md5')
+        )
+        
+        response = self.client.post(reverse('login'), {
+            'email_or_phone': 'backenduser@example.com',
+            'password': 'testpass123'
+        }, format='json')
+        
+        self.assertEqual(response.status_code, 200)
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.password.startswith('pbkdf2_sha256$'))
+        print("✓ Password rehash test passed")
+
+
+@override_settings(REST_FRAMEWORK={
+    **settings.REST_FRAMEWORK,
+    'DEFAULT_THROTTLE_RATES': {'login_ip': '2/min', 'login_account': '4/min'},
+})
+class LoginThrottleTest(APITestCase):
+    """Test the per-IP and per-account login limits"""
+    
+    def setUp(self):
+        cache.clear()
+    
+    def tearDown(self):
+        cache.clear()
+    
+    def test_login_limited_per_ip(self):
+        """Test that repeated logins from one IP get 429"""
+        data = {'email_or_phone': 'nobody@example.com', 'password': 'wrongpassword'}
+        for _ in range(2):
+            self.assertEqual(self.client.post(reverse('login'), data, format='json').status_code, 400)
+        
+        response = self.client.post(reverse('login'), data, format='json', REMOTE_ADDR='127.0.0.1')
+        self.assertEqual(response.status_code, 429)
+        self.assertIn('Retry-After', response)
+        
+        response = self.client.post(reverse('login'), data, format='json', REMOTE_ADDR='10.0.0.2')
+        self.assertEqual(response.status_code, 400)
+        print("✓ Login throttle test passed")
+    
+    def test_login_limited_per_account(self):
+        """Test that attempts on one account from many IPs get 429"""
+        for i, identifier in enumerate(['target@example.com', ' Target@Example.com', 'TARGET@example.com ', 'target@example.com']):
+            data = {'email_or_phone': identifier, 'password': 'wrongpassword'}
+            response = self.client.post(reverse('login'), data, format='json', REMOTE_ADDR=f'10.0.1.{i}')
+            self.assertEqual(response.status_code, 400)
+        
+        data = {'email_or_phone': 'target@example.com', 'password': 'wrongpassword'}
+        response = self.client.post(reverse('login'), data, format='json', REMOTE_ADDR='10.0.1.9')
+        self.assertEqual(response.status_code, 429)
+        self.assertIn('Retry-After', response)
+        
+        # Other accounts are unaffected
+        data = {'email_or_phone': 'other@example.com', 'password': 'wrongpassword'}
+        response = self.client.post(reverse('login'), data, format='json', REMOTE_ADDR='10.0.1.9')
+        self.assertEqual(response.status_code, 400)
+        print("✓ Per-account login throttle test passed")
+
+
 class ProfileViewTest(APITestCase):
     """Test the profile endpoint"""
     
@@ -384,6 +507,411 @@ class LogoutViewTest(APITestCase):
             print(f"Note: Unauthenticated logout returned {response.status_code}")
 
 
+class TokenRevocationTest(APITestCase):
+    """Test that logout really invalidates tokens"""
+    
+    def setUp(self):
+        self.user = User.objects.create_user(
+            email='revokeuser@example.com',
+            first_name='Revoke',
+            last_name='User',
+            phone_number='+251911111138',
+            password='testpass123'
+        )
+        self.refresh = RefreshToken.for_user(self.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.refresh.access_token}')
+    
+    def test_logout_revokes_access_and_refresh(self):
+        """Test that both tokens stop working after logout"""
+        response = self.client.post(reverse('logout'), {'refresh': str(self.refresh)}, format='json')
+        self.assertEqual(response.status_code, 200)
+        
+        self.assertEqual(self.client.get(reverse('profile')).status_code, 401)
+        self.assertEqual(self.client.get(reverse('recent-history')).status_code, 401)
+        
+        self.client.credentials()
+        response = self.client.post(reverse('token_refresh'), {'refresh': str(self.refresh)}, format='json')
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(RevokedToken.objects.count(), 2)
+        print("✓ Token revocation test passed")
+    
+    def test_other_tokens_still_valid(self):
+        """Test that logging out one session leaves another working"""
+        other = RefreshToken.for_user(self.user).access_token
+        self.client.post(reverse('logout'))
+        
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {other}')
+        self.assertEqual(self.client.get(reverse('profile')).status_code, 200)
+        print("✓ Other session test passed")
+    
+    def test_revocations_from_other_workers_are_synced(self):
+        """Test that a revocation written by another process is picked up"""
+        access = self.refresh.access_token
+        RevokedToken.objects.create(
+            jti=access['jti'],
+            expires_at=timezone.now() + timedelta(minutes=5)
+        )
+        revocation._next_sync = 0
+        
+        self.assertTrue(revocation.is_revoked(access['jti']))
+        print("✓ Revocation sync test passed")
+    
+    def test_expired_revocations_pruned(self):
+        """Test that rows for already expired tokens are removed"""
+        RevokedToken.objects.create(jti='old', expires_at=timezone.now() - timedelta(minutes=1))
+        
+        self.client.post(reverse('logout'))
+        
+        self.assertFalse(RevokedToken.objects.filter(jti='old').exists())
+        self.assertFalse(revocation.is_revoked('old'))
+        print("✓ Revocation pruning test passed")
+
+
+class ProfileImageUploadTest(APITestCase):
+    """Test the background profile image upload pipeline"""
+    
+    def setUp(self):
+        self.staging_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.staging_dir, ignore_errors=True)
+        self.settings_override = override_settings(PROFILE_IMAGE_UPLOADS={
+            'BACKEND': 'user.uploads.LocalUploadBackend',
+            'WORKERS': 1,
+            'RETRIES': 1,
+            'STAGING_DIR': self.staging_dir,
+            'EAGER': True,
+        })
+        self.settings_override.enable()
+        self.addCleanup(self.settings_override.disable)
+        self.processed = []
+        uploads.image_processed.connect(self.on_processed)
+        self.addCleanup(uploads.image_processed.disconnect, self.on_processed)
+    
+    def on_processed(self, sender, **kwargs):
+        self.processed.append(kwargs)
+    
+    def make_image(self, name='avatar.png'):
+        buffer = BytesIO()
+        Image.new('RGB', (64, 64), color='green').save(buffer, format='PNG')
+        return SimpleUploadedFile(name, buffer.getvalue(), content_type='image/png')
+    
+    def staged_files(self):
+        return [name for name in os.listdir(self.staging_dir) if name != 'uploaded']
+    
+    def test_register_returns_pending_then_ready(self):
+        """Test that registration answers before the upload and the status endpoint reports the result"""
+        data = {
+            'email': 'imageuser@example.com',
+            'first_name': 'Image',
+            'last_name': 'User',
+            'phone_number': '+251911111190',
+            'password': 'testpass123',
+            'image': self.make_image(),
+        }
+        
+        with self.captureOnCommitCallbacks() as callbacks:
+            response = self.client.post(reverse('register'), data, format='multipart')
+        
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['user']['image_status'], 'pending')
+        self.assertIsNone(response.data['user']['image_url'])
+        self.assertEqual(len(self.staged_files()), 1)
+        
+        for callback in callbacks:
+            callback()
+        
+        user = User.objects.get(email='imageuser@example.com')
+        self.assertEqual(user.image_status, User.IMAGE_READY)
+        self.assertIn('trash2cash/profiles/', user.image.public_id)
+        self.assertEqual(self.staged_files(), [])
+        self.assertEqual(self.processed[0]['status'], User.IMAGE_READY)
+        
+        token = response.data['tokens']['access']
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+        status_response = self.client.get(reverse('profile-image-status'))
+        self.assertEqual(status_response.data['image_status'], 'ready')
+        self.assertEqual(status_response.data['image_url'], self.processed[0]['image_url'])
+        print("✓ Background registration upload test passed")
+    
+    def test_failed_upload_keeps_previous_image(self):
+        """Test that a failing backend marks the upload failed after retrying"""
+        user = User.objects.create_user(
+            email='imagefail@example.com', first_name='Image', last_name='Fail',
+            phone_number='+251911111191', password='testpass123'
+        )
+        self.client.force_authenticate(user=user)
+        
+        with mock.patch.object(uploads.LocalUploadBackend, 'upload', side_effect=OSError) as upload:
+            with self.assertLogs('user.uploads', 'WARNING'), self.captureOnCommitCallbacks(execute=True):
+                response = self.client.put(reverse('profile'), {'image': self.make_image()}, format='multipart')
+        
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['user']['image_status'], 'pending')
+        self.assertEqual(upload.call_count, 2)
+        user.refresh_from_db()
+        self.assertEqual(user.image_status, User.IMAGE_FAILED)
+        self.assertFalse(user.image)
+        self.assertIsNone(self.processed[0]['image_url'])
+        print("✓ Failed upload test passed")
+    
+    def test_upload_outside_transaction_stays_ready(self):
+        """Test that an upload finishing before the profile save isn't overwritten"""
+        user = User.objects.create_user(
+            email='imagerace@example.com', first_name='Image', last_name='Race',
+            phone_number='+251911111194', password='testpass123'
+        )
+        self.client.force_authenticate(user=user)
+        
+        # Without an atomic block on_commit runs the eager upload right away
+        with mock.patch.object(uploads.transaction, 'on_commit', lambda callback: callback()):
+            response = self.client.put(
+                reverse('profile'), {'first_name': 'Raced', 'image': self.make_image()}, format='multipart'
+            )
+        
+        self.assertEqual(response.status_code, 200)
+        user.refresh_from_db()
+        self.assertEqual(user.first_name, 'Raced')
+        self.assertEqual(user.image_status, User.IMAGE_READY)
+        self.assertIn('trash2cash/profiles/', user.image.public_id)
+        print("✓ Upload ordering test passed")
+    
+    def test_requeue_command_uploads_stranded_files(self):
+        """Test that requeue_profile_images finishes uploads a dead worker left behind"""
+        user = User.objects.create_user(
+            email='imagestranded@example.com', first_name='Image', last_name='Stranded',
+            phone_number='+251911111192', password='testpass123'
+        )
+        uploads.queue_image(user, self.make_image())  # on_commit never fires in this test
+        old = time.time() - 3600
+        for name in self.staged_files():
+            os.utime(os.path.join(self.staging_dir, name), (old, old))
+        
+        call_command('requeue_profile_images', stdout=StringIO())
+        
+        user.refresh_from_db()
+        self.assertEqual(user.image_status, User.IMAGE_READY)
+        self.assertEqual(self.staged_files(), [])
+        print("✓ Requeue profile images test passed")
+
+
+class ImageUploadValidationTest(APITestCase):
+    """Test header-only image validation while uploads stream in"""
+    
+    def setUp(self):
+        self.user = User.objects.create_user(
+            email='imagecheck@example.com', first_name='Image', last_name='Check',
+            phone_number='+251911111193', password='testpass123'
+        )
+        self.client.force_authenticate(user=self.user)
+    
+    def encode(self, image_format, size=(64, 32), **kwargs):
+        buffer = BytesIO()
+        Image.new('RGB', size, color='blue').save(buffer, format=image_format, **kwargs)
+        return buffer.getvalue()
+    
+    def png_header(self, width, height):
+        ihdr = struct.pack('>II', width, height) + bytes([8, 2, 0, 0, 0])
+        return b'\x89PNG\r\n\x1a\n' + struct.pack('>I', 13) + b'IHDR' + ihdr + b'\x00' * 4
+    
+    def test_sniff_reads_headers_only(self):
+        """Test dimensions come from the format header for each allowed format"""
+        exif = b'Exif\x00\x00' + b'\x00' * 40000  # pushes the frame header past the first chunk
+        jpeg = self.encode('JPEG', exif=exif)
+        self.assertEqual(images.sniff_image(jpeg), ('jpeg', 64, 32))
+        self.assertEqual(images.sniff_image(self.encode('PNG')), ('png', 64, 32))
+        self.assertEqual(images.sniff_image(self.encode('GIF')), ('gif', 64, 32))
+        
+        self.assertIsNone(images.sniff_image(jpeg[:30000]))
+        self.assertIsNone(images.sniff_image(b'\x89PN'))
+        with self.assertRaises(images.NotAnImage):
+            images.sniff_image(b'MZ' + b'\x00' * 100)
+        
+        # A bare header is enough to reject oversized dimensions; nothing is decoded
+        with self.assertRaises(serializers.ValidationError):
+            images.check_header(self.png_header(6000, 10))
+        print("✓ Image header sniffing test passed")
+    
+    def test_disallowed_type_rejected_while_streaming(self):
+        """Test that non-images and bad extensions are refused by the upload handler"""
+        fake = SimpleUploadedFile('avatar.png', b'MZ' + b'\x00' * 1000, content_type='image/png')
+        response = self.client.put(reverse('profile'), {'image': fake}, format='multipart')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('image', response.data)
+        
+        script = SimpleUploadedFile('avatar.exe', self.encode('PNG'), content_type='image/png')
+        response = self.client.put(reverse('profile'), {'image': script}, format='multipart')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('File type not allowed', str(response.data['image']))
+        
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.image_status, User.IMAGE_NONE)
+        print("✓ Streaming type validation test passed")
+    
+    @override_settings(MAX_UPLOAD_SIZE=100 * 1024)
+    def test_oversized_upload_stops_before_buffering(self):
+        """Test that uploads over MAX_UPLOAD_SIZE never reach the buffering handlers"""
+        received = []
+        original = MemoryFileUploadHandler.receive_data_chunk
+        
+        def counting(handler, raw_data, start):
+            received.append(len(raw_data))
+            return original(handler, raw_data, start)
+        
+        with mock.patch.object(MemoryFileUploadHandler, 'receive_data_chunk', counting):
+            # Content-Length alone gives it away: refused before reading the body
+            huge = SimpleUploadedFile('big.png', self.png_header(100, 100) + b'\x00' * 400 * 1024)
+            response = self.client.put(reverse('profile'), {'image': huge}, format='multipart')
+            self.assertEqual(response.status_code, 400)
+            self.assertEqual(received, [])
+            
+            # Just over the limit: refused at the chunk that crosses it
+            over = SimpleUploadedFile('over.png', self.png_header(100, 100) + b'\x00' * 110 * 1024)
+            response = self.client.put(reverse('profile'), {'image': over}, format='multipart')
+            self.assertEqual(response.status_code, 400)
+            self.assertIn('Image size must be less than', str(response.data['image']))
+            self.assertLessEqual(sum(received), 100 * 1024)
+        
+        data = {
+            'email': 'imagebig@example.com', 'first_name': 'Image', 'last_name': 'Big',
+            'phone_number': '+251911111194', 'password': 'testpass123',
+            'image': SimpleUploadedFile('big.png', self.png_header(100, 100) + b'\x00' * 400 * 1024),
+        }
+        response = self.client.post(reverse('register'), data, format='multipart')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['status'], 'error')
+        self.assertIn('image', response.data['errors'])
+        self.assertFalse(User.objects.filter(email='imagebig@example.com').exists())
+        print("✓ Oversized upload test passed")
+
+
+class IdentityConflictTest(APITestCase):
+    """Test the one-query email/phone availability check"""
+    
+    def setUp(self):
+        User.objects.create_user(
+            email='taken@example.com', first_name='Taken', last_name='User',
+            phone_number='+251911111195', password='testpass123'
+        )
+        User.objects.create_user(
+            email='other@example.com', first_name='Other', last_name='User',
+            phone_number='+251911111196', password='testpass123'
+        )
+    
+    def test_reports_which_field_collided(self):
+        """Test that conflicts name the colliding fields, ignoring email case"""
+        with self.assertNumQueries(1):
+            self.assertEqual(identity_conflicts('Taken@Example.com', '+251911111199'), {'email'})
+        self.assertEqual(identity_conflicts('free@example.com', '+251911111196'), {'phone_number'})
+        self.assertEqual(
+            identity_conflicts('TAKEN@example.com', '+251911111196'), {'email', 'phone_number'}
+        )
+        self.assertEqual(identity_conflicts('free@example.com', '+251911111199'), set())
+        print("✓ Identity conflict test passed")
+    
+    def test_lookup_uses_functional_index(self):
+        """Test that the case-insensitive email lookup is served by user_email_lower_idx"""
+        plan = User.objects.alias(email_lower=Lower('email')).filter(
+            email_lower='taken@example.com'
+        ).explain()
+        self.assertIn('user_email_lower_idx', plan)
+        print("✓ Email index plan test passed")
+    
+    def test_endpoints_check_both_fields_in_one_query(self):
+        """Test check-registration and register report both collisions from one lookup"""
+        data = {'email': 'TAKEN@example.com', 'phone_number': '+251911111196'}
+        with self.assertNumQueries(1):
+            response = self.client.post(reverse('check-registration'), data, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertTrue(response.data['suggest_login'])
+        self.assertEqual(set(response.data['errors']), {'email', 'phone_number'})
+        
+        data.update({'first_name': 'New', 'last_name': 'User', 'password': 'testpass123'})
+        response = self.client.post(reverse('register'), data, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(set(response.data['errors']), {'email', 'phone_number'})
+        self.assertEqual(User.objects.count(), 2)
+        print("✓ Registration availability test passed")
+
+
+@override_settings(TOKEN_REVOCATION={'SYNC_SECONDS': 3600})
+class AuthQueryBudgetTest(QueryBudgetMixin, APITestCase):
+    """Test that the auth endpoints stay within their query budgets"""
+    
+    def setUp(self):
+        cache.clear()
+        identity.clear_cache()
+        clear_principals()
+        # Sync the revocation list now so its query doesn't land in a budget
+        revocation._next_sync = 0
+        revocation.is_revoked('warm-up')
+        self.addCleanup(setattr, revocation, '_next_sync', 0)
+        self.user = User.objects.create_user(
+            email='budgetuser@example.com',
+            first_name='Budget',
+            last_name='User',
+            phone_number='+251911111140',
+            password='testpass123'
+        )
+        self.refresh = RefreshToken.for_user(self.user)
+        self.headers = {'HTTP_AUTHORIZATION': f'Bearer {self.refresh.access_token}'}
+    
+    def tearDown(self):
+        cache.clear()
+    
+    def test_anonymous_endpoint_budgets(self):
+        """Test the registration check, register, login and refresh budgets"""
+        with self.assertMaxQueries(1):
+            response = self.client.post(reverse('check-registration'), {
+                'email': 'budgetnew@example.com', 'phone_number': '+251911111141'
+            }, format='json')
+        self.assertEqual(response.status_code, 200)
+        
+        with self.assertMaxQueries(3):
+            response = self.client.post(reverse('register'), {
+                'email': 'budgetnew@example.com',
+                'first_name': 'New',
+                'last_name': 'User',
+                'phone_number': '+251911111141',
+                'password': 'testpass123',
+            }, format='json')
+        self.assertEqual(response.status_code, 201)
+        
+        with self.assertMaxQueries(1):
+            response = self.client.post(reverse('login'), {
+                'email_or_phone': 'budgetuser@example.com', 'password': 'testpass123'
+            }, format='json')
+        self.assertEqual(response.status_code, 200)
+        
+        with self.assertMaxQueries(0):
+            response = self.client.post(reverse('token_refresh'), {
+                'refresh': str(self.refresh)
+            }, format='json')
+        self.assertEqual(response.status_code, 200)
+        print("✓ Anonymous endpoint query budget test passed")
+    
+    def test_authenticated_endpoint_budgets(self):
+        """Test the profile, image status and logout budgets with a cold cache"""
+        with self.assertMaxQueries(1):
+            response = self.client.get(reverse('profile'), **self.headers)
+        self.assertEqual(response.status_code, 200)
+        
+        # Reloading the uncached balance columns, then the narrow UPDATE
+        with self.assertMaxQueries(2):
+            response = self.client.put(reverse('profile'), {'first_name': 'Changed'}, **self.headers)
+        self.assertEqual(response.status_code, 200)
+        
+        with self.assertMaxQueries(1):
+            response = self.client.get(reverse('profile-image-status'), **self.headers)
+        self.assertEqual(response.status_code, 200)
+        
+        # Each revoked token is a get_or_create plus a purge of expired rows
+        with self.assertMaxQueries(11):
+            response = self.client.post(reverse('logout'), {
+                'refresh': str(self.refresh)
+            }, format='json', **self.headers)
+        self.assertEqual(response.status_code, 200)
+        print("✓ Authenticated endpoint query budget test passed")
+
+
 class APIEndToEndTest(APITestCase):
     """End-to-end test of the complete flow"""
     
@@ -506,6 +1034,109 @@ class ValidationTest(APITestCase):
         print("✓ Invalid phone test completed")
 
 
+@override_settings(TOKEN_REVOCATION={'SYNC_SECONDS': 3600})
+class CachedJWTAuthenticationTest(APITestCase):
+    """Test that authenticated requests reuse the cached user"""
+    
+    def setUp(self):
+        clear_principals()
+        # Sync the revocation list now so no sync query lands inside assertNumQueries
+        revocation._next_sync = 0
+        revocation.is_revoked('warm-up')
+        self.addCleanup(setattr, revocation, '_next_sync', 0)
+        self.user = User.objects.create_user(
+            email='cacheduser@example.com',
+            first_name='Cached',
+            last_name='User',
+            phone_number='+251911111136',
+            password='testpass123'
+        )
+        access = RefreshToken.for_user(self.user).access_token
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {access}')
+    
+    def test_second_request_skips_user_query(self):
+        """Test that a cached principal only reloads the balance columns"""
+        self.assertEqual(self.client.get(reverse('profile')).status_code, 200)
+        
+        # Balances are never cached; they come back in one narrow query
+        with self.assertNumQueries(1) as queries:
+            response = self.client.get(reverse('profile'))
+        
+        self.assertNotIn('"email"', queries.captured_queries[0]['sql'])
+        self.assertEqual(response.data['email'], 'cacheduser@example.com')
+        print("✓ Cached principal test passed")
+    
+    def test_profile_update_keeps_fresh_balance(self):
+        """Test that a cached principal never reads or writes a stale balance"""
+        self.client.get(reverse('profile'))
+        User.objects.filter(pk=self.user.pk).update(total_points=90)
+        
+        response = self.client.get(reverse('profile'))
+        self.assertEqual(response.data['total_points'], 90)
+        
+        # A concurrent credit lands between the principal load and the save
+        User.objects.filter(pk=self.user.pk).update(total_points=120)
+        response = self.client.put(reverse('profile'), {'first_name': 'Renamed'}, format='multipart')
+        self.assertEqual(response.status_code, 200)
+        
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.first_name, 'Renamed')
+        self.assertEqual(self.user.total_points, 120)
+        print("✓ Fresh balance test passed")
+    
+    def test_deactivated_user_rejected(self):
+        """Test that saving the user drops the cached principal"""
+        self.client.get(reverse('profile'))
+        
+        self.user.is_active = False
+        self.user.save()
+        
+        response = self.client.get(reverse('profile'))
+        self.assertEqual(response.status_code, 401)
+        print("✓ Principal invalidation test passed")
+    
+    def test_deactivation_in_another_worker_rejected(self):
+        """Test that a cached principal is rechecked against the shared stamp"""
+        self.client.get(reverse('profile'))
+        
+        # Another worker deactivates the user: only the row and the shared stamp change here
+        User.objects.filter(pk=self.user.pk).update(is_active=False)
+        bump_user_version(self.user.pk)
+        
+        response = self.client.get(reverse('profile'))
+        self.assertEqual(response.status_code, 401)
+        
+        # Saving moves the stamp once the transaction commits
+        before = user_version(self.user.pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.save()
+        self.assertNotEqual(user_version(self.user.pk), before)
+        print("✓ Cross-worker principal invalidation test passed")
+    
+    def test_points_change_refreshes_principal(self):
+        """Test that a scan doesn't leave a stale balance in the cache"""
+        self.client.get(reverse('profile'))
+        
+        self.client.post(reverse('qr-scan'), {
+            'materialType': 'metal',
+            'pointsToAdd': 15,
+            'date': '2025-01-01T10:00:00Z'
+        }, format='json')
+        
+        response = self.client.get(reverse('profile'))
+        self.assertEqual(response.data['total_points'], 25)
+        print("✓ Principal balance refresh test passed")
+    
+    def test_token_user_mode_for_recent(self):
+        """Test that the recent poll only queries history"""
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('recent-history'))
+        
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['count'], 0)
+        print("✓ Token user mode test passed")
+
+
 # Run a quick test summary
 def print_test_summary():
     """Print a summary of what to test"""
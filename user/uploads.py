@@ -0,0 +1,175 @@
+# user/uploads.py - Background profile image uploads
+import logging
+import os
+import shutil
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from cloudinary import CloudinaryResource, uploader
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.dispatch import Signal
+from django.utils.module_loading import import_string
+
+from .models import User
+
+logger = logging.getLogger(__name__)
+
+# Sent when a queued upload finishes, with user_id, status and image_url
+# (None unless the status is User.IMAGE_READY)
+image_processed = Signal()
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _image_field():
+    return User._meta.get_field('image')
+
+
+class CloudinaryUploadBackend:
+    """Upload with the options CloudinaryField.pre_save would have used in the request."""
+
+    def upload(self, path, user):
+        field = _image_field()
+        options = {'type': field.type, 'resource_type': field.resource_type}
+        options.update({
+            key: value(user) if callable(value) else value
+            for key, value in field.options.items()
+        })
+        return uploader.upload_resource(path, **options).get_prep_value()
+
+
+class LocalUploadBackend:
+    """
+    Filesystem stand-in for Cloudinary, for tests and offline development.
+
+    Copies the image under ``root`` (STAGING_DIR/uploaded by default) and
+    returns a Cloudinary-style value, so ``user.image.url`` is built the same
+    way as in production.
+    """
+
+    def __init__(self, root=None):
+        self.root = root or os.path.join(settings.PROFILE_IMAGE_UPLOADS['STAGING_DIR'], 'uploaded')
+
+    def upload(self, path, user):
+        folder = _image_field().options.get('folder', '')
+        name, ext = os.path.splitext(os.path.basename(path))
+        public_id = f"{folder}/{name}" if folder else name
+
+        target = os.path.join(self.root, public_id + ext)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        shutil.copyfile(path, target)
+
+        return CloudinaryResource(
+            public_id=public_id, format=ext.lstrip('.') or None,
+            version='1', type='upload', resource_type='image',
+        ).get_prep_value()
+
+
+def get_backend():
+    return import_string(settings.PROFILE_IMAGE_UPLOADS['BACKEND'])()
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.PROFILE_IMAGE_UPLOADS['WORKERS'],
+                thread_name_prefix='profile-image',
+            )
+        return _executor
+
+
+def stage(user_id, upload):
+    """Copy an uploaded file to STAGING_DIR; the request's temp file is gone once it returns."""
+    staging_dir = settings.PROFILE_IMAGE_UPLOADS['STAGING_DIR']
+    os.makedirs(staging_dir, exist_ok=True)
+    ext = os.path.splitext(upload.name or '')[1].lower()
+    path = os.path.join(staging_dir, f"{user_id}-{uuid.uuid4().hex}{ext}")
+    with open(path, 'wb') as staged:
+        for chunk in upload.chunks():
+            staged.write(chunk)
+    return path
+
+
+def staged_user_id(path):
+    """User id a staged file belongs to, or None for foreign files."""
+    prefix = os.path.basename(path).split('-', 1)[0]
+    return int(prefix) if prefix.isdigit() else None
+
+
+def queue_image(user, upload):
+    """
+    Stage ``upload`` for ``user`` and mark the image pending.
+
+    The pending status is written here, before the upload is scheduled,
+    and callers must leave image and image_status out of their own save:
+    outside an atomic block on_commit runs at once, so the upload can
+    finish before the caller saves. Inside one the upload starts once the
+    transaction commits, so a rolled back registration never uploads.
+    The current image stays in place until the new one is ready.
+    """
+    path = stage(user.pk, upload)
+    user.image_status = User.IMAGE_PENDING
+    User.objects.filter(pk=user.pk).update(image_status=User.IMAGE_PENDING)
+    transaction.on_commit(lambda: submit(user.pk, path))
+    return path
+
+
+def submit(user_id, path):
+    if settings.PROFILE_IMAGE_UPLOADS['EAGER']:
+        process_image(user_id, path)
+    else:
+        _get_executor().submit(_run_in_worker, user_id, path)
+
+
+def _run_in_worker(user_id, path):
+    # Worker threads own their connections, so manage them like a request would
+    close_old_connections()
+    try:
+        process_image(user_id, path)
+    except Exception:
+        logger.exception("Profile image upload for user %s crashed", user_id)
+    finally:
+        close_old_connections()
+
+
+def process_image(user_id, path):
+    """Upload a staged file, retrying up to RETRIES times, and record the outcome."""
+    try:
+        user = User.objects.filter(pk=user_id).first()
+        if user is None:
+            return None
+
+        value = None
+        backend = get_backend()
+        for attempt in range(settings.PROFILE_IMAGE_UPLOADS['RETRIES'] + 1):
+            try:
+                value = backend.upload(path, user)
+                break
+            except Exception:
+                logger.warning(
+                    "Profile image upload for user %s failed (attempt %s)",
+                    user_id, attempt + 1, exc_info=True,
+                )
+
+        if value is None:
+            user.image_status = User.IMAGE_FAILED
+            user.save(update_fields=['image_status'])
+            image_url = None
+        else:
+            user.image = value
+            user.image_status = User.IMAGE_READY
+            user.save(update_fields=['image', 'image_status'])
+            image_url = _image_field().to_python(value).url
+
+        image_processed.send(
+            sender=User, user_id=user_id, status=user.image_status, image_url=image_url
+        )
+        return user.image_status
+    finally:
+        if os.path.exists(path):
+            os.remove(path)
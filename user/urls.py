@@ -1,5 +1,5 @@
 from django.urls import path
-from .views import RegisterAPIView, LoginAPIView, LogoutAPIView,ProfileAPIView,CheckRegistrationView
+from .views import RegisterAPIView, LoginAPIView, LogoutAPIView,ProfileAPIView,CheckRegistrationView,ProfileImageStatusAPIView
 
 urlpatterns = [
     path('check-registration/', CheckRegistrationView.as_view(), name='check-registration'),
@@ -7,4 +7,5 @@ urlpatterns = [
     path('login/', LoginAPIView.as_view(), name='login'),
     path('logout/', LogoutAPIView.as_view(), name='logout'),
     path('profile/', ProfileAPIView.as_view(), name='profile'),
+    path('profile/image/', ProfileImageStatusAPIView.as_view(), name='profile-image-status'),
 ]
\ No newline at end of file
@@ -1,10 +1,23 @@
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status, permissions
+from rest_framework_simplejwt.exceptions import TokenError
 from rest_framework_simplejwt.tokens import RefreshToken
-from .serializers import RegisterSerializer, LoginSerializer, ProfileSerializer, CheckRegistrationSerializer
+from rest_framework_simplejwt.views import TokenRefreshView
+from .serializers import (
+    RegisterSerializer,
+    LoginSerializer,
+    ProfileSerializer,
+    CheckRegistrationSerializer,
+    TokenRefreshSerializer,
+)
+from .authentication import TokenUserAuthentication
+from .images import ImageRejected
+from .models import User
+from .revocation import revoke_token
 from rest_framework.parsers import MultiPartParser, FormParser
 from django.core.exceptions import ValidationError
+from trash2cash.throttling import IdentifierTokenBucketThrottle, IPTokenBucketThrottle
 
 
 class CheckRegistrationView(APIView):
@@ -52,7 +65,17 @@ class RegisterAPIView(APIView):
     permission_classes = [permissions.AllowAny]
     
     def post(self, request):
-        serializer = RegisterSerializer(data=request.data, context={'request': request})
+        try:
+            data = request.data
+        except ImageRejected as e:
+            # Raised by ImageUploadHandler while the body was still streaming in
+            return Response({
+                "status": "error",
+                "message": "Registration failed",
+                "errors": e.detail
+            }, status=status.HTTP_400_BAD_REQUEST)
+        
+        serializer = RegisterSerializer(data=data, context={'request': request})
         
         if serializer.is_valid():
             try:
@@ -91,6 +114,9 @@ class RegisterAPIView(APIView):
 
 class LoginAPIView(APIView):
     permission_classes = [permissions.AllowAny]
+    throttle_classes = [IPTokenBucketThrottle, IdentifierTokenBucketThrottle]
+    throttle_scope = 'login'
+    throttle_identifier_field = 'email_or_phone'
     
     def post(self, request):
         serializer = LoginSerializer(data=request.data, context={'request': request})
@@ -116,6 +142,20 @@ class LogoutAPIView(APIView):
     permission_classes = [permissions.IsAuthenticated]
     
     def post(self, request):
+        # Revoke the access token used for this request and, when sent, the refresh token
+        if request.auth is not None:
+            revoke_token(request.auth)
+        
+        refresh = request.data.get('refresh')
+        if refresh:
+            try:
+                revoke_token(RefreshToken(refresh))
+            except TokenError:
+                return Response(
+                    {"message": "Invalid refresh token"},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+        
         return Response({"message": "Logout successful"})
 
 
@@ -140,4 +180,26 @@ class ProfileAPIView(APIView):
                 "message": "Profile updated successfully",
                 "user": serializer.data
             })
-        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
\ No newline at end of file
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+
+class ProfileImageStatusAPIView(APIView):
+    """Poll target for background image uploads: {image_status, image_url}."""
+    # Read straight from the database; another worker may have finished the upload
+    authentication_classes = [TokenUserAuthentication]
+    permission_classes = [permissions.IsAuthenticated]
+    
+    def get(self, request):
+        row = User.objects.filter(pk=request.user.id).values('image', 'image_status').first()
+        if row is None:
+            return Response({"detail": "User not found"}, status=status.HTTP_404_NOT_FOUND)
+        
+        image = row['image']
+        return Response({
+            "image_status": row['image_status'],
+            "image_url": image.url if image else None,
+        })
+
+
+class TokenRefreshAPIView(TokenRefreshView):
+    serializer_class = TokenRefreshSerializer